@@ -0,0 +1,214 @@
+"""
+Compact artifact format for forest-based `ForecasterAutoreg` models.
+
+`save_forecaster` pickles the whole forecaster, so every worker pays the
+unpickling time and keeps its own copy of the trees. An artifact is a
+directory with:
+
+- `metadata.json`: what prediction needs from the forecaster (lags, window
+  size, exogenous columns, frequency) plus the format version.
+- One uncompressed `.npy` file per node array of the flattened forest
+  (see `forest.FlatForest`).
+- `in_sample_residuals.npy`, if the forecaster has them, for bootstrapped
+  prediction intervals.
+
+`load_artifact` opens the arrays with `mmap_mode='r'`, so loading is almost
+free and several uvicorn workers on the same host share the same pages.
+
+    python artifact.py forecaster.py forecaster_artifact
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+from typing import List, Optional
+
+import numpy as np
+
+from forest import FlatForest, can_flatten
+
+FORMAT_VERSION = 1
+METADATA_FILE = 'metadata.json'
+ARRAYS = ('feature', 'threshold', 'left', 'right', 'value', 'roots', 'children')
+RESIDUALS_FILE = 'in_sample_residuals.npy'
+
+
+def is_artifact(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, METADATA_FILE))
+
+
+class ForecasterArtifact:
+    """
+    Forecaster loaded from an artifact. It has the attributes of
+    `ForecasterAutoreg` used by `engine.predict_windows`, and its regressor
+    is a `FlatForest`.
+
+    Parameters
+    ----------
+    regressor : FlatForest
+        Flattened forest.
+
+    lags : list of int
+        Lags used as predictors.
+
+    window_size : int
+        Number of past values needed to build the lags.
+
+    index_freq : str
+        Frequency of the series.
+
+    exog_col_names : list of str, default `None`
+        Exogenous columns, in training order.
+
+    metadata : dict, default `None`
+        Content of `metadata.json`.
+
+    in_sample_residuals : numpy ndarray, default `None`
+        Training residuals, used to bootstrap prediction intervals.
+
+    """
+
+    transformer_y = None
+    transformer_exog = None
+
+    def __init__(
+        self,
+        regressor: FlatForest,
+        lags: List[int],
+        window_size: int,
+        index_freq: str,
+        exog_col_names: Optional[List[str]]=None,
+        metadata: Optional[dict]=None,
+        in_sample_residuals: Optional[np.ndarray]=None
+    ) -> None:
+
+        self.regressor           = regressor
+        self.lags                = np.asarray(lags, dtype=int)
+        self.window_size         = window_size
+        self.index_freq          = index_freq
+        self.exog_col_names      = exog_col_names
+        self.included_exog       = bool(exog_col_names)
+        self.metadata            = metadata or {}
+        self.in_sample_residuals = in_sample_residuals
+
+
+    def __repr__(self) -> str:
+        return (
+            f"ForecasterArtifact(lags={self.lags.tolist()}, window_size={self.window_size}, "
+            f"index_freq={self.index_freq!r}, exog_col_names={self.exog_col_names}, "
+            f"n_trees={self.regressor.n_trees}, n_nodes={self.regressor.n_nodes})"
+        )
+
+
+def export_forecaster(forecaster, path: str) -> str:
+    """
+    Write `forecaster` as an artifact directory at `path`. The directory is
+    written next to `path` and renamed at the end, so a registry watching
+    `path` never sees a half-written artifact.
+
+    Parameters
+    ----------
+    forecaster : ForecasterAutoreg
+        Fitted forecaster whose regressor is a tree or forest regressor and
+        without transformers.
+
+    path : str
+        Output directory. Replaced if it exists.
+
+    Returns
+    -------
+    path : str
+
+    """
+    if not can_flatten(forecaster.regressor):
+        raise TypeError(
+            (f"Only tree and forest regressors can be exported. "
+             f"Got {type(forecaster.regressor)}.")
+        )
+    if forecaster.transformer_y is not None or forecaster.transformer_exog is not None:
+        raise ValueError("Forecasters with transformers cannot be exported.")
+
+    flat = FlatForest.from_regressor(forecaster.regressor)
+    metadata = {
+        "format_version": FORMAT_VERSION,
+        "forecaster": type(forecaster).__name__,
+        "regressor": type(forecaster.regressor).__name__,
+        "lags": [int(lag) for lag in forecaster.lags],
+        "window_size": int(forecaster.window_size),
+        "index_freq": forecaster.index_freq,
+        "exog_col_names": forecaster.exog_col_names,
+        "n_features": int(forecaster.regressor.n_features_in_),
+        "n_trees": flat.n_trees,
+        "n_nodes": flat.n_nodes,
+        "max_depth": int(flat.max_depth),
+        "training_range": [str(x) for x in forecaster.training_range],
+    }
+
+    path = os.path.abspath(path)
+    tmp = tempfile.mkdtemp(prefix='.artifact-', dir=os.path.dirname(path))
+    for name in ARRAYS:
+        np.save(os.path.join(tmp, f'{name}.npy'), np.ascontiguousarray(getattr(flat, name)))
+    residuals = getattr(forecaster, 'in_sample_residuals', None)
+    if residuals is not None:
+        np.save(os.path.join(tmp, RESIDUALS_FILE), np.asarray(residuals, dtype=float))
+    # Metadata is written last: a directory with `metadata.json` is complete
+    with open(os.path.join(tmp, METADATA_FILE), 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+    if os.path.exists(path):
+        old = tempfile.mkdtemp(prefix='.artifact-old-', dir=os.path.dirname(path))
+        os.rename(path, os.path.join(old, 'artifact'))
+        os.rename(tmp, path)
+        shutil.rmtree(old)
+    else:
+        os.rename(tmp, path)
+
+    return path
+
+
+def load_artifact(path: str, mmap: bool=True) -> ForecasterArtifact:
+    """
+    Load an artifact written by `export_forecaster`.
+
+    Parameters
+    ----------
+    path : str
+        Artifact directory.
+
+    mmap : bool, default `True`
+        Memory-map the node arrays (read only) instead of reading them.
+
+    """
+    with open(os.path.join(path, METADATA_FILE)) as f:
+        metadata = json.load(f)
+    if metadata.get('format_version') != FORMAT_VERSION:
+        raise ValueError(
+            (f"Unsupported artifact format version {metadata.get('format_version')}. "
+             f"Expected {FORMAT_VERSION}.")
+        )
+
+    mmap_mode = 'r' if mmap else None
+    arrays = {
+        name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode)
+        for name in ARRAYS
+    }
+    regressor = FlatForest(max_depth=metadata['max_depth'], **arrays)
+    residuals_path = os.path.join(path, RESIDUALS_FILE)
+    residuals = np.load(residuals_path) if os.path.isfile(residuals_path) else None
+
+    return ForecasterArtifact(
+               regressor           = regressor,
+               lags                = metadata['lags'],
+               window_size         = metadata['window_size'],
+               index_freq          = metadata['index_freq'],
+               exog_col_names      = metadata['exog_col_names'],
+               metadata            = metadata,
+               in_sample_residuals = residuals
+           )
+
+
+if __name__ == '__main__':
+    from skforecast.utils import load_forecaster
+    source, target = sys.argv[1], sys.argv[2]
+    print(export_forecaster(load_forecaster(source, verbose=False), target))
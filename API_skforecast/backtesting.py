@@ -0,0 +1,653 @@
+"""
+Parallel backtesting with refit for `ForecasterAutoreg`.
+
+`skforecast.model_selection.backtesting_forecaster(..., refit=True)` fits
+and predicts the folds one after another. The folds are independent, so
+`backtesting_forecaster_parallel` runs them in a process pool:
+
+- The values of every series and of their exogenous variables are copied
+  once into a `multiprocessing.shared_memory` block. Workers attach to it
+  when they start and get the forecaster once, so a task is only a few
+  integers (series, fold and its bounds).
+- Folds are submitted longest training window first, so the most expensive
+  fits do not end up alone at the end of the run.
+- Every fold is fitted and predicted with the same `fit` / `predict` calls
+  as skforecast, so metrics and predictions are identical to the serial run.
+
+Several series can be backtested in the same pool with
+`backtesting_many_parallel`.
+
+With a growing training window (`fixed_train_size=False`) consecutive folds
+differ by only `steps` observations. `backtesting_forecaster_warm_start`
+updates the model of the previous fold instead of fitting a new one:
+
+- `Ridge`: the Gram matrix and `X.T @ y` are updated with the new rows and
+  the normal equations solved again (same model as a refit).
+- Forests: `n_trees_per_fold` trees are trained on the new training set
+  with `warm_start` and as many of the oldest trees are dropped.
+- Regressors with `partial_fit` (e.g. `SGDRegressor`): one `partial_fit`
+  on the new rows.
+
+Other regressors are refitted on every fold, in parallel.
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from copy import deepcopy
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from engine import RecursivePredictor
+from features import train_matrices
+
+
+class Fold(NamedTuple):
+    """
+    Positions of one backtesting fold in its series.
+    """
+    series: int
+    fold: int
+    train_start: int
+    train_end: int
+    steps: int
+
+
+def make_folds(
+    n_obs: int,
+    initial_train_size: int,
+    steps: int,
+    fixed_train_size: bool=True,
+    series: int=0
+) -> List[Fold]:
+    """
+    Folds of `backtesting_forecaster` with `refit=True`. The last fold
+    predicts the remainder when `n_obs - initial_train_size` is not a
+    multiple of `steps`.
+    """
+    if initial_train_size >= n_obs:
+        raise ValueError(
+            (f"`initial_train_size` ({initial_train_size}) must be smaller than "
+             f"the length of the series ({n_obs}).")
+        )
+
+    n_folds = int(np.ceil((n_obs - initial_train_size) / steps))
+    folds = []
+    for i in range(n_folds):
+        train_end = initial_train_size + i * steps
+        folds.append(Fold(
+            series      = series,
+            fold        = i,
+            train_start = i * steps if fixed_train_size else 0,
+            train_end   = train_end,
+            steps       = min(steps, n_obs - train_end)
+        ))
+
+    return folds
+
+
+def _index_spec(index: pd.Index) -> Tuple:
+    """
+    Compact description of an index that workers can rebuild.
+    """
+    if isinstance(index, pd.DatetimeIndex) and index.freq is not None:
+        return ('datetime', index[0], index.freq, index.name)
+    if isinstance(index, pd.RangeIndex):
+        return ('range', index.start, index.step, index.name)
+
+    raise TypeError(
+        "`y` must have a pandas DatetimeIndex with frequency or a RangeIndex."
+    )
+
+
+def _build_index(spec: Tuple, length: int) -> pd.Index:
+
+    kind, start, step, name = spec
+    if kind == 'datetime':
+        return pd.date_range(start=start, periods=length, freq=step, name=name)
+
+    return pd.RangeIndex(start=start, stop=start + length * step, step=step, name=name)
+
+
+class _SharedData:
+    """
+    Values of all the series (and exog) packed in one shared memory block.
+    """
+
+    def __init__(
+        self,
+        series: List[pd.Series],
+        exog: List[Optional[pd.DataFrame]]
+    ) -> None:
+
+        self.lengths = [len(y) for y in series]
+        self.offsets = np.concatenate(([0], np.cumsum(self.lengths)))[:-1].tolist()
+        self.index_specs = [_index_spec(y.index) for y in series]
+        self.names = [y.name for y in series]
+
+        exog_columns = [None if x is None else list(x.columns) for x in exog]
+        self.exog_columns = exog_columns
+        n_exog = max([len(c) for c in exog_columns if c is not None], default=0)
+        total = sum(self.lengths)
+
+        self.shape = (total, 1 + n_exog)
+        nbytes = max(int(np.prod(self.shape)) * 8, 1)
+        self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        data = np.ndarray(self.shape, dtype=np.float64, buffer=self.shm.buf)
+        data[:] = np.nan
+        for y, x, offset in zip(series, exog, self.offsets):
+            rows = slice(offset, offset + len(y))
+            data[rows, 0] = y.to_numpy(dtype=float)
+            if x is not None:
+                if len(x) != len(y) or not x.index.equals(y.index):
+                    raise ValueError("`exog` must have the same index as `y`.")
+                data[rows, 1:1 + x.shape[1]] = x.to_numpy(dtype=float)
+
+
+    def layout(self) -> dict:
+        return {
+            "name": self.shm.name,
+            "shape": self.shape,
+            "lengths": self.lengths,
+            "offsets": self.offsets,
+            "index_specs": self.index_specs,
+            "names": self.names,
+            "exog_columns": self.exog_columns,
+        }
+
+
+    def close(self) -> None:
+        self.shm.close()
+        self.shm.unlink()
+
+
+# State of a worker process, set once by `_init_worker`
+_worker = {}
+
+
+def _init_worker(layout: dict, forecaster) -> None:
+
+    # Workers share the resource tracker of the parent, which unlinks the block
+    shm = shared_memory.SharedMemory(name=layout["name"])
+    data = np.ndarray(layout["shape"], dtype=np.float64, buffer=shm.buf)
+
+    series = []
+    exog = []
+    for i, (length, offset) in enumerate(zip(layout["lengths"], layout["offsets"])):
+        index = _build_index(layout["index_specs"][i], length)
+        rows = data[offset:offset + length]
+        series.append(pd.Series(rows[:, 0], index=index, name=layout["names"][i]))
+        columns = layout["exog_columns"][i]
+        exog.append(
+            None if columns is None
+            else pd.DataFrame(rows[:, 1:1 + len(columns)], index=index, columns=columns)
+        )
+
+    _worker.update(shm=shm, series=series, exog=exog, forecaster=forecaster)
+
+
+def _fit_predict(forecaster, y: pd.Series, exog: Optional[pd.DataFrame], fold: Fold) -> np.ndarray:
+    """
+    Fit and predict one fold, as `_backtesting_forecaster_refit` does.
+    """
+    exog_train = None if exog is None else exog.iloc[fold.train_start:fold.train_end, ]
+    exog_next = None if exog is None else exog.iloc[fold.train_end:fold.train_end + fold.steps, ]
+    forecaster.fit(y=y.iloc[fold.train_start:fold.train_end, ], exog=exog_train)
+    pred = forecaster.predict(steps=fold.steps, exog=exog_next)
+
+    return pred.to_numpy()
+
+
+def _run_fold(fold: Fold) -> Tuple[Fold, np.ndarray, float]:
+
+    start = time.perf_counter()
+    values = _fit_predict(
+                 _worker["forecaster"], _worker["series"][fold.series],
+                 _worker["exog"][fold.series], fold
+             )
+
+    return fold, values, time.perf_counter() - start
+
+
+def _run_folds(
+    forecaster,
+    series: List[pd.Series],
+    exog: List[Optional[pd.DataFrame]],
+    folds: List[Fold],
+    n_jobs: Optional[int],
+    mp_context: str
+) -> Dict[Tuple[int, int], Tuple[np.ndarray, float]]:
+    """
+    Predictions and duration of every fold, by `(series, fold)`. Folds run
+    in a process pool, longest training window first, or in this process
+    if `n_jobs` is 1.
+    """
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(folds))
+    results = {}
+    if n_jobs == 1:
+        forecaster = deepcopy(forecaster)
+        for fold in folds:
+            start = time.perf_counter()
+            values = _fit_predict(forecaster, series[fold.series], exog[fold.series], fold)
+            results[(fold.series, fold.fold)] = (values, time.perf_counter() - start)
+        return results
+
+    folds = sorted(folds, key=lambda f: f.train_end - f.train_start, reverse=True)
+    shared = _SharedData(series, exog)
+    try:
+        with ProcessPoolExecutor(
+            max_workers = n_jobs,
+            mp_context  = multiprocessing.get_context(mp_context),
+            initializer = _init_worker,
+            initargs    = (shared.layout(), deepcopy(forecaster))
+        ) as executor:
+            futures = [executor.submit(_run_fold, fold) for fold in folds]
+            for future in futures:
+                fold, values, seconds = future.result()
+                results[(fold.series, fold.fold)] = (values, seconds)
+    finally:
+        shared.close()
+
+    return results
+
+
+def metric_function(metric: Union[str, Callable]) -> Callable:
+    """
+    Function of a metric given by name, as in `backtesting_forecaster`.
+    """
+    if isinstance(metric, str):
+        from skforecast.model_selection.model_selection import _get_metric
+        return _get_metric(metric=metric)
+
+    return metric
+
+
+def _backtest_result(
+    y: pd.Series,
+    initial_train_size: int,
+    predictions: List[np.ndarray],
+    metric: Union[str, Callable, List[Union[str, Callable]]]
+) -> Tuple[Any, pd.DataFrame]:
+    """
+    Metric(s) and predictions DataFrame of the folds of a backtest, as
+    `backtesting_forecaster` returns them.
+    """
+    # `forecaster.predict` returns unnamed indexes
+    index = y.index[initial_train_size:].rename(None)
+    backtest_predictions = pd.DataFrame({'pred': np.concatenate(predictions)}, index=index)
+    y_true = y.iloc[initial_train_size:initial_train_size + len(backtest_predictions)]
+    metrics = metric if isinstance(metric, list) else [metric]
+    values = [
+        metric_function(m)(y_true=y_true, y_pred=backtest_predictions['pred'])
+        for m in metrics
+    ]
+
+    return values if isinstance(metric, list) else values[0], backtest_predictions
+
+
+def backtesting_many_parallel(
+    forecaster,
+    series: Dict[Any, pd.Series],
+    initial_train_size: int,
+    steps: int,
+    metric: Union[str, Callable, List[Union[str, Callable]]],
+    exog: Optional[Dict[Any, pd.DataFrame]]=None,
+    fixed_train_size: bool=True,
+    n_jobs: Optional[int]=None,
+    mp_context: str='spawn'
+) -> Dict[Any, Tuple[Any, pd.DataFrame]]:
+    """
+    Backtest with refit every series of `series`, running all their folds in
+    the same process pool.
+
+    Parameters
+    ----------
+    forecaster : ForecasterAutoreg
+        Forecaster used as template. It is not modified.
+
+    series : dict
+        Training series by name, with a DatetimeIndex with frequency or a
+        RangeIndex.
+
+    initial_train_size : int
+        Observations of the first training set.
+
+    steps : int
+        Steps predicted per fold.
+
+    metric : str, callable, list
+        Metric, or metrics, as in `backtesting_forecaster`.
+
+    exog : dict, default `None`
+        Exogenous variables of each series (numeric columns), with the same
+        index as the series.
+
+    fixed_train_size : bool, default `True`
+        Whether the training window moves instead of growing, as in
+        `backtesting_forecaster`.
+
+    n_jobs : int, default `None`
+        Worker processes. `None` uses `os.cpu_count()`; `1` runs the folds
+        in this process.
+
+    mp_context : str, default `'spawn'`
+        Start method of the workers.
+
+    Returns
+    -------
+    results : dict
+        `(metric_value, predictions)` of every series, with the same values
+        `backtesting_forecaster(..., refit=True)` returns.
+
+    """
+    names = list(series)
+    exog = exog or {}
+    all_folds = []
+    for i, name in enumerate(names):
+        all_folds.extend(
+            make_folds(len(series[name]), initial_train_size, steps, fixed_train_size, series=i)
+        )
+    predictions = _run_folds(
+                      forecaster = forecaster,
+                      series     = [series[name] for name in names],
+                      exog       = [exog.get(name) for name in names],
+                      folds      = all_folds,
+                      n_jobs     = n_jobs,
+                      mp_context = mp_context
+                  )
+
+    results = {}
+    for i, name in enumerate(names):
+        n_folds = sum(1 for fold in all_folds if fold.series == i)
+        results[name] = _backtest_result(
+                            y                  = series[name],
+                            initial_train_size = initial_train_size,
+                            predictions        = [predictions[(i, k)][0] for k in range(n_folds)],
+                            metric             = metric
+                        )
+
+    return results
+
+
+def backtesting_forecaster_parallel(
+    forecaster,
+    y: pd.Series,
+    initial_train_size: int,
+    steps: int,
+    metric: Union[str, Callable, List[Union[str, Callable]]],
+    exog: Optional[pd.DataFrame]=None,
+    fixed_train_size: bool=True,
+    n_jobs: Optional[int]=None,
+    mp_context: str='spawn'
+) -> Tuple[Any, pd.DataFrame]:
+    """
+    `backtesting_forecaster(..., refit=True)` of one series with the folds
+    run in parallel. See `backtesting_many_parallel`.
+
+    Returns
+    -------
+    metric_value : float, list
+        Value(s) of the metric(s).
+
+    backtest_predictions : pandas DataFrame
+        Predictions in column `pred`.
+
+    """
+    return backtesting_many_parallel(
+               forecaster         = forecaster,
+               series             = {y.name: y},
+               initial_train_size = initial_train_size,
+               steps              = steps,
+               metric             = metric,
+               exog               = None if exog is None else {y.name: exog},
+               fixed_train_size   = fixed_train_size,
+               n_jobs             = n_jobs,
+               mp_context         = mp_context
+           )[y.name]
+
+
+class _RidgeUpdater:
+    """
+    `Ridge` refitted from running sums of the Gram matrix and `X.T @ y`,
+    taken around the means of the first training set for stability.
+    """
+
+    def __init__(self, regressor) -> None:
+        from sklearn.base import clone
+        self.regressor = clone(regressor)
+
+
+    def fit(self, X: np.ndarray, y: np.ndarray) -> None:
+
+        self.regressor.fit(X, y)
+        if self.regressor.fit_intercept:
+            self._x_shift = X.mean(axis=0)
+            self._y_shift = y.mean()
+        else:
+            self._x_shift = np.zeros(X.shape[1])
+            self._y_shift = 0.0
+        self._n = 0
+        self._gram = np.zeros((X.shape[1], X.shape[1]))
+        self._xy = np.zeros(X.shape[1])
+        self._x_sum = np.zeros(X.shape[1])
+        self._y_sum = 0.0
+        self._add(X, y)
+
+
+    def _add(self, X: np.ndarray, y: np.ndarray) -> None:
+
+        Xs = X - self._x_shift
+        ys = y - self._y_shift
+        self._n += len(ys)
+        self._gram += Xs.T @ Xs
+        self._xy += Xs.T @ ys
+        self._x_sum += Xs.sum(axis=0)
+        self._y_sum += ys.sum()
+
+
+    def update(self, X_new: np.ndarray, y_new: np.ndarray, X: np.ndarray, y: np.ndarray) -> None:
+        from scipy import linalg
+
+        self._add(X_new, y_new)
+        gram = self._gram.copy()
+        xy = self._xy.copy()
+        x_mean = np.zeros(len(xy))
+        y_mean = 0.0
+        if self.regressor.fit_intercept:
+            # Center on the means of the whole training set
+            x_mean = self._x_sum / self._n
+            y_mean = self._y_sum / self._n
+            gram -= self._n * np.outer(x_mean, x_mean)
+            xy -= self._n * x_mean * y_mean
+        gram[np.diag_indices_from(gram)] += self.regressor.alpha
+        coef = linalg.solve(gram, xy, assume_a='pos')
+
+        self.regressor.coef_ = coef
+        if self.regressor.fit_intercept:
+            self.regressor.intercept_ = (y_mean + self._y_shift) - (x_mean + self._x_shift) @ coef
+
+
+class _PartialFitUpdater:
+    """
+    Regressors with `partial_fit`, updated with the new rows only.
+    """
+
+    def __init__(self, regressor) -> None:
+        from sklearn.base import clone
+        self.regressor = clone(regressor)
+
+
+    def fit(self, X: np.ndarray, y: np.ndarray) -> None:
+        self.regressor.fit(X, y)
+
+
+    def update(self, X_new: np.ndarray, y_new: np.ndarray, X: np.ndarray, y: np.ndarray) -> None:
+        self.regressor.partial_fit(X_new, y_new)
+
+
+class _ForestUpdater:
+    """
+    Forests that replace their `n_trees` oldest trees with trees trained on
+    the current training set.
+    """
+
+    def __init__(self, regressor, n_trees: Optional[int]=None) -> None:
+        from sklearn.base import clone
+
+        self.regressor = clone(regressor).set_params(warm_start=True)
+        self.n_trees = n_trees or max(regressor.n_estimators // 10, 1)
+        # New trees get new seeds on every fold
+        seed = regressor.random_state
+        self._rng = np.random.default_rng(seed if isinstance(seed, (int, np.integer)) else None)
+
+
+    def fit(self, X: np.ndarray, y: np.ndarray) -> None:
+        self.regressor.fit(X, y)
+
+
+    def update(self, X_new: np.ndarray, y_new: np.ndarray, X: np.ndarray, y: np.ndarray) -> None:
+
+        n_estimators = self.regressor.n_estimators
+        self.regressor.set_params(
+            n_estimators = n_estimators + self.n_trees,
+            random_state = int(self._rng.integers(np.iinfo(np.int32).max))
+        )
+        self.regressor.fit(X, y)
+        self.regressor.estimators_ = self.regressor.estimators_[self.n_trees:]
+        self.regressor.set_params(n_estimators=n_estimators)
+
+
+def warm_start_strategy(forecaster) -> str:
+    """
+    How `backtesting_forecaster_warm_start` updates the model between folds:
+    `'ridge'`, `'forest'`, `'partial_fit'` or `'refit'`.
+    """
+    from sklearn.ensemble._forest import BaseForest
+    from sklearn.linear_model import Ridge
+
+    if (type(forecaster).__name__ != 'ForecasterAutoreg' or forecaster.transformer_y is not None
+            or forecaster.transformer_exog is not None or forecaster.weight_func is not None):
+        return 'refit'
+
+    regressor = forecaster.regressor
+    if isinstance(regressor, Ridge) and np.ndim(regressor.alpha) == 0 and not regressor.positive:
+        return 'ridge'
+    if isinstance(regressor, BaseForest):
+        return 'forest'
+    if hasattr(regressor, 'partial_fit'):
+        return 'partial_fit'
+
+    return 'refit'
+
+
+def backtesting_forecaster_warm_start(
+    forecaster,
+    y: pd.Series,
+    initial_train_size: int,
+    steps: int,
+    metric: Union[str, Callable, List[Union[str, Callable]]],
+    exog: Optional[pd.DataFrame]=None,
+    n_trees_per_fold: Optional[int]=None,
+    warm_start: bool=True,
+    n_jobs: Optional[int]=None,
+    mp_context: str='spawn'
+) -> Tuple[Any, pd.DataFrame, pd.DataFrame]:
+    """
+    `backtesting_forecaster(..., refit=True, fixed_train_size=False)` that
+    updates the model of the previous fold when the regressor allows it
+    (see `warm_start_strategy`) and refits it in parallel otherwise.
+
+    Parameters
+    ----------
+    forecaster : ForecasterAutoreg
+        Forecaster used as template. It is not modified.
+
+    y, initial_train_size, steps, metric, exog
+        As in `backtesting_forecaster_parallel`.
+
+    n_trees_per_fold : int, default `None`
+        Trees replaced on every fold by forests. By default a tenth of
+        `n_estimators`.
+
+    warm_start : bool, default `True`
+        If `False`, every fold is refitted (the baseline of the timings).
+
+    n_jobs, mp_context
+        Workers of the folds that are refitted, as in
+        `backtesting_forecaster_parallel`.
+
+    Returns
+    -------
+    metric_value : float, list
+        Value(s) of the metric(s).
+
+    backtest_predictions : pandas DataFrame
+        Predictions in column `pred`.
+
+    timings : pandas DataFrame
+        Training size, update kind (`'fit'`, `'update'` or `'refit'`) and
+        seconds of every fold.
+
+    """
+    strategy = warm_start_strategy(forecaster) if warm_start else 'refit'
+    folds = make_folds(len(y), initial_train_size, steps, fixed_train_size=False)
+
+    if strategy == 'refit':
+        if isinstance(exog, pd.Series):
+            exog = exog.to_frame()
+        results = _run_folds(forecaster, [y], [exog], folds, n_jobs, mp_context)
+        predictions = [results[(0, fold.fold)][0] for fold in folds]
+        seconds = [results[(0, fold.fold)][1] for fold in folds]
+        kinds = ['refit'] * len(folds)
+    else:
+        if strategy == 'ridge':
+            updater = _RidgeUpdater(forecaster.regressor)
+        elif strategy == 'forest':
+            updater = _ForestUpdater(forecaster.regressor, n_trees_per_fold)
+        else:
+            updater = _PartialFitUpdater(forecaster.regressor)
+
+        y_values = y.to_numpy(dtype=float)
+        exog_values = None if exog is None else np.asarray(exog, dtype=float).reshape(len(y), -1)
+        lags = forecaster.lags
+        max_lag = int(lags.max())
+        X, y_train = train_matrices(y_values, lags, exog_values)
+        predictor = RecursivePredictor(updater.regressor, lags=lags, window_size=max_lag)
+
+        predictions, seconds, kinds = [], [], []
+        end = 0
+        for fold in folds:
+            start = time.perf_counter()
+            rows = fold.train_end - max_lag
+            if fold.fold == 0:
+                updater.fit(X[:rows], y_train[:rows])
+            else:
+                updater.update(X[end:rows], y_train[end:rows], X[:rows], y_train[:rows])
+            end = rows
+
+            exog_next = None
+            if exog_values is not None:
+                exog_next = exog_values[None, fold.train_end:fold.train_end + fold.steps]
+            predictions.append(
+                predictor.predict(
+                    windows     = y_values[None, fold.train_end - max_lag:fold.train_end],
+                    steps       = np.array([fold.steps]),
+                    exog_values = exog_next
+                )[0]
+            )
+            seconds.append(time.perf_counter() - start)
+            kinds.append('fit' if fold.fold == 0 else 'update')
+
+    metric_value, backtest_predictions = _backtest_result(y, initial_train_size, predictions, metric)
+    timings = pd.DataFrame({
+                  'fold'      : [fold.fold for fold in folds],
+                  'train_size': [fold.train_end - fold.train_start for fold in folds],
+                  'kind'      : kinds,
+                  'seconds'   : seconds
+              })
+    timings.attrs['strategy'] = strategy
+
+    return metric_value, backtest_predictions, timings
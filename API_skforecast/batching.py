@@ -0,0 +1,243 @@
+"""
+Micro-batching of concurrent single-window forecasts.
+
+Under bursty traffic many `/make_preds/` requests for the same model arrive
+within a few milliseconds. `MicroBatcher` holds them for at most `max_wait`
+seconds, or until `max_batch` windows are waiting, and predicts them with a
+single `engine.predict_windows` call (one regressor call per step for the
+whole batch). Each request then gets its own rows back.
+
+Requests are only batched together when they use the same model version and
+exog snapshot version. When a new snapshot version arrives for a model, the
+batch of the previous one is flushed right away (`flushes_by_version`). In
+exog query mode requests come without a snapshot and the batcher reads exog
+once per batch, for the horizons of all its windows, when it is flushed.
+Everything runs on the event loop except the exog read and the prediction,
+which goes through the bounded `PredictionExecutor`.
+"""
+import asyncio
+import os
+import time
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from concurrency import PredictionExecutor
+from engine import predict_windows
+from metrics import span
+
+
+class _Pending:
+    """
+    Windows waiting to be flushed for one (model, exog) pair. `snapshot` is
+    `None` when exog is read at flush time.
+    """
+
+    def __init__(self, entry, snapshot) -> None:
+
+        self.entry    = entry
+        self.snapshot = snapshot
+        self.items    = []
+        self.created  = time.perf_counter()
+        self.timer    = None
+
+
+def _predict_items(entry, snapshot, items: List[Tuple]) -> List[Any]:
+    """
+    Predict all the items together. If the batch fails validation, predict
+    them one by one so only the invalid windows get the error.
+    """
+    values = [item[0] for item in items]
+    end_dates = pd.DatetimeIndex([item[1] for item in items])
+    steps = [item[2] for item in items]
+    try:
+        with span('predict'):
+            preds = predict_windows(
+                        forecaster   = entry.forecaster,
+                        last_windows = values,
+                        end_dates    = end_dates,
+                        steps        = steps,
+                        exog         = snapshot.data,
+                        predictor    = entry.predictor
+                    )
+        return [preds[i, :n] for i, n in enumerate(steps)]
+    except ValueError:
+        if len(items) == 1:
+            raise
+
+    results = []
+    for item in items:
+        try:
+            results.append(_predict_items(entry, snapshot, [item])[0])
+        except ValueError as e:
+            results.append(e)
+
+    return results
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent predictions into batches.
+
+    Parameters
+    ----------
+    executor : PredictionExecutor
+        Executor that runs the batched predictions.
+
+    max_batch : int, default `64`
+        Windows that trigger an immediate flush.
+
+    max_wait : float, default `0.002`
+        Seconds the first window of a batch waits for others before the
+        batch is flushed. Larger values give bigger batches (throughput) at
+        the cost of added latency.
+
+    exog_provider : ExogProvider, default `None`
+        Provider used to read exog for batches submitted without a snapshot
+        (exog query mode).
+
+    """
+
+    def __init__(
+        self,
+        executor: PredictionExecutor,
+        max_batch: int=64,
+        max_wait: float=0.002,
+        exog_provider=None
+    ) -> None:
+
+        self.executor      = executor
+        self.max_batch     = max_batch
+        self.max_wait      = max_wait
+        self.exog_provider = exog_provider
+        self.batches       = 0
+        self.items         = 0
+        self.flush_size    = 0
+        self.flush_timeout = 0
+        self.flush_version = 0
+        self.wait_seconds  = 0.0
+        self._pending      = {}
+        self._tasks        = set()
+
+
+    async def submit(
+        self,
+        entry,
+        snapshot,
+        values: np.ndarray,
+        end: pd.Timestamp,
+        steps: int
+    ) -> np.ndarray:
+        """
+        Queue one window and wait for its predictions. With `snapshot=None`
+        exog is read at flush time. Raises `ValueError` if the window is
+        invalid and `Overloaded` if the executor is full.
+        """
+        loop = asyncio.get_running_loop()
+        group = (entry.version, None if snapshot is None else snapshot.version)
+        pending = self._pending.get(group)
+        if pending is None:
+            # Batches of an older snapshot of this model get no more windows
+            for other in [g for g in self._pending if g[0] == group[0]]:
+                self._flush(other, reason='version')
+            pending = _Pending(entry, snapshot)
+            pending.timer = loop.call_later(self.max_wait, self._flush, group, 'timeout')
+            self._pending[group] = pending
+
+        future = loop.create_future()
+        pending.items.append((values, end, steps, future))
+        if len(pending.items) >= self.max_batch:
+            self._flush(group, reason='size')
+
+        return await future
+
+
+    def _flush(self, group: Tuple, reason: str) -> None:
+        """
+        Start predicting the batch of `group`. `reason` is `'size'`,
+        `'timeout'` or `'version'`.
+        """
+        pending = self._pending.pop(group, None)
+        if pending is None:
+            return
+        pending.timer.cancel()
+        if reason == 'timeout':
+            self.flush_timeout += 1
+        elif reason == 'version':
+            self.flush_version += 1
+        else:
+            self.flush_size += 1
+        self.batches += 1
+        self.items += len(pending.items)
+        self.wait_seconds += time.perf_counter() - pending.created
+        task = asyncio.ensure_future(self._run(pending))
+        # Keep a reference until the batch is done
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+    async def _run(self, pending: _Pending) -> None:
+
+        items = [item[:3] for item in pending.items]
+        futures = [item[3] for item in pending.items]
+        try:
+            snapshot = pending.snapshot
+            if snapshot is None:
+                # One exog read for the horizons of the whole batch
+                snapshot = await asyncio.to_thread(
+                               self.exog_provider.get_for_horizon,
+                               pending.entry.forecaster.exog_col_names,
+                               [item[1] for item in items],
+                               [item[2] for item in items],
+                               pending.entry.forecaster.index_freq
+                           )
+            results = await self.executor.run(
+                          _predict_items, pending.entry, snapshot, items
+                      )
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, result in zip(futures, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+    def stats(self) -> dict:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1e3,
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "flushes_by_size": self.flush_size,
+            "flushes_by_timeout": self.flush_timeout,
+            "flushes_by_version": self.flush_version,
+            "mean_wait_ms": 1e3 * self.wait_seconds / self.batches if self.batches else 0.0,
+        }
+
+
+def batcher_from_env(
+    executor: PredictionExecutor,
+    exog_provider=None
+) -> Optional[MicroBatcher]:
+    """
+    `MicroBatcher` if `MICROBATCH` is set to `1`, configured with
+    `MICROBATCH_MAX_SIZE` and `MICROBATCH_MAX_WAIT_MS`. `None` otherwise.
+    """
+    if os.environ.get('MICROBATCH', '0') != '1':
+        return None
+
+    return MicroBatcher(
+               executor      = executor,
+               max_batch     = int(os.environ.get('MICROBATCH_MAX_SIZE', 64)),
+               max_wait      = float(os.environ.get('MICROBATCH_MAX_WAIT_MS', 2)) / 1e3,
+               exog_provider = exog_provider
+           )
@@ -0,0 +1,85 @@
+"""
+Round trip and load time of the artifact format versus the pickle.
+
+    cd API_skforecast
+    python benchmarks/bench_artifact.py
+
+Exports `forecaster.py` to a temporary artifact, checks that predictions of
+the loaded artifact are identical to those of the pickled forecaster, and
+times both loaders. `benchmarks/check_artifact.py` runs the round trip
+alone, in about a second.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from artifact import export_forecaster, load_artifact
+from benchmarks.bench_engine import make_windows
+from benchmarks.fixtures import exog_test
+from engine import predict_windows
+from exog import preprocess_exog
+from skforecast.utils import load_forecaster
+
+warnings.filterwarnings('ignore')
+
+
+def best_of(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--n-windows', type=int, default=1000)
+    args = parser.parse_args()
+
+    forecaster = load_forecaster('forecaster.py', verbose=False)
+    exog = preprocess_exog(exog_test())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = export_forecaster(forecaster, os.path.join(tmp, 'forecaster_artifact'))
+        artifact = load_artifact(path)
+
+        # Round trip: same predictions for many windows and horizons
+        windows = make_windows(forecaster, args.n_windows)
+        end_dates = forecaster.last_window.index[[-1] * args.n_windows]
+        steps = np.random.default_rng(123).integers(1, 13, size=args.n_windows)
+        expected = predict_windows(forecaster, list(windows), end_dates, steps, exog)
+        result = predict_windows(artifact, list(windows), end_dates, steps, exog)
+        assert np.array_equal(expected, result, equal_nan=True), "Predictions differ"
+
+        report = {
+            "round_trip_equal": True,
+            "pickle_bytes": os.path.getsize('forecaster.py'),
+            "artifact_bytes": dir_size(path),
+            "pickle_load_seconds": best_of(
+                lambda: load_forecaster('forecaster.py', verbose=False), args.repeats
+            ),
+            "artifact_load_seconds": best_of(lambda: load_artifact(path), args.repeats),
+            "artifact_load_no_mmap_seconds": best_of(
+                lambda: load_artifact(path, mmap=False), args.repeats
+            ),
+        }
+        report["speedup"] = report["pickle_load_seconds"] / report["artifact_load_seconds"]
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Compare `backtesting_forecaster(..., refit=True)` with
+`backtesting.backtesting_forecaster_parallel` on the daily bitcoin closing
+price, as in the robustness notebook (12 steps per fold).
+
+    cd API_skforecast
+    python benchmarks/bench_backtesting.py --n-jobs 1 2 4 --regressor forest
+
+Predictions and metric are first checked to be identical to the serial run.
+The speedup can not exceed the number of cores (`cpu_count` in the output);
+with cheap fits (`--regressor ridge`) process start-up dominates.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backtesting import backtesting_forecaster_parallel
+from benchmarks.fixtures import btc_daily
+from skforecast.ForecasterAutoreg import ForecasterAutoreg
+from skforecast.model_selection import backtesting_forecaster
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import Ridge
+
+warnings.filterwarnings('ignore')
+
+
+def make_forecaster(regressor: str, lags: int) -> ForecasterAutoreg:
+
+    if regressor == 'forest':
+        model = RandomForestRegressor(n_estimators=50, max_depth=8, random_state=123)
+    else:
+        model = Ridge(random_state=123)
+
+    return ForecasterAutoreg(regressor=model, lags=lags)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-jobs', type=int, nargs='+', default=[1, 2, os.cpu_count()])
+    parser.add_argument('--regressor', choices=['ridge', 'forest'], default='forest')
+    parser.add_argument('--lags', type=int, default=15)
+    parser.add_argument('--steps', type=int, default=12)
+    parser.add_argument('--n-obs', type=int, default=1000)
+    parser.add_argument('--initial-train-size', type=int, default=600)
+    parser.add_argument('--exog', action='store_true')
+    args = parser.parse_args()
+
+    data = btc_daily(('closing_price', 'google_trends')).iloc[-args.n_obs:]
+    y = np.log(data['closing_price'])
+    exog = data[['google_trends']] if args.exog else None
+    forecaster = make_forecaster(args.regressor, args.lags)
+    kwargs = dict(
+                 y                  = y,
+                 initial_train_size = args.initial_train_size,
+                 steps              = args.steps,
+                 metric             = 'mean_absolute_error',
+                 exog               = exog
+             )
+
+    start = time.perf_counter()
+    expected_metric, expected = backtesting_forecaster(
+                                    forecaster=forecaster, refit=True, verbose=False, **kwargs
+                                )
+    serial_seconds = time.perf_counter() - start
+
+    for n_jobs in sorted(set(args.n_jobs)):
+        start = time.perf_counter()
+        metric, predictions = backtesting_forecaster_parallel(
+                                  forecaster=forecaster, n_jobs=n_jobs, **kwargs
+                              )
+        seconds = time.perf_counter() - start
+        pd.testing.assert_frame_equal(predictions, expected, check_freq=False)
+        assert metric == expected_metric, "Metric differs from the serial run"
+
+        print(json.dumps({
+            "regressor": args.regressor,
+            "n_folds": int(np.ceil((len(y) - args.initial_train_size) / args.steps)),
+            "n_jobs": n_jobs,
+            "cpu_count": os.cpu_count(),
+            "serial_seconds": serial_seconds,
+            "parallel_seconds": seconds,
+            "speedup": serial_seconds / seconds,
+            "identical": True,
+        }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Serialization cost of forecast responses per 10k forecasts.
+
+    cd API_skforecast
+    python benchmarks/bench_encoding.py --forecasts 10000 --steps 3
+
+Two documents are encoded:
+
+- `single`: `{"pred": series}` once per forecast, the cost added to every
+  `/make_preds/` request.
+- `batch`: one `/make_preds_batch/` response, `{"preds": {key: series}}`,
+  with all the forecasts.
+
+`jsonable_encoder` is the original path (FastAPI's encoder and
+`JSONResponse`). The others are the encoders of `encoding`. msgpack and
+Arrow are only measured when `msgpack` and `pyarrow` are installed. Every
+Arrow stream carries its schema (about 800 bytes), so Arrow only pays off
+for batches.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from encoding import ARROW, JSON, MSGPACK, available_media_types, encode
+from engine import predictions_to_series
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+warnings.filterwarnings('ignore')
+
+
+def best_time(func, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--forecasts', type=int, default=10000)
+    parser.add_argument('--steps', type=int, default=3)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(123)
+    end_dates = pd.Timestamp('2005-06-01') + pd.offsets.MonthBegin(1) * rng.integers(0, 120, args.forecasts)
+    forecasts = [
+        predictions_to_series(rng.random(args.steps), end, 'MS')
+        for end in end_dates
+    ]
+    documents = {
+        "single": [{"pred": series} for series in forecasts],
+        "batch": [{"preds": {f"series_{i}": series for i, series in enumerate(forecasts)}}],
+    }
+
+    available = available_media_types()
+    encoders = {
+        "jsonable_encoder": lambda content: JSONResponse(jsonable_encoder(content)).body,
+        "json": lambda content: encode(content, JSON),
+        "msgpack": lambda content: encode(content, MSGPACK),
+        "arrow": lambda content: encode(content, ARROW),
+    }
+    media_types = {"jsonable_encoder": JSON, "json": JSON, "msgpack": MSGPACK, "arrow": ARROW}
+
+    for document, contents in documents.items():
+        baseline = None
+        for name, encoder in encoders.items():
+            if media_types[name] not in available:
+                print(json.dumps({"document": document, "encoder": name, "error": "not installed"}))
+                continue
+            seconds = best_time(lambda: [encoder(content) for content in contents], args.repeats)
+            n_bytes = sum(len(encoder(content)) for content in contents)
+            if baseline is None:
+                baseline = seconds
+            print(json.dumps({
+                "document": document,
+                "encoder": name,
+                "forecasts": args.forecasts,
+                "steps": args.steps,
+                "seconds_per_10k": seconds * 10000 / args.forecasts,
+                "bytes_per_forecast": n_bytes / args.forecasts,
+                "speedup": baseline / seconds,
+            }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Compare `ForecasterAutoreg.predict`, called once per window, with
+`engine.RecursivePredictor`, which predicts all the windows together.
+
+    cd API_skforecast
+    python benchmarks/bench_engine.py
+
+Both paths are checked to give exactly the same values. The per-window loop
+is timed on at most `--max-loop` windows and scaled linearly to the full
+count, since 10,000 sequential calls take several minutes.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.fixtures import exog_test
+from engine import RecursivePredictor, exog_for_windows
+from exog import preprocess_exog
+from skforecast.utils import load_forecaster
+
+warnings.filterwarnings('ignore')
+
+
+def make_windows(forecaster, n_windows, seed=123):
+    """
+    `n_windows` perturbed copies of the forecaster's last window.
+    """
+    rng = np.random.default_rng(seed)
+    base = forecaster.last_window.to_numpy()
+    noise = rng.normal(loc=1, scale=0.05, size=(n_windows, len(base)))
+
+    return base * noise
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 100, 10_000])
+    parser.add_argument('--steps', type=int, default=3)
+    parser.add_argument('--max-loop', type=int, default=200)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    forecaster = load_forecaster('forecaster.py', verbose=False)
+    exog = preprocess_exog(exog_test())[forecaster.exog_col_names]
+    last_window = forecaster.last_window
+    exog_steps = exog.iloc[:args.steps]
+
+    results = []
+    for n_windows in args.sizes:
+        windows = make_windows(forecaster, n_windows)
+        steps = np.full(n_windows, args.steps)
+        exog_values = exog_for_windows(
+                          exog      = exog,
+                          end_dates = last_window.index[[-1] * n_windows],
+                          steps     = steps,
+                          freq      = forecaster.index_freq
+                      )
+
+        # Baseline: one `predict` call per window
+        n_loop = min(n_windows, args.max_loop)
+        start = time.perf_counter()
+        loop_preds = np.vstack([
+            forecaster.predict(
+                steps       = args.steps,
+                last_window = pd.Series(w, index=last_window.index),
+                exog        = exog_steps
+            ).to_numpy()
+            for w in windows[:n_loop]
+        ])
+        loop_seconds = (time.perf_counter() - start) * n_windows / n_loop
+
+        predictor = RecursivePredictor.from_forecaster(forecaster)
+        timings = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            preds = predictor.predict(windows, steps, exog_values)
+            timings.append(time.perf_counter() - start)
+        engine_seconds = min(timings)
+
+        assert np.array_equal(preds[:n_loop], loop_preds), "Predictions differ"
+
+        results.append({
+            "n_windows": n_windows,
+            "steps": args.steps,
+            "predict_loop_seconds": loop_seconds,
+            "predict_loop_extrapolated": n_loop < n_windows,
+            "engine_seconds": engine_seconds,
+            "speedup": loop_seconds / engine_seconds,
+        })
+        print(json.dumps(results[-1]))
+
+
+if __name__ == '__main__':
+    main()
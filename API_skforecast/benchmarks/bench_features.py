@@ -0,0 +1,111 @@
+"""
+Build time and peak memory of the training matrix of a `ForecasterAutoreg`
+with many lags on the daily bitcoin data (closing price as target, the
+other numeric columns as exog): `create_train_X_y` against
+`features.train_matrices` in float64 and float32.
+
+    cd API_skforecast
+    python benchmarks/bench_features.py --lags 365
+    python benchmarks/bench_features.py --lags 365 --fit
+
+Peak memory is measured with `tracemalloc` (NumPy reports its buffers to
+it) and excludes the input data. With `--fit` the whole fit is measured
+instead (`forecaster.fit` against `features.fit_forecaster`, Ridge). Ridge
+in float32 can overflow with the unscaled exog columns (hash rate is about
+1e20); that case is reported as an error.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.fixtures import BTC_CSV, btc_daily
+from features import fit_forecaster, train_matrices
+from skforecast.ForecasterAutoreg import ForecasterAutoreg
+from sklearn.linear_model import Ridge
+
+warnings.filterwarnings('ignore')
+
+
+def measure(func, repeats: int) -> dict:
+    """
+    Best time of `repeats` calls and peak traced memory of one more.
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"seconds": min(timings), "peak_mb": peak / 2**20}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lags', type=int, default=365)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--fit', action='store_true')
+    args = parser.parse_args()
+
+    with open(BTC_CSV) as f:
+        columns = f.readline().strip().split(',')[1:]
+    data = btc_daily(tuple(columns))
+    y = data['closing_price']
+    exog = data.drop(columns='closing_price')
+    lags = np.arange(1, args.lags + 1)
+
+    for with_exog in (False, True):
+        x = exog if with_exog else None
+        forecaster = ForecasterAutoreg(regressor=Ridge(), lags=args.lags)
+        if args.fit:
+            cases = {
+                "skforecast": lambda: forecaster.fit(y=y, exog=x),
+                "float64": lambda: fit_forecaster(forecaster, y, x),
+                "float32": lambda: fit_forecaster(forecaster, y, x, dtype=np.float32),
+            }
+        else:
+            y_values = y.to_numpy()
+            exog_values = None if x is None else x.to_numpy()
+            cases = {
+                "skforecast": lambda: forecaster.create_train_X_y(y=y, exog=x),
+                "float64": lambda: train_matrices(y_values, lags, exog_values),
+                "float32": lambda: train_matrices(y_values, lags, exog_values, np.float32),
+            }
+
+        results = {}
+        for name, func in cases.items():
+            try:
+                results[name] = measure(func, args.repeats)
+            except ValueError as e:
+                # e.g. Ridge on float32 with unscaled exog overflows
+                results[name] = {"error": str(e)}
+        baseline = results["skforecast"]
+        for name, result in results.items():
+            if "error" in result:
+                print(json.dumps({"operation": "fit", "path": name, **result}))
+                continue
+            print(json.dumps({
+                "operation": "fit" if args.fit else "build",
+                "path": name,
+                "n_obs": len(y),
+                "lags": args.lags,
+                "n_exog": 0 if x is None else x.shape[1],
+                **result,
+                "speedup": baseline["seconds"] / result["seconds"],
+                "memory_ratio": result["peak_mb"] / baseline["peak_mb"] if baseline["peak_mb"] else None,
+            }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Latency of the forest inside `forecaster.py`: scikit-learn `predict` versus
+`forest.FlatForest`.
+
+    cd API_skforecast
+    python benchmarks/bench_forest.py
+
+Reports microseconds per call for several batch sizes and the largest
+absolute difference between both predictions.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from forest import FlatForest
+from skforecast.utils import load_forecaster
+
+warnings.filterwarnings('ignore')
+
+
+def time_call(fn, X, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(X)
+        timings.append(time.perf_counter() - start)
+
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100, 1000])
+    parser.add_argument('--repeats', type=int, default=200)
+    args = parser.parse_args()
+
+    forecaster = load_forecaster('forecaster.py', verbose=False)
+    regressor = forecaster.regressor
+
+    start = time.perf_counter()
+    flat = FlatForest.from_regressor(regressor)
+    export_seconds = time.perf_counter() - start
+    print(json.dumps({
+        "n_trees": flat.n_trees,
+        "n_nodes": flat.n_nodes,
+        "max_depth": flat.max_depth,
+        "export_seconds": export_seconds,
+    }))
+
+    rng = np.random.default_rng(123)
+    n_features = regressor.n_features_in_
+    for n_rows in args.sizes:
+        X = rng.normal(loc=1, scale=0.3, size=(n_rows, n_features))
+        repeats = max(3, args.repeats // max(1, n_rows // 10))
+        sklearn_seconds = time_call(regressor.predict, X, repeats)
+        flat_seconds = time_call(flat.predict, X, repeats)
+        max_abs_diff = float(np.abs(regressor.predict(X) - flat.predict(X)).max())
+        assert np.allclose(regressor.predict(X), flat.predict(X)), "Predictions differ"
+
+        print(json.dumps({
+            "n_rows": n_rows,
+            "sklearn_us": sklearn_seconds * 1e6,
+            "flat_us": flat_seconds * 1e6,
+            "speedup": sklearn_seconds / flat_seconds,
+            "max_abs_diff": max_abs_diff,
+        }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Compare the exhaustive grid search with `search.successive_halving_search`
+on the daily bitcoin closing price (Ridge, `alpha` grid times lag sets,
+refit every 12 steps).
+
+    cd API_skforecast
+    python benchmarks/bench_halving.py --factor 3
+
+Reports fits, wall time and best candidate of `grid_search_forecaster`,
+`grid_search_parallel` and successive halving, and the rank of the
+candidate chosen by successive halving in the exhaustive results.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.fixtures import btc_daily
+from search import grid_search_parallel, successive_halving_search
+from skforecast.ForecasterAutoreg import ForecasterAutoreg
+from skforecast.model_selection import grid_search_forecaster
+from sklearn.linear_model import Ridge
+
+warnings.filterwarnings('ignore')
+
+
+def best(results) -> dict:
+    return {
+        "lags": int(results['lags'].iloc[0].max()),
+        "params": {k: float(v) for k, v in results['params'].iloc[0].items()},
+        "metric": float(results['mean_squared_error'].iloc[0]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--factor', type=int, default=3)
+    parser.add_argument('--lags', type=int, nargs='+', default=[7, 15, 30, 60])
+    parser.add_argument('--n-alpha', type=int, default=10)
+    parser.add_argument('--steps', type=int, default=12)
+    parser.add_argument('--n-obs', type=int, default=1500)
+    parser.add_argument('--initial-train-size', type=int, default=900)
+    parser.add_argument('--n-jobs', type=int, default=1)
+    parser.add_argument('--skip-skforecast', action='store_true')
+    args = parser.parse_args()
+
+    y = np.log(btc_daily()['closing_price']).iloc[-args.n_obs:]
+    kwargs = dict(
+                 y                  = y,
+                 param_grid         = {'alpha': np.logspace(-5, 2, args.n_alpha)},
+                 lags_grid          = args.lags,
+                 steps              = args.steps,
+                 metric             = 'mean_squared_error',
+                 initial_train_size = args.initial_train_size,
+                 fixed_train_size   = False,
+                 refit              = True,
+                 return_best        = False
+             )
+    n_candidates = len(args.lags) * args.n_alpha
+    n_folds = int(np.ceil((len(y) - args.initial_train_size) / args.steps))
+    report = []
+
+    if not args.skip_skforecast:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            results = grid_search_forecaster(
+                          forecaster = ForecasterAutoreg(Ridge(random_state=123), lags=1),
+                          verbose    = False,
+                          **kwargs
+                      )
+        report.append({
+            "search": "grid_search_forecaster",
+            "fits": n_candidates * n_folds,
+            "seconds": time.perf_counter() - start,
+            "best": best(results),
+        })
+
+    start = time.perf_counter()
+    exhaustive = grid_search_parallel(
+                     forecaster = ForecasterAutoreg(Ridge(random_state=123), lags=1),
+                     n_jobs     = args.n_jobs,
+                     **kwargs
+                 )
+    report.append({
+        "search": "grid_search_parallel",
+        "fits": n_candidates * n_folds,
+        "seconds": time.perf_counter() - start,
+        "best": best(exhaustive),
+    })
+
+    halving = successive_halving_search(
+                  forecaster = ForecasterAutoreg(Ridge(random_state=123), lags=1),
+                  factor     = args.factor,
+                  n_jobs     = args.n_jobs,
+                  **kwargs
+              )
+    chosen = (halving['lags'].iloc[0].max(), halving['params'].iloc[0])
+    rank = next(
+               i for i, (lags, params) in enumerate(zip(exhaustive['lags'], exhaustive['params']))
+               if (lags.max(), params) == chosen
+           )
+    rounds = halving.attrs['rounds'].groupby('round')['test_size'].agg(['first', 'size'])
+    report.append({
+        "search": "successive_halving",
+        "fits": halving.attrs['fits'],
+        "seconds": halving.attrs['seconds'],
+        "best": best(halving),
+        "rank_in_exhaustive": rank + 1,
+        "rounds": [
+            {"test_size": int(row['first']), "candidates": int(row['size'])}
+            for _, row in rounds.iterrows()
+        ],
+    })
+
+    baseline = report[0]
+    for row in report:
+        print(json.dumps({
+            "candidates": n_candidates,
+            "folds": n_folds,
+            **row,
+            "fits_ratio": row["fits"] / baseline["fits"],
+            "speedup": baseline["seconds"] / row["seconds"],
+        }))
+
+
+if __name__ == '__main__':
+    main()
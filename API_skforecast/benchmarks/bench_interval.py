@@ -0,0 +1,111 @@
+"""
+Compare `ForecasterAutoreg.predict_bootstrapping`, which predicts every
+bootstrapped path separately, with `engine.predict_bootstrapping`, which
+predicts all the paths as rows of one batch.
+
+    cd API_skforecast
+    python benchmarks/bench_interval.py
+
+Both paths are first checked to give exactly the same values when fed the
+same residual draws. skforecast is timed on at most `--max-loop` paths and
+scaled linearly, since every path costs `steps` regressor calls.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.fixtures import exog_test
+from engine import RecursivePredictor, predict_bootstrapping, predict_windows
+from exog import preprocess_exog
+from skforecast.utils import load_forecaster
+
+warnings.filterwarnings('ignore')
+
+
+def skforecast_residuals(forecaster, steps, n_boot, random_state):
+    """
+    Residuals drawn by `ForecasterAutoreg.predict_bootstrapping`: one
+    generator per path, seeded from a first generator.
+    """
+    rng = np.random.default_rng(seed=random_state)
+    seeds = rng.integers(low=0, high=10000, size=n_boot)
+
+    return np.vstack([
+        np.random.default_rng(seed=seed).choice(
+            a=forecaster.in_sample_residuals, size=steps, replace=True
+        )
+        for seed in seeds
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-boot', type=int, nargs='+', default=[10, 100, 500, 2000])
+    parser.add_argument('--steps', type=int, default=3)
+    parser.add_argument('--max-loop', type=int, default=50)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    forecaster = load_forecaster('forecaster.py', verbose=False)
+    exog = preprocess_exog(exog_test())
+    last_window = forecaster.last_window
+    values = last_window.to_numpy()
+    end = last_window.index[-1]
+    predictor = RecursivePredictor.from_forecaster(forecaster)
+
+    # Same draws, same paths
+    n_check = min(args.max_loop, 20)
+    expected = forecaster.predict_bootstrapping(
+                   steps=args.steps, exog=exog, n_boot=n_check, random_state=123
+               ).to_numpy().T
+    paths = predict_windows(
+                forecaster   = forecaster,
+                last_windows = [values] * n_check,
+                end_dates    = last_window.index[[-1] * n_check],
+                steps        = [args.steps] * n_check,
+                exog         = exog,
+                predictor    = predictor,
+                residuals    = skforecast_residuals(forecaster, args.steps, n_check, 123)
+            )
+    assert np.array_equal(paths, expected), "Bootstrapped paths differ"
+
+    for n_boot in args.n_boot:
+        n_loop = min(n_boot, args.max_loop)
+        start = time.perf_counter()
+        forecaster.predict_bootstrapping(steps=args.steps, exog=exog, n_boot=n_loop)
+        loop_seconds = (time.perf_counter() - start) * n_boot / n_loop
+
+        timings = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            predict_bootstrapping(
+                forecaster  = forecaster,
+                last_window = values,
+                end_date    = end,
+                steps       = args.steps,
+                n_boot      = n_boot,
+                exog        = exog,
+                predictor   = predictor
+            )
+            timings.append(time.perf_counter() - start)
+        engine_seconds = min(timings)
+
+        print(json.dumps({
+            "n_boot": n_boot,
+            "steps": args.steps,
+            "skforecast_seconds": loop_seconds,
+            "skforecast_extrapolated": n_loop < n_boot,
+            "engine_seconds": engine_seconds,
+            "engine_us_per_path": engine_seconds / n_boot * 1e6,
+            "speedup": loop_seconds / engine_seconds,
+        }))
+
+
+if __name__ == '__main__':
+    main()
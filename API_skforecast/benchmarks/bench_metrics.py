@@ -0,0 +1,55 @@
+"""
+Overhead of the latency instrumentation.
+
+    cd API_skforecast
+    python benchmarks/bench_metrics.py
+
+- `empty`: an empty `with` block, the floor of the loop.
+- `span`: an empty `with span(...)` block, the cost added to every stage.
+- `observe`: recording an already measured duration.
+- `render`: the `/metrics` exposition with a few stages filled in.
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from metrics import MetricsRegistry
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=100000)
+    args = parser.parse_args()
+
+    registry = MetricsRegistry()
+    null = contextlib.nullcontext()
+
+    def empty():
+        with null:
+            pass
+
+    def span():
+        with registry.span('predict'):
+            pass
+
+    def observe():
+        registry.observe('parse', 0.0001)
+
+    cases = {"empty": empty, "span": span, "observe": observe}
+    for name, fn in cases.items():
+        seconds = min(timeit.repeat(fn, number=args.number, repeat=3)) / args.number
+        print(json.dumps({"case": name, "us_per_call": seconds * 1e6}))
+
+    for stage in ('cache', 'serialize', 'request'):
+        registry.observe(stage, 0.001)
+    number = max(args.number // 1000, 1)
+    seconds = min(timeit.repeat(registry.render, number=number, repeat=3)) / number
+    print(json.dumps({"case": "render", "us_per_call": seconds * 1e6}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Cost of parsing one `last_window` request body.
+
+    cd API_skforecast
+    python benchmarks/bench_payload.py
+
+- `model_dict`: the original path, `json` decoding, the `Last_window`
+  pydantic model, `pd.Series`, `pd.to_datetime` and `asfreq`.
+- `shim_dict`: the same `{"y": {...}}` body through `payload.parse_body`.
+- `columnar` and `epoch`: the new layouts through `payload.parse_body`.
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from payload import parse_body
+
+warnings.filterwarnings('ignore')
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=2000)
+    args = parser.parse_args()
+
+    from main import Last_window, parse_last_window
+
+    with open(os.path.join(HERE, 'last_window.json'), 'rb') as f:
+        dict_body = f.read()
+    y = json.loads(dict_body)['y']
+    values = list(y.values())
+    columnar_body = json.dumps(
+        {"start": next(iter(y)), "freq": "MS", "values": values}
+    ).encode()
+    epoch_body = json.dumps({
+        "index": [1107216000000, 1109635200000, 1112313600000, 1114905600000, 1117584000000],
+        "freq": "MS",
+        "values": values
+    }).encode()
+
+    def model_dict():
+        return parse_last_window(Last_window(**json.loads(dict_body)).y)
+
+    cases = {
+        "model_dict": model_dict,
+        "shim_dict": lambda: parse_body(dict_body, freq='MS'),
+        "columnar": lambda: parse_body(columnar_body, freq='MS'),
+        "epoch": lambda: parse_body(epoch_body, freq='MS'),
+    }
+
+    baseline = None
+    for name, fn in cases.items():
+        seconds = min(timeit.repeat(fn, number=args.number, repeat=3)) / args.number
+        baseline = baseline or seconds
+        print(json.dumps({
+            "path": name,
+            "us_per_body": seconds * 1e6,
+            "speedup_vs_model_dict": baseline / seconds,
+        }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Compare `grid_search_forecaster` with `search.grid_search_parallel` on the
+daily bitcoin closing price, with the grid of `skforecast_robust_regressor`
+(Ridge, 10 `alpha` values, refit every 12 steps) over several lag sets.
+
+    cd API_skforecast
+    python benchmarks/bench_search.py --n-jobs 1 4
+
+Metrics are first checked to match the exhaustive search (the lag matrices
+have another memory layout than skforecast's, so they agree up to floating
+point rounding). A second run with the same store measures a resumed search.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.fixtures import btc_daily
+from search import grid_search_parallel
+from skforecast.ForecasterAutoreg import ForecasterAutoreg
+from skforecast.model_selection import grid_search_forecaster
+from sklearn.linear_model import Ridge
+
+warnings.filterwarnings('ignore')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-jobs', type=int, nargs='+', default=[1, os.cpu_count()])
+    parser.add_argument('--lags', type=int, nargs='+', default=[7, 15, 30])
+    parser.add_argument('--n-alpha', type=int, default=10)
+    parser.add_argument('--steps', type=int, default=12)
+    parser.add_argument('--n-obs', type=int, default=1000)
+    parser.add_argument('--initial-train-size', type=int, default=700)
+    parser.add_argument('--no-refit', action='store_true')
+    args = parser.parse_args()
+
+    y = np.log(btc_daily()['closing_price']).iloc[-args.n_obs:]
+    kwargs = dict(
+                 y                  = y,
+                 param_grid         = {'alpha': np.logspace(-5, 2, args.n_alpha)},
+                 lags_grid          = args.lags,
+                 steps              = args.steps,
+                 metric             = 'mean_squared_error',
+                 initial_train_size = args.initial_train_size,
+                 fixed_train_size   = False,
+                 refit              = not args.no_refit,
+                 return_best        = False
+             )
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        expected = grid_search_forecaster(
+                       forecaster = ForecasterAutoreg(Ridge(random_state=123), lags=1),
+                       verbose    = False,
+                       **kwargs
+                   )
+    exhaustive_seconds = time.perf_counter() - start
+    expected = expected.sort_index()['mean_squared_error'].to_numpy()
+
+    for n_jobs in sorted(set(args.n_jobs)):
+        store = os.path.join(tempfile.mkdtemp(prefix='bench-search-'), 'search.db')
+        timings = []
+        for _ in range(2):
+            start = time.perf_counter()
+            results = grid_search_parallel(
+                          forecaster = ForecasterAutoreg(Ridge(random_state=123), lags=1),
+                          n_jobs     = n_jobs,
+                          store      = store,
+                          **kwargs
+                      )
+            timings.append(time.perf_counter() - start)
+        values = results.sort_index()['mean_squared_error'].to_numpy()
+        rel_diff = float(np.max(np.abs(values - expected) / np.abs(expected)))
+        assert rel_diff < 1e-9, f"Metrics differ from grid_search_forecaster ({rel_diff})"
+
+        print(json.dumps({
+            "candidates": len(values),
+            "distinct_lags": len(set(args.lags)),
+            "refit": not args.no_refit,
+            "n_jobs": n_jobs,
+            "cpu_count": os.cpu_count(),
+            "exhaustive_seconds": exhaustive_seconds,
+            "parallel_seconds": timings[0],
+            "speedup": exhaustive_seconds / timings[0],
+            "resumed_seconds": timings[1],
+            "max_rel_metric_diff": rel_diff,
+        }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Time to first successful prediction of a fresh `uvicorn main:app` process,
+as seen by a client on a scale-to-zero deployment.
+
+    cd API_skforecast
+    python benchmarks/bench_startup.py --repeats 5
+    python benchmarks/bench_startup.py --repeats 5 --artifact
+
+Every run starts uvicorn with the exog provider pointed at the local fixture
+of `benchmarks/fixtures.py` and sends `last_window.json` to `/make_preds/`
+until it gets a 200. The breakdown reported by `/startup` (process age when
+ready, import of `main`, startup phases) is printed with it. `--artifact`
+serves the forecaster exported with `artifact.export_forecaster`, which does
+not import scikit-learn or skforecast.
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.fixtures import write_exog_fixture
+
+warnings.filterwarnings('ignore')
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def run_once(env: dict, body: bytes, timeout: float) -> dict:
+    """
+    Start the server, wait for the first successful prediction and stop it.
+    """
+    import httpx
+
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    process = subprocess.Popen(
+                  [sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(port),
+                   '--log-level', 'warning'],
+                  cwd    = HERE,
+                  env    = env,
+                  stdout = subprocess.DEVNULL,
+                  stderr = subprocess.DEVNULL
+              )
+    try:
+        attempts = 0
+        with httpx.Client(base_url=url, timeout=timeout) as client:
+            while True:
+                if time.perf_counter() - start > timeout:
+                    raise TimeoutError(f"No successful prediction after {timeout} s.")
+                if process.poll() is not None:
+                    raise RuntimeError(f"Server exited with code {process.returncode}.")
+                attempts += 1
+                try:
+                    response = client.post('/make_preds/', content=body)
+                except httpx.TransportError:
+                    time.sleep(0.01)
+                    continue
+                if response.status_code == 200:
+                    first_prediction = time.perf_counter() - start
+                    break
+                time.sleep(0.01)
+            report = client.get('/startup').json()
+    finally:
+        process.terminate()
+        process.wait()
+
+    return {"first_prediction_seconds": first_prediction, "attempts": attempts, **report}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--artifact', action='store_true')
+    parser.add_argument('--exog-mode', choices=['snapshot', 'query'], default='snapshot')
+    parser.add_argument('--timeout', type=float, default=60)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='bench-startup-')
+    env = {
+        **os.environ,
+        "EXOG_LOCAL_PATH": write_exog_fixture(os.path.join(tmp, 'exog.db')),
+        "EXOG_MODE": args.exog_mode,
+        "SERIES_DB_PATH": os.path.join(tmp, 'series.db'),
+        "PYTHONWARNINGS": "ignore",
+    }
+    if args.artifact:
+        from artifact import export_forecaster
+        from skforecast.utils import load_forecaster
+
+        forecaster = load_forecaster(os.path.join(HERE, 'forecaster.py'), verbose=False)
+        env["FORECASTER_PATH"] = export_forecaster(forecaster, os.path.join(tmp, 'artifact'))
+
+    with open(os.path.join(HERE, 'last_window.json'), 'rb') as f:
+        body = f.read()
+
+    runs = []
+    for _ in range(args.repeats):
+        run = run_once(env, body, args.timeout)
+        runs.append(run)
+        print(json.dumps({"artifact": args.artifact, "exog_mode": args.exog_mode, **run}))
+
+    print(json.dumps({
+        "artifact": args.artifact,
+        "exog_mode": args.exog_mode,
+        "repeats": args.repeats,
+        "median_first_prediction_seconds": float(np.median([r["first_prediction_seconds"] for r in runs])),
+        "median_import_seconds": float(np.median([r["import_seconds"] for r in runs])),
+        "median_startup_seconds": float(np.median([r["startup_seconds"] for r in runs])),
+    }))
+
+
+if __name__ == '__main__':
+    main()
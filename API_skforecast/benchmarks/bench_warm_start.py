@@ -0,0 +1,90 @@
+"""
+Fold-by-fold timings of refit backtesting with a growing training window:
+every fold refitted against `backtesting.backtesting_forecaster_warm_start`,
+on the daily bitcoin closing price. Regressors in `--returns` are backtested
+on the log returns (%) instead: SGD needs scaled data, and trees cannot
+extrapolate, so on the trending log price the trees kept from earlier folds
+predict levels already left behind.
+
+    cd API_skforecast
+    python benchmarks/bench_warm_start.py --regressors ridge sgd forest
+
+`Ridge` updates give the same model as a refit. Forests and `partial_fit`
+give other models, so their metric is reported next to the refit one.
+"""
+import argparse
+import json
+import os
+import sys
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backtesting import backtesting_forecaster_warm_start
+from benchmarks.fixtures import btc_daily
+from skforecast.ForecasterAutoreg import ForecasterAutoreg
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import Ridge, SGDRegressor
+
+warnings.filterwarnings('ignore')
+
+REGRESSORS = {
+    'ridge': lambda: Ridge(alpha=1.0),
+    'sgd': lambda: SGDRegressor(random_state=123),
+    'forest': lambda: RandomForestRegressor(n_estimators=100, max_depth=8, random_state=123),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--regressors', nargs='+', choices=list(REGRESSORS), default=list(REGRESSORS))
+    parser.add_argument('--lags', type=int, default=30)
+    parser.add_argument('--steps', type=int, default=12)
+    parser.add_argument('--n-obs', type=int, default=1500)
+    parser.add_argument('--initial-train-size', type=int, default=1000)
+    parser.add_argument('--returns', nargs='*', default=['sgd', 'forest'])
+    parser.add_argument('--n-jobs', type=int, default=1)
+    args = parser.parse_args()
+
+    close = btc_daily()['closing_price'].iloc[-args.n_obs:]
+    for name in args.regressors:
+        y = np.log(close).diff().dropna() * 100 if name in args.returns else np.log(close)
+        forecaster = ForecasterAutoreg(regressor=REGRESSORS[name](), lags=args.lags)
+        kwargs = dict(
+                     forecaster         = forecaster,
+                     y                  = y,
+                     initial_train_size = args.initial_train_size,
+                     steps              = args.steps,
+                     metric             = 'mean_absolute_error',
+                     n_jobs             = args.n_jobs
+                 )
+        refit_metric, refit_pred, refit_timings = backtesting_forecaster_warm_start(
+                                                      warm_start=False, **kwargs
+                                                  )
+        warm_metric, warm_pred, warm_timings = backtesting_forecaster_warm_start(**kwargs)
+
+        refit_seconds = refit_timings['seconds'].to_numpy()
+        warm_seconds = warm_timings['seconds'].to_numpy()
+        print(json.dumps({
+            "regressor": name,
+            "strategy": warm_timings.attrs['strategy'],
+            "folds": len(warm_seconds),
+            "refit_seconds": float(refit_seconds.sum()),
+            "warm_start_seconds": float(warm_seconds.sum()),
+            "speedup": float(refit_seconds.sum() / warm_seconds.sum()),
+            "refit_ms_per_fold": float(refit_seconds[1:].mean() * 1e3),
+            "update_ms_per_fold": float(warm_seconds[1:].mean() * 1e3),
+            "refit_metric": refit_metric,
+            "warm_start_metric": warm_metric,
+            "max_abs_pred_diff": float(np.abs(refit_pred['pred'] - warm_pred['pred']).max()),
+            "fold_ms": {
+                "train_size": warm_timings['train_size'].tolist()[::10],
+                "refit": np.round(refit_seconds[::10] * 1e3, 2).tolist(),
+                "warm_start": np.round(warm_seconds[::10] * 1e3, 2).tolist(),
+            },
+        }))
+
+
+if __name__ == '__main__':
+    main()
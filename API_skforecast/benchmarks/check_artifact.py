@@ -0,0 +1,60 @@
+"""
+Round-trip check of the artifact format, quick enough to run on every change
+to `artifact.py`, `forest.py` or `engine.py`.
+
+    cd API_skforecast
+    python benchmarks/check_artifact.py
+
+Exports `forecaster.py` to a temporary artifact, loads it with
+`load_artifact` and checks that `predict_windows` gives identical
+predictions for a few windows and horizons, and that the in-sample
+residuals are kept. Exits with status 1 on any difference.
+"""
+import os
+import sys
+import tempfile
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from artifact import export_forecaster, load_artifact
+from benchmarks.bench_engine import make_windows
+from benchmarks.fixtures import exog_test
+from engine import predict_windows
+from exog import preprocess_exog
+from skforecast.utils import load_forecaster
+
+warnings.filterwarnings('ignore')
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main() -> int:
+    forecaster = load_forecaster(os.path.join(HERE, 'forecaster.py'), verbose=False)
+    exog = preprocess_exog(exog_test())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = export_forecaster(forecaster, os.path.join(tmp, 'forecaster_artifact'))
+        for mmap in (True, False):
+            artifact = load_artifact(path, mmap=mmap)
+            windows = make_windows(forecaster, 8)
+            end_dates = forecaster.last_window.index[[-1] * len(windows)]
+            steps = np.array([1, 2, 3, 5, 8, 12, 1, 12])
+            expected = predict_windows(forecaster, list(windows), end_dates, steps, exog)
+            result = predict_windows(artifact, list(windows), end_dates, steps, exog)
+            if not np.array_equal(expected, result, equal_nan=True):
+                print(f"FAIL: predictions differ (mmap={mmap}), "
+                      f"max abs diff {np.nanmax(np.abs(expected - result))}")
+                return 1
+            if not np.array_equal(forecaster.in_sample_residuals, artifact.in_sample_residuals):
+                print(f"FAIL: in-sample residuals differ (mmap={mmap})")
+                return 1
+
+    print("OK: artifact round trip gives identical predictions")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
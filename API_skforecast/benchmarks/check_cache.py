@@ -0,0 +1,52 @@
+"""
+Check that forecast cache entries are only dropped for the model whose
+version changed.
+
+    cd API_skforecast
+    python benchmarks/check_cache.py
+
+Entries of a model-store model must survive new versions of the default
+model and of other models, and a model's own entries must be dropped when
+its model or exog version changes. Exits with status 1 on any failure.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cache import ForecastCache
+
+
+def main() -> int:
+    cache = ForecastCache()
+    cache.sync_versions('m1', 'e1', tag='prod/v1')
+    cache.set('k1', 1, tag='prod/v1')
+    cache.sync_versions('o1', 'e1', tag='other/v1')
+    cache.set('k2', 2, tag='other/v1')
+    cache.sync_versions('d1', 'e1')
+    cache.set('k3', 3)
+
+    checks = []
+    # New versions of the default model keep the other models' entries
+    cache.sync_versions('d2', 'e1')
+    checks.append(("default model change keeps model entries",
+                   cache.get('k1') == 1 and cache.get('k2') == 2))
+    checks.append(("default model change drops its entries", cache.get('k3') is None))
+    # A new exog version of one model keeps the others
+    cache.sync_versions('m1', 'e2', tag='prod/v1')
+    checks.append(("exog change drops that model's entries", cache.get('k1') is None))
+    checks.append(("exog change keeps other models' entries", cache.get('k2') == 2))
+    cache.clear()
+    checks.append(("clear drops every entry", cache.get('k2') is None))
+
+    failed = [name for name, ok in checks if not ok]
+    for name in failed:
+        print(f"FAIL: {name}")
+    if failed:
+        return 1
+    print("OK: cache entries are only dropped for the model whose version changed")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
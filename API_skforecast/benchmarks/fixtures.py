@@ -0,0 +1,73 @@
+"""
+Local stand-in for the BigQuery exogenous table, and the bitcoin dataset
+used by the backtesting benchmarks.
+
+The exogenous values are the 36 test months of the `h2o_exog` dataset used in
+`skforecast_create_model.ipynb`, the same rows stored in BigQuery.
+
+    python benchmarks/fixtures.py exog_test.db
+"""
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from exog import LocalBackend
+
+EXOG_1 = [
+    1.4157557 , 1.3983043 , 1.3861742 , 1.3631547 , 1.3610089 ,
+    1.4173162 , 1.4751263 , 1.4667893 , 1.4679604 , 1.4476982 ,
+    1.4410051 , 1.4201524 , 1.39911   , 1.4013705 , 1.3860182 ,
+    1.3867723 , 1.374507  , 1.4277988 , 1.4794348 , 1.475246  ,
+    1.4649453 , 1.4413243 , 1.4274189 , 1.4062475 , 1.402091  ,
+    1.39308765, 1.39338201, 1.39237462, 1.38639615, 1.44427975,
+    1.49583405, 1.51584025, 1.50625795, 1.50525325, 1.49146435,
+    1.45985611
+]
+
+EXOG_2 = [
+    1.4469884 , 1.5177698 , 1.602616  , 1.668975  , 1.7303688 ,
+    1.787644  , 1.8324828 , 1.7309626 , 1.6669458 , 1.5650276 ,
+    1.4943662 , 1.407822  , 1.4672574 , 1.5357952 , 1.6070088 ,
+    1.6791784 , 1.741192  , 1.7883402 , 1.8230744 , 1.7434832 ,
+    1.6507122 , 1.5414566 , 1.4664976 , 1.3894206 , 1.4606988 ,
+    1.5354631 , 1.64530742, 1.71825165, 1.78337171, 1.82786071,
+    1.85620501, 1.78637309, 1.69426426, 1.6271348 , 1.555068  ,
+    1.4635072
+]
+
+
+def exog_test() -> pd.DataFrame:
+    """
+    Raw exogenous table, with the same layout as the BigQuery one.
+    """
+    return pd.DataFrame({
+        'idx': pd.date_range('2005-07-01', periods=len(EXOG_1), freq='MS').astype(str),
+        'exog_1': EXOG_1,
+        'exog_2': EXOG_2
+    })
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+BTC_CSV = os.path.join(ROOT, '00 - Cienciadedatos', 'datasets', 'btc_042013_092021.csv')
+
+
+def btc_daily(columns=('closing_price',)) -> pd.DataFrame:
+    """
+    Daily bitcoin data of the `00 - Cienciadedatos` notebooks (April 2013
+    to September 2021), with a daily frequency.
+    """
+    data = pd.read_csv(BTC_CSV, usecols=['Date', *columns], parse_dates=['Date'])
+
+    return data.set_index('Date').asfreq('D')[list(columns)].astype(float)
+
+
+def write_exog_fixture(path: str) -> str:
+    LocalBackend(path).write(exog_test())
+
+    return path
+
+
+if __name__ == '__main__':
+    print(write_exog_fixture(sys.argv[1] if len(sys.argv) > 1 else 'exog_test.db'))
@@ -0,0 +1,229 @@
+"""
+Load test of the forecast API without BigQuery credentials.
+
+The app is started in-process (lifespan included) with the exog provider
+pointed at the local fixture of `benchmarks/fixtures.py`, and an async
+`httpx` client replays `last_window.json`-style payloads at a fixed
+concurrency through the ASGI transport. Latency quantiles, requests per
+second and error rates are written as JSON, to compare releases.
+
+    cd API_skforecast
+    python benchmarks/loadtest.py --concurrency 1 8 32 --requests 2000 --output load.json
+
+- `--windows`: number of distinct windows replayed. With `1` every request
+  after the first is a forecast cache hit; use `--no-cache` to measure the
+  prediction path.
+- `--layout`: `dict` (the original `{"y": {...}}` body) or `columnar`.
+- `--microbatch`: enable the micro-batching dispatcher (`MICROBATCH=1`).
+- `--exog-mode`: `snapshot` or `query` (`EXOG_MODE`); the report includes
+  the rows and bytes read from the exog backend.
+- `--url`: send the requests to a running server instead, for example
+  `uvicorn main:app` started with `EXOG_LOCAL_PATH=exog_test.db`.
+
+Client and server share the event loop in-process, so absolute numbers are
+lower than with a separate uvicorn process; they are meant to be compared
+between runs on the same machine.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+from collections import Counter
+from typing import List, Optional
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, HERE)
+from benchmarks.fixtures import write_exog_fixture
+
+warnings.filterwarnings('ignore')
+
+
+def make_payloads(n_windows: int, layout: str='dict', seed: int=123) -> List[bytes]:
+    """
+    `n_windows` request bodies: the window of `last_window.json` and
+    perturbed copies of it with the same dates.
+    """
+    with open(os.path.join(HERE, 'last_window.json')) as f:
+        y = json.load(f)['y']
+    dates = list(y)
+    base = np.array(list(y.values()))
+    rng = np.random.default_rng(seed)
+    noise = rng.normal(loc=1, scale=0.05, size=(n_windows, len(base)))
+    noise[0] = 1
+
+    payloads = []
+    for values in base * noise:
+        if layout == 'columnar':
+            body = {"start": dates[0], "freq": "MS", "values": values.tolist()}
+        else:
+            body = {"y": dict(zip(dates, values.tolist()))}
+        payloads.append(json.dumps(body).encode())
+
+    return payloads
+
+
+async def run_level(
+    client,
+    payloads: List[bytes],
+    concurrency: int,
+    n_requests: int,
+    steps: int
+) -> dict:
+    """
+    Send `n_requests` requests with `concurrency` clients in flight and
+    summarize latencies and status codes.
+    """
+    latencies = []
+    statuses = Counter()
+    counter = iter(range(n_requests))
+    url = f"/make_preds/?steps={steps}"
+    headers = {"content-type": "application/json"}
+
+    async def worker():
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                response = await client.post(
+                               url, content=payloads[i % len(payloads)], headers=headers
+                           )
+                status = response.status_code
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    ms = np.array(latencies) * 1e3
+    errors = n_requests - statuses.get(200, 0)
+
+    return {
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "seconds": elapsed,
+        "requests_per_second": n_requests / elapsed,
+        "latency_ms": {
+            "mean": float(ms.mean()),
+            "p50": float(np.percentile(ms, 50)),
+            "p90": float(np.percentile(ms, 90)),
+            "p99": float(np.percentile(ms, 99)),
+            "max": float(ms.max()),
+        },
+        "errors": errors,
+        "error_rate": errors / n_requests,
+        "status_codes": {str(k): v for k, v in sorted(statuses.items(), key=str)},
+    }
+
+
+async def run(args, url: Optional[str]=None) -> dict:
+    """
+    Warm up, then run every concurrency level. In-process runs also report
+    the cache and micro-batching counters of the app.
+    """
+    import httpx
+
+    payloads = make_payloads(args.windows, args.layout, args.seed)
+    limits = httpx.Limits(max_connections=max(args.concurrency))
+
+    async def levels(client):
+        # Warm up: first load of the model, caches and thread pools
+        await run_level(client, payloads, 1, args.warmup, args.steps)
+        results = []
+        for concurrency in args.concurrency:
+            results.append(
+                await run_level(client, payloads, concurrency, args.requests, args.steps)
+            )
+        return results
+
+    if url is not None:
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+            return {"levels": await levels(client)}
+
+    import main
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://loadtest", timeout=60
+        ) as client:
+            results = await levels(client)
+
+    return {
+        "levels": results,
+        "cache": main.forecast_cache.stats(),
+        "batching": main.batcher.stats() if main.batcher else None,
+        "exog": main.exog_provider.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--steps', type=int, default=3)
+    parser.add_argument('--windows', type=int, default=100)
+    parser.add_argument('--layout', choices=['dict', 'columnar'], default='dict')
+    parser.add_argument('--seed', type=int, default=123)
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--microbatch', action='store_true')
+    parser.add_argument('--exog-mode', choices=['snapshot', 'query'], default='snapshot')
+    parser.add_argument('--url', default=None)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    # The app reads its configuration when `main` is imported. Its SQLite
+    # files go to a temporary directory, not to the source tree.
+    os.chdir(HERE)
+    tmp = None
+    if args.url is None:
+        tmp = tempfile.mkdtemp(prefix='loadtest-')
+        os.environ['EXOG_LOCAL_PATH'] = write_exog_fixture(os.path.join(tmp, 'exog.db'))
+        os.environ['SERIES_DB_PATH'] = os.path.join(tmp, 'series.db')
+        os.environ['MICROBATCH'] = '1' if args.microbatch else '0'
+        os.environ['EXOG_MODE'] = args.exog_mode
+        if args.no_cache:
+            os.environ['FORECAST_CACHE_SIZE'] = '0'
+
+    try:
+        results = asyncio.run(run(args, url=args.url))
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+    report = {
+        "config": {
+            "target": args.url or "in-process",
+            "steps": args.steps,
+            "windows": args.windows,
+            "layout": args.layout,
+            "cache": not args.no_cache,
+            "microbatch": args.microbatch,
+            "exog_mode": args.exog_mode,
+            "warmup": args.warmup,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        **results,
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""
+Bounded in-process cache of forecast results.
+
+Entries are keyed by a hash of everything that determines a forecast: the
+window values and end date, the model version and the exog snapshot version.
+Because both versions are part of the key, a new model or exog snapshot never
+reads old entries; `invalidate()` drops them so they do not hold memory until
+they expire. Entries are tagged by model (`DEFAULT_TAG` for the default
+one), so a new version of one model never drops the entries of the others.
+
+The horizon is not part of the key. Each entry holds the predictions of the
+longest horizon computed so far for that window: a shorter request is a
+slice of it and a longer one resumes the recursion from its last step (see
+`ForecastCache.record_steps`).
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+import numpy as np
+
+# Tag of the forecasts of the default model (`FORECASTER_PATH`)
+DEFAULT_TAG = '__default__'
+
+
+def forecast_key(
+    values: np.ndarray,
+    end: Any,
+    model_version: str,
+    exog_version: str
+) -> str:
+    """
+    Hash identifying the recursive state of a forecast: the window and the
+    model and exog used to extend it.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    digest.update(f"|{end}|{model_version}|{exog_version}".encode())
+
+    return digest.hexdigest()
+
+
+class ForecastCache:
+    """
+    LRU cache with a maximum number of entries and a time to live.
+
+    Parameters
+    ----------
+    max_size : int, default `10000`
+        Maximum number of entries. The least recently used one is evicted
+        when it is exceeded.
+
+    ttl : float, default `300`
+        Seconds an entry stays valid.
+
+    """
+
+    def __init__(self, max_size: int=10000, ttl: float=300) -> None:
+
+        self.max_size       = max_size
+        self.ttl            = ttl
+        self.hits           = 0
+        self.misses         = 0
+        self.evictions      = 0
+        self.steps_cached   = 0
+        self.steps_computed = 0
+        self._versions      = {}
+        self._data          = OrderedDict()
+        self._lock          = threading.Lock()
+
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Return the cached value or `None` if it is missing or expired.
+        """
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] <= now:
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+
+            return item[1]
+
+
+    def set(self, key: Hashable, value: Any, tag: str=DEFAULT_TAG) -> None:
+        """
+        Store `value`. `tag` groups entries that `invalidate` can drop together,
+        for example all the forecasts of one model.
+        """
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (expires, value, tag)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+
+    def record_steps(self, cached: int, computed: int) -> None:
+        """
+        Count the horizon steps of a request served from a cached entry and
+        those that had to be predicted.
+        """
+        with self._lock:
+            self.steps_cached += cached
+            self.steps_computed += computed
+
+
+    def invalidate(self, tag: str) -> None:
+        """
+        Drop the entries stored with `tag`.
+        """
+        with self._lock:
+            for key in [k for k, item in self._data.items() if item[2] == tag]:
+                del self._data[key]
+
+
+    def clear(self) -> None:
+        """
+        Drop every entry, whatever its tag.
+        """
+        with self._lock:
+            self._data.clear()
+
+
+    def sync_versions(
+        self,
+        model_version: str,
+        exog_version: str,
+        tag: str=DEFAULT_TAG
+    ) -> None:
+        """
+        Drop the entries of `tag` if its model or exog snapshot changed since
+        the last call.
+        """
+        versions = (model_version, exog_version)
+        if self._versions.get(tag) != versions:
+            self.invalidate(tag)
+            self._versions[tag] = versions
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._data)
+        total = self.hits + self.misses
+
+        return {
+            "size": size,
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+            "steps_cached": self.steps_cached,
+            "steps_computed": self.steps_computed,
+        }
@@ -0,0 +1,122 @@
+"""
+Bounded executor for the CPU-bound part of the requests.
+
+Predictions run in a dedicated thread pool sized for the machine instead of
+Starlette's shared threadpool. Requests waiting for a worker are counted and,
+once more than `max_queue` are waiting, new ones are rejected right away with
+`Overloaded` so the API can answer 503 instead of letting latency grow
+without bound.
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+
+class Overloaded(Exception):
+    """
+    Raised when the prediction queue is full.
+
+    Parameters
+    ----------
+    retry_after : int
+        Seconds the client should wait before retrying.
+
+    """
+
+    def __init__(self, retry_after: int) -> None:
+
+        super().__init__("Prediction queue is full, retry later.")
+        self.retry_after = retry_after
+
+
+class PredictionExecutor:
+    """
+    Thread pool with an admission limit.
+
+    Parameters
+    ----------
+    max_workers : int, default `None`
+        Number of prediction threads. If `None`, the number of CPUs.
+
+    max_queue : int, default `64`
+        Requests allowed to wait for a free worker. Further requests raise
+        `Overloaded`.
+
+    retry_after : int, default `1`
+        Value of the `Retry-After` header sent with rejected requests.
+
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int]=None,
+        max_queue: int=64,
+        retry_after: int=1
+    ) -> None:
+
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue   = max_queue
+        self.retry_after = retry_after
+        self.rejected    = 0
+        self._pending    = 0
+        self._executor   = ThreadPoolExecutor(
+                               max_workers        = self.max_workers,
+                               thread_name_prefix = 'predict'
+                           )
+
+
+    @property
+    def active(self) -> int:
+        """
+        Requests running in the executor. Together with `queue_depth`, all
+        the requests admitted and not finished.
+        """
+        return min(self._pending, self.max_workers)
+
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        Requests waiting for a free worker.
+        """
+        return max(0, self._pending - self.max_workers)
+
+
+    async def run(self, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+        """
+        Run `fn(*args, **kwargs)` in the pool and await the result. Must be
+        called from the event loop, which is the only place `_pending` is
+        modified.
+        """
+        if self._pending >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise Overloaded(self.retry_after)
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                       self._executor, functools.partial(fn, *args, **kwargs)
+                   )
+        finally:
+            self._pending -= 1
+
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+def executor_from_env() -> PredictionExecutor:
+    """
+    Build the executor from `PREDICT_WORKERS`, `PREDICT_MAX_QUEUE` and
+    `PREDICT_RETRY_AFTER`.
+    """
+    workers = os.environ.get('PREDICT_WORKERS')
+
+    return PredictionExecutor(
+               max_workers = int(workers) if workers else None,
+               max_queue   = int(os.environ.get('PREDICT_MAX_QUEUE', 64)),
+               retry_after = int(os.environ.get('PREDICT_RETRY_AFTER', 1))
+           )
@@ -0,0 +1,279 @@
+"""
+Content negotiation and encoders of forecast responses.
+
+Forecast endpoints build their content as a dict whose leaves are prediction
+Series (see `engine.predictions_to_series`) and the `Accept` header of the
+request picks the encoding:
+
+- `application/json` (default): the layout of the original API,
+  `{"pred": {"2005-07-01T00:00:00": 0.86, ...}}`, written with orjson. Dates
+  are ISO 8601 with seconds and without time zone, whatever the endpoint.
+- `application/x-msgpack`: the same document with every Series in the epoch
+  layout of the request bodies, `{"index": [ms since epoch, ...], "freq":
+  "MS", "values": [...]}`. Needs `msgpack`.
+- `application/vnd.apache.arrow.stream`: an Arrow IPC stream with one row per
+  predicted step and columns `key`, `ts` and `value`. `key` is the dict key of
+  the Series in the document (the window key in batches, the quantile in
+  intervals, `pred` otherwise). The other fields of the document go to the
+  schema metadata, JSON encoded. Needs `pyarrow`.
+
+msgpack and pyarrow are optional and only imported on first use. An encoding
+whose package is not installed is not offered.
+"""
+import importlib
+import importlib.util
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+    import json
+
+JSON    = 'application/json'
+MSGPACK = 'application/x-msgpack'
+ARROW   = 'application/vnd.apache.arrow.stream'
+
+# Encodings in order of preference and the optional package they need
+ENCODINGS = {JSON: None, MSGPACK: 'msgpack', ARROW: 'pyarrow'}
+
+
+class NotAcceptable(ValueError):
+    """
+    Raised when none of the encodings accepted by the client is available.
+    """
+
+
+def _installed(package: Optional[str]) -> bool:
+    return package is None or importlib.util.find_spec(package) is not None
+
+
+def available_media_types() -> List[str]:
+    """
+    Media types whose encoder can be used, most preferred first.
+    """
+    return [media_type for media_type, package in ENCODINGS.items() if _installed(package)]
+
+
+def _parse_accept(accept: str) -> List[Tuple[str, float]]:
+    """
+    `(media range, q)` pairs of an `Accept` header, in header order.
+    """
+    ranges = []
+    for item in accept.split(','):
+        media_range, *params = [part.strip() for part in item.split(';')]
+        if not media_range:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        ranges.append((media_range.lower(), q))
+
+    return ranges
+
+
+def _matches(media_range: str, media_type: str) -> bool:
+    if media_range in ('*/*', media_type):
+        return True
+    kind, _, subtype = media_range.partition('/')
+
+    return subtype == '*' and media_type.startswith(kind + '/')
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """
+    Encoding of the response for an `Accept` header.
+
+    The media type with the highest `q` wins; ties go to the one listed first
+    by the client and then to the order of `ENCODINGS`. Each media type takes
+    the `q` of its most specific matching range. Without `Accept`, JSON.
+
+    Parameters
+    ----------
+    accept : str
+        Value of the `Accept` header, `None` if it is missing.
+
+    Returns
+    -------
+    media_type : str
+        One of `JSON`, `MSGPACK` or `ARROW`.
+
+    """
+    if not accept or not accept.strip():
+        return JSON
+
+    ranges = _parse_accept(accept)
+    best, best_rank = None, None
+    for order, media_type in enumerate(ENCODINGS):
+        # Most specific range first: exact type, `type/*`, `*/*`
+        matching = [
+            (media_range.count('*'), position, q)
+            for position, (media_range, q) in enumerate(ranges)
+            if _matches(media_range, media_type)
+        ]
+        if not matching:
+            continue
+        _, position, q = min(matching)
+        if q <= 0 or not _installed(ENCODINGS[media_type]):
+            continue
+        rank = (-q, position, order)
+        if best_rank is None or rank < best_rank:
+            best, best_rank = media_type, rank
+
+    if best is None:
+        missing = [
+            f"`{media_type}` needs the `{package}` package"
+            for media_type, package in ENCODINGS.items()
+            if package is not None and not _installed(package)
+            and any(media_range == media_type and q > 0 for media_range, q in ranges)
+        ]
+        raise NotAcceptable(
+            f"None of the accepted media types is available ({accept}). "
+            f"Available: {', '.join(available_media_types())}."
+            + (f" {'; '.join(missing)}." if missing else "")
+        )
+
+    return best
+
+
+def _iso_keys(index: pd.DatetimeIndex) -> List[str]:
+    if index.tz is not None:
+        index = index.tz_convert(None)
+
+    return np.datetime_as_string(index.values, unit='s').tolist()
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, pd.Series):
+        return dict(zip(_iso_keys(obj.index), obj.to_numpy(dtype=float).tolist()))
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def encode_json(content: dict) -> bytes:
+    """
+    JSON document of `content`, Series as `{iso date: value}` dicts.
+    """
+    if orjson is not None:
+        return orjson.dumps(content, default=_json_default)
+
+    return json.dumps(content, default=_json_default, separators=(',', ':')).encode()
+
+
+def _epoch_ms(index: pd.DatetimeIndex) -> np.ndarray:
+    if index.tz is not None:
+        index = index.tz_convert(None)
+
+    return index.values.astype('datetime64[ms]').view(np.int64)
+
+
+def _msgpack_default(obj: Any) -> Any:
+    if isinstance(obj, pd.Series):
+        return {
+            "index": _epoch_ms(obj.index).tolist(),
+            "freq": obj.index.freqstr,
+            "values": obj.to_numpy(dtype=float).tolist()
+        }
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Type is not msgpack serializable: {type(obj).__name__}")
+
+
+def encode_msgpack(content: dict) -> bytes:
+    """
+    msgpack document of `content`, Series in the epoch layout.
+    """
+    msgpack = importlib.import_module('msgpack')
+
+    return msgpack.packb(content, default=_msgpack_default)
+
+
+def _split(content: dict, leaves: list, metadata: dict) -> None:
+    """
+    Collect the Series of `content` as `(key, series)` in `leaves` and the
+    other fields in `metadata`.
+    """
+    for key, value in content.items():
+        if isinstance(value, pd.Series):
+            leaves.append((str(key), value))
+        elif isinstance(value, dict) and (
+            not value or any(isinstance(v, (pd.Series, dict)) for v in value.values())
+        ):
+            # A container of Series (e.g. the windows of a batch)
+            _split(value, leaves, metadata)
+        else:
+            metadata[str(key)] = value
+
+
+def encode_arrow(content: dict) -> bytes:
+    """
+    Arrow IPC stream with the Series of `content` stacked as `key`, `ts` and
+    `value` columns.
+    """
+    pa = importlib.import_module('pyarrow')
+
+    leaves, metadata = [], {}
+    _split(content, leaves, metadata)
+    lengths = [len(series) for _, series in leaves]
+    if leaves:
+        ts = np.concatenate([_epoch_ms(series.index) for _, series in leaves])
+        values = np.concatenate([series.to_numpy(dtype=float) for _, series in leaves])
+    else:
+        ts = np.empty(0, dtype=np.int64)
+        values = np.empty(0, dtype=float)
+
+    # Keys are stored once and referenced by every row
+    keys = pa.DictionaryArray.from_arrays(
+               np.repeat(np.arange(len(leaves), dtype=np.int32), lengths),
+               pa.array([key for key, _ in leaves], type=pa.string())
+           )
+    table = pa.table({
+                'key': keys,
+                'ts': pa.array(ts, type=pa.timestamp('ms')),
+                'value': pa.array(values, type=pa.float64())
+            })
+    table = table.replace_schema_metadata(
+                {key: encode_json(value) for key, value in metadata.items()}
+            )
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+
+    return sink.getvalue().to_pybytes()
+
+
+ENCODERS = {JSON: encode_json, MSGPACK: encode_msgpack, ARROW: encode_arrow}
+
+
+def encode(content: dict, media_type: str) -> bytes:
+    """
+    Encode a forecast document.
+
+    Parameters
+    ----------
+    content : dict
+        Document whose leaves are prediction Series or JSON-compatible values.
+
+    media_type : str
+        One of `JSON`, `MSGPACK` or `ARROW`, usually from `negotiate`.
+
+    Returns
+    -------
+    body : bytes
+
+    """
+    return ENCODERS[media_type](content)
@@ -0,0 +1,425 @@
+"""
+Batched recursive prediction for `ForecasterAutoreg`.
+
+`ForecasterAutoreg.predict` forecasts one series at a time and calls the
+regressor once per step. The functions in this module forecast many last
+windows together: at each step the lags of every series are stacked in a
+single matrix and the regressor is called once for all of them. Each row
+follows the same recursion as `predict`, so results are identical.
+
+`RecursivePredictor` works on NumPy arrays only. The last values of every
+series live in a preallocated (n_windows, window_size) ring buffer: each
+prediction overwrites the oldest value of its row and the lags are read
+relative to a moving head, so nothing is shifted or reallocated between steps.
+"""
+import warnings
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+
+from forest import CompiledRegressor, can_flatten
+
+
+def exog_for_windows(
+    exog: pd.DataFrame,
+    end_dates: pd.DatetimeIndex,
+    steps: np.ndarray,
+    freq: str
+) -> np.ndarray:
+    """
+    Gather, for every window, the exogenous rows of the `steps` periods that
+    follow its end date.
+
+    Parameters
+    ----------
+    exog : pandas DataFrame
+        Exogenous variables indexed by date, already aligned to `freq`.
+
+    end_dates : pandas DatetimeIndex
+        Last date of every window.
+
+    steps : numpy ndarray
+        Number of steps predicted for every window.
+
+    freq : str
+        Frequency of the series.
+
+    Returns
+    -------
+    exog_values : numpy ndarray
+        Array of shape (n_windows, max(steps), n_exog). Positions beyond the
+        horizon of a window are filled with its last needed row.
+
+    """
+    starts = end_dates + to_offset(freq)
+    positions = exog.index.get_indexer(starts)
+    missing = positions < 0
+    if missing.any():
+        raise ValueError(
+            (f"`exog` does not cover the period after the last window. "
+             f"No exogenous values for {list(starts[missing].astype(str))}.")
+        )
+    short = positions + steps > len(exog)
+    if short.any():
+        raise ValueError(
+            (f"`exog` does not have enough values to predict the requested steps. "
+             f"Last available date is {exog.index[-1]}.")
+        )
+
+    max_steps = int(steps.max())
+    rows = positions[:, None] + np.minimum(np.arange(max_steps), steps[:, None] - 1)
+    values = exog.to_numpy(dtype=float)
+    if np.isnan(values[rows]).any():
+        raise ValueError("`exog` has missing values in the requested period.")
+
+    return values[rows]
+
+
+def predict_batch(
+    forecaster,
+    last_windows: List[pd.Series],
+    steps: List[int],
+    exog: Optional[pd.DataFrame]=None,
+    predictor: Optional['RecursivePredictor']=None
+) -> List[pd.Series]:
+    """
+    Predict several last windows with one regressor call per step.
+
+    Parameters
+    ----------
+    forecaster : ForecasterAutoreg
+        Fitted forecaster.
+
+    last_windows : list of pandas Series
+        Last observed values of every series, indexed by date with the
+        frequency of the forecaster.
+
+    steps : list of int
+        Number of steps predicted for every series.
+
+    exog : pandas DataFrame, default `None`
+        Exogenous variables covering the period after every window.
+
+    predictor : RecursivePredictor, default `None`
+        Predictor built from `forecaster`. If `None`, a new one is created.
+
+    Returns
+    -------
+    predictions : list of pandas Series
+        Predictions for every window, in the same order and format as
+        `forecaster.predict`.
+
+    """
+    if len(last_windows) != len(steps):
+        raise ValueError("`last_windows` and `steps` must have the same length.")
+    if len(last_windows) == 0:
+        return []
+
+    end_dates = pd.DatetimeIndex([lw.index[-1] for lw in last_windows])
+    predictions = predict_windows(
+                      forecaster   = forecaster,
+                      last_windows = [lw.to_numpy(dtype=float) for lw in last_windows],
+                      end_dates    = end_dates,
+                      steps        = steps,
+                      exog         = exog,
+                      predictor    = predictor
+                  )
+
+    return [
+        predictions_to_series(predictions[i, :n_steps], end_dates[i], forecaster.index_freq)
+        for i, n_steps in enumerate(steps)
+    ]
+
+
+def predictions_to_series(
+    predictions: np.ndarray,
+    end_date: pd.Timestamp,
+    freq: str
+) -> pd.Series:
+    """
+    Index the predictions of one window with the periods after `end_date`.
+    """
+    index = pd.date_range(
+                start   = end_date + to_offset(freq),
+                periods = len(predictions),
+                freq    = freq
+            )
+
+    return pd.Series(predictions, index=index, name='pred')
+
+
+def predict_windows(
+    forecaster,
+    last_windows: List[np.ndarray],
+    end_dates: pd.DatetimeIndex,
+    steps: List[int],
+    exog: Optional[pd.DataFrame]=None,
+    predictor: Optional['RecursivePredictor']=None,
+    residuals: Optional[np.ndarray]=None
+) -> np.ndarray:
+    """
+    Same as `predict_batch` but with the windows given as arrays of values
+    (oldest first) plus the date of their last value. `residuals`, of shape
+    (n_windows, max(steps)), are added to each step before it is fed back
+    (see `predict_bootstrapping`).
+
+    Returns
+    -------
+    predictions : numpy ndarray
+        Array of shape (n_windows, max(steps)). Positions beyond the horizon
+        of a window are `nan`.
+
+    """
+    steps = np.asarray(steps, dtype=int)
+    if (steps < 1).any():
+        raise ValueError("`steps` must be greater than or equal to 1.")
+
+    window_size = forecaster.window_size
+    for values in last_windows:
+        if len(values) < window_size:
+            raise ValueError(
+                (f"`last_window` must have as many values as needed to "
+                 f"calculate the predictors ({window_size}). Got {len(values)}.")
+            )
+
+    windows = np.vstack([values[-window_size:] for values in last_windows])
+    if np.isnan(windows).any():
+        raise ValueError("`last_window` has missing values.")
+    if forecaster.transformer_y is not None:
+        windows = forecaster.transformer_y.transform(
+                      windows.reshape(-1, 1)
+                  ).reshape(windows.shape)
+
+    if forecaster.included_exog:
+        if exog is None:
+            raise ValueError("Forecaster trained with exogenous variables, `exog` is required.")
+        exog = exog[forecaster.exog_col_names]
+        if forecaster.transformer_exog is not None:
+            from skforecast.utils import transform_dataframe
+            exog = transform_dataframe(
+                       df                = exog,
+                       transformer       = forecaster.transformer_exog,
+                       fit               = False,
+                       inverse_transform = False
+                   )
+        exog_values = exog_for_windows(
+                          exog      = exog,
+                          end_dates = end_dates,
+                          steps     = steps,
+                          freq      = forecaster.index_freq
+                      )
+    else:
+        exog_values = None
+
+    if predictor is None:
+        predictor = RecursivePredictor.from_forecaster(forecaster)
+    predictions = predictor.predict(
+                      windows     = windows,
+                      steps       = steps,
+                      exog_values = exog_values,
+                      residuals   = residuals
+                  )
+
+    if forecaster.transformer_y is not None:
+        predictions = forecaster.transformer_y.inverse_transform(
+                          predictions.reshape(-1, 1)
+                      ).reshape(predictions.shape)
+
+    return predictions
+
+
+def predict_bootstrapping(
+    forecaster,
+    last_window: np.ndarray,
+    end_date: pd.Timestamp,
+    steps: int,
+    n_boot: int=500,
+    exog: Optional[pd.DataFrame]=None,
+    predictor: Optional['RecursivePredictor']=None,
+    random_state: int=123
+) -> np.ndarray:
+    """
+    Bootstrapped paths of one window, as `ForecasterAutoreg.predict_bootstrapping`
+    with in-sample residuals. The `n_boot` paths are rows of the same batch,
+    so the regressor is called once per step for all of them.
+
+    The residuals of every path and step are drawn from a single generator
+    instead of one generator per path, so the paths are not the same as
+    skforecast's for a given `random_state`, but they follow the same
+    distribution.
+
+    Parameters
+    ----------
+    forecaster : ForecasterAutoreg, ForecasterArtifact
+        Fitted forecaster with `in_sample_residuals`.
+
+    last_window : numpy ndarray
+        Last values of the series, oldest first.
+
+    end_date : pandas Timestamp
+        Date of the last value of `last_window`.
+
+    steps : int
+        Number of steps predicted.
+
+    n_boot : int, default `500`
+        Number of bootstrapped paths.
+
+    exog : pandas DataFrame, default `None`
+        Exogenous variables covering the horizon.
+
+    predictor : RecursivePredictor, default `None`
+        Predictor of the forecaster. Built if not given.
+
+    random_state : int, default `123`
+        Seed of the residual draws.
+
+    Returns
+    -------
+    paths : numpy ndarray
+        Array of shape (n_boot, steps).
+
+    """
+    residuals = getattr(forecaster, 'in_sample_residuals', None)
+    if residuals is None or len(residuals) == 0:
+        raise ValueError("Forecaster has no in-sample residuals to bootstrap.")
+
+    rng = np.random.default_rng(random_state)
+    sample = rng.choice(np.asarray(residuals, dtype=float), size=(n_boot, steps), replace=True)
+
+    return predict_windows(
+               forecaster   = forecaster,
+               last_windows = [last_window] * n_boot,
+               end_dates    = pd.DatetimeIndex([end_date] * n_boot),
+               steps        = [steps] * n_boot,
+               exog         = exog,
+               predictor    = predictor,
+               residuals    = sample
+           )
+
+
+class RecursivePredictor:
+    """
+    Recursive multi-window prediction over NumPy arrays.
+
+    Parameters
+    ----------
+    regressor : object
+        Fitted regressor of the forecaster.
+
+    lags : numpy ndarray
+        Lags used as predictors (1 is the last observed value).
+
+    window_size : int
+        Number of past values needed to build the lags.
+
+    """
+
+    def __init__(
+        self,
+        regressor,
+        lags: np.ndarray,
+        window_size: int
+    ) -> None:
+
+        self.regressor   = regressor
+        self.lags        = np.asarray(lags, dtype=int)
+        self.window_size = window_size
+
+
+    @classmethod
+    def from_forecaster(
+        cls,
+        forecaster,
+        compiled: bool=True
+    ) -> 'RecursivePredictor':
+        """
+        Build the predictor of a fitted forecaster. If `compiled` and the
+        regressor is a tree ensemble, it is replaced by a `CompiledRegressor`.
+        """
+        regressor = forecaster.regressor
+        if compiled and can_flatten(regressor):
+            regressor = CompiledRegressor(regressor)
+
+        return cls(
+                   regressor   = regressor,
+                   lags        = forecaster.lags,
+                   window_size = forecaster.window_size
+               )
+
+
+    def predict(
+        self,
+        windows: np.ndarray,
+        steps: np.ndarray,
+        exog_values: Optional[np.ndarray]=None,
+        residuals: Optional[np.ndarray]=None
+    ) -> np.ndarray:
+        """
+        Predict every row of `windows`.
+
+        Parameters
+        ----------
+        windows : numpy ndarray
+            Array of shape (n_windows, window_size) with the last values of
+            every series, oldest first.
+
+        steps : numpy ndarray
+            Number of steps predicted for every window.
+
+        exog_values : numpy ndarray, default `None`
+            Array of shape (n_windows, max(steps), n_exog).
+
+        residuals : numpy ndarray, default `None`
+            Array of shape (n_windows, max(steps)) added to the prediction of
+            every step before it is fed back as a lag (bootstrapping).
+
+        Returns
+        -------
+        predictions : numpy ndarray
+            Array of shape (n_windows, max(steps)). Positions beyond the horizon
+            of a window are `nan`.
+
+        """
+        n_windows, window_size = windows.shape
+        n_lags = len(self.lags)
+        n_exog = 0 if exog_values is None else exog_values.shape[2]
+        max_steps = int(steps.max())
+
+        # Rows sorted by horizon, longest first, so the rows still being
+        # predicted at any step are a contiguous prefix of the buffers.
+        order = np.argsort(-steps, kind='stable')
+        n_active = np.searchsorted(-steps[order], -np.arange(max_steps), side='left')
+
+        buffer = windows[order, -window_size:].astype(float, copy=True)
+        X = np.empty(shape=(n_windows, n_lags + n_exog), dtype=float)
+        if n_exog:
+            exog_values = exog_values[order]
+        if residuals is not None:
+            residuals = residuals[order]
+        predictions = np.full(shape=(n_windows, max_steps), fill_value=np.nan)
+
+        head = 0
+        with warnings.catch_warnings():
+            # Suppress scikit-learn warning: "X does not have valid feature names"
+            warnings.simplefilter("ignore")
+            for i in range(max_steps):
+                n = n_active[i]
+                X[:n, :n_lags] = buffer[:n, (head - self.lags) % window_size]
+                if n_exog:
+                    X[:n, n_lags:] = exog_values[:n, i, :]
+
+                prediction = self.regressor.predict(X[:n]).ravel()
+                if residuals is not None:
+                    prediction = prediction + residuals[:n, i]
+                predictions[:n, i] = prediction
+                # The new value replaces the oldest one of each row
+                buffer[:n, head] = prediction
+                head = (head + 1) % window_size
+
+        unsorted = np.empty_like(predictions)
+        unsorted[order] = predictions
+
+        return unsorted
@@ -0,0 +1,543 @@
+"""
+Exogenous variables provider.
+
+The provider keeps a preprocessed (indexed and frequency aligned) snapshot of
+the exogenous table in memory. A background task refreshes it every `ttl`
+seconds; while a refresh is running, or if it fails, requests keep being served
+from the previous snapshot (stale-while-revalidate).
+
+With `mode='query'` there is no snapshot: every request reads only the
+exogenous columns of the forecaster and the periods of its horizon, with both
+projections pushed into the backend query (`ExogProvider.get_for`). This
+trades a query per request (forecast cache misses only) for reading a
+handful of rows instead of the whole table.
+
+Backends only know how to read the raw table, optionally projected on some
+columns and a date range:
+
+- `BigQueryBackend`: production table in BigQuery.
+- `LocalBackend`: Parquet or SQLite file, used for tests and offline
+  benchmarking.
+
+Rows and bytes read are counted by the provider (`stats()` and the
+`exog_rows_read_total` / `exog_bytes_read_total` metrics).
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import List, NamedTuple, Optional
+
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+BIGQUERY_TABLE = 'ingka-food-analytics-prod.forecast_models.test_javi'
+# Column types BigQuery can partition and cluster by date
+_DATE_TYPES = ('DATE', 'DATETIME', 'TIMESTAMP')
+_COLUMN_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def _check_columns(columns: List[str]) -> List[str]:
+    """
+    Column names are interpolated in the SQL text, so only plain
+    identifiers are accepted.
+    """
+    for column in columns:
+        if not _COLUMN_PATTERN.match(column):
+            raise ValueError(f"Invalid exogenous column name {column!r}.")
+
+    return list(columns)
+
+
+class BigQueryBackend:
+    """
+    Read the exogenous table from BigQuery. The client is created once and
+    reused by every refresh.
+
+    The date range is compared with the index column as it is stored, with
+    a query parameter of the same type, so BigQuery can prune partitions and
+    clustered blocks. Wrapping the column in a `CAST` would make it scan the
+    whole column range.
+
+    Parameters
+    ----------
+    table : str, default `BIGQUERY_TABLE`
+        Fully qualified table name.
+
+    index_type : str, default `None`
+        BigQuery type of the index column (`DATE`, `DATETIME` or
+        `TIMESTAMP`). If `None`, it is read from the table schema on the
+        first filtered query.
+
+    """
+
+    def __init__(self, table: str=BIGQUERY_TABLE, index_type: Optional[str]=None) -> None:
+
+        self.table       = table
+        self.index_type  = None if index_type is None else index_type.upper()
+        self._client     = None
+        self._index_type = {}
+
+
+    def _column_type(self, index_col: str) -> str:
+        """
+        BigQuery type of `index_col`, `index_type` if it was given.
+        """
+        if self.index_type is not None:
+            return self.index_type
+        if index_col not in self._index_type:
+            schema = self._client.get_table(self.table).schema
+            types = {field.name: field.field_type.upper() for field in schema}
+            if index_col not in types:
+                raise ValueError(f"Column '{index_col}' not found in table `{self.table}`.")
+            self._index_type[index_col] = types[index_col]
+
+        return self._index_type[index_col]
+
+
+    def fetch(
+        self,
+        columns: Optional[List[str]]=None,
+        start: Optional[pd.Timestamp]=None,
+        end: Optional[pd.Timestamp]=None,
+        index_col: str='idx'
+    ) -> pd.DataFrame:
+        """
+        Read `index_col` and `columns` (all columns if `None`) for the rows
+        between `start` and `end`, both included. The bytes BigQuery
+        processed are stored in `attrs['bytes_read']` of the result.
+        """
+        from google.cloud import bigquery as bq
+
+        if self._client is None:
+            self._client = bq.Client()
+
+        select = '*'
+        if columns is not None:
+            select = ', '.join(f'`{c}`' for c in _check_columns([index_col, *columns]))
+        where = []
+        parameters = []
+        bounds = [(name, op, value)
+                  for name, op, value in (('start', '>=', start), ('end', '<=', end))
+                  if value is not None]
+        column_type = self._column_type(index_col) if bounds else None
+        for name, op, value in bounds:
+            value = pd.Timestamp(value)
+            if column_type in _DATE_TYPES:
+                # Compare the stored column so partitions can be pruned
+                where.append(f"`{index_col}` {op} @{name}")
+                if column_type == 'DATE':
+                    value = value.date()
+                else:
+                    value = value.to_pydatetime()
+                parameters.append(bq.ScalarQueryParameter(name, column_type, value))
+            else:
+                # Other types (e.g. dates stored as text) cannot partition a
+                # table, so the cast costs no pruning
+                where.append(f"CAST(`{index_col}` AS TIMESTAMP) {op} @{name}")
+                parameters.append(
+                    bq.ScalarQueryParameter(name, 'TIMESTAMP', value.to_pydatetime())
+                )
+
+        query = f"""
+        SELECT {select}
+        FROM `{self.table}`
+        """
+        if where:
+            query += f"WHERE {' AND '.join(where)}"
+
+        job = self._client.query(
+                  query,
+                  job_config = bq.QueryJobConfig(query_parameters=parameters)
+              )
+        data = job.result().to_dataframe()
+        data.attrs['bytes_read'] = job.total_bytes_processed
+
+        return data
+
+
+class LocalBackend:
+    """
+    Read the exogenous table from a local Parquet (`.parquet`) or SQLite
+    (`.db`, `.sqlite`) file with the same columns as the BigQuery table.
+
+    Parameters
+    ----------
+    path : str
+        Path to the file.
+
+    table : str, default `'exog'`
+        Table name, only used with SQLite files.
+
+    """
+
+    def __init__(self, path: str, table: str='exog') -> None:
+
+        self.path  = path
+        self.table = table
+
+
+    @property
+    def is_parquet(self) -> bool:
+        return self.path.endswith('.parquet')
+
+
+    def fetch(
+        self,
+        columns: Optional[List[str]]=None,
+        start: Optional[pd.Timestamp]=None,
+        end: Optional[pd.Timestamp]=None,
+        index_col: str='idx'
+    ) -> pd.DataFrame:
+        """
+        Read `index_col` and `columns` (all columns if `None`) for the rows
+        between `start` and `end`, both included.
+
+        SQLite gets both projections in the query. Dates are stored as text,
+        so the query bounds are whole days and the exact range is applied
+        afterwards. Parquet files only get the column projection, the rows
+        are filtered once read.
+        """
+        if columns is not None:
+            columns = _check_columns([index_col, *columns])
+
+        if self.is_parquet:
+            data = pd.read_parquet(self.path, columns=columns)
+        else:
+            select = '*' if columns is None else ', '.join(f'"{c}"' for c in columns)
+            query = f"SELECT {select} FROM {self.table}"
+            where = []
+            params = []
+            if start is not None:
+                where.append(f'"{index_col}" >= ?')
+                params.append(pd.Timestamp(start).strftime('%Y-%m-%d'))
+            if end is not None:
+                where.append(f'"{index_col}" < ?')
+                params.append((pd.Timestamp(end) + pd.Timedelta(days=1)).strftime('%Y-%m-%d'))
+            if where:
+                query += f" WHERE {' AND '.join(where)}"
+            with sqlite3.connect(self.path) as con:
+                data = pd.read_sql(query, con, params=params)
+
+        if start is not None or end is not None:
+            dates = pd.to_datetime(data[index_col])
+            keep = pd.Series(True, index=data.index)
+            if start is not None:
+                keep &= dates >= pd.Timestamp(start)
+            if end is not None:
+                keep &= dates <= pd.Timestamp(end)
+            data = data[keep].reset_index(drop=True)
+        data.attrs['bytes_read'] = int(data.memory_usage(index=False, deep=True).sum())
+
+        return data
+
+
+    def write(self, data: pd.DataFrame) -> None:
+        """
+        Write `data` to the file so it can be used as a stand-in for BigQuery.
+        """
+        if self.is_parquet:
+            data.to_parquet(self.path, index=False)
+            return
+
+        with sqlite3.connect(self.path) as con:
+            data.to_sql(self.table, con, if_exists='replace', index=False)
+
+
+class ExogSnapshot(NamedTuple):
+    """
+    Preprocessed exogenous data and when it was fetched.
+    """
+    data: pd.DataFrame
+    version: str
+    fetched_at: datetime
+    fetch_seconds: float
+
+    def info(self) -> dict:
+        return {
+            "version": self.version,
+            "fetched_at": self.fetched_at.isoformat(),
+            "fetch_seconds": self.fetch_seconds,
+            "n_rows": len(self.data),
+            "start": self.data.index[0].isoformat() if len(self.data) else None,
+            "end": self.data.index[-1].isoformat() if len(self.data) else None,
+        }
+
+
+def preprocess_exog(
+    data: pd.DataFrame,
+    index_col: str='idx',
+    freq: str='MS'
+) -> pd.DataFrame:
+    """
+    Index the raw table by `index_col` and align it to `freq`.
+    """
+    data = data.copy()
+    data[index_col] = pd.to_datetime(data[index_col])
+    data = data.set_index(index_col).sort_index()
+    data = data.asfreq(freq)
+
+    return data
+
+
+def snapshot_version(data: pd.DataFrame) -> str:
+    """
+    Content hash of a preprocessed exogenous DataFrame.
+    """
+    hashes = pd.util.hash_pandas_object(data, index=True).to_numpy()
+    digest = hashlib.sha256(hashes.tobytes())
+    digest.update(','.join(map(str, data.columns)).encode())
+
+    return digest.hexdigest()[:12]
+
+
+class ExogProvider:
+    """
+    Keep an in-memory snapshot of the exogenous variables and refresh it in
+    the background.
+
+    Parameters
+    ----------
+    backend : BigQueryBackend, LocalBackend
+        Object with a `fetch()` method that returns the raw table.
+
+    ttl : float, default `300`
+        Seconds after which the snapshot is refreshed.
+
+    index_col : str, default `'idx'`
+        Column with the datetime index.
+
+    freq : str, default `'MS'`
+        Frequency of the series.
+
+    mode : str, default `'snapshot'`
+        `'snapshot'` keeps the whole table in memory. `'query'` reads only
+        the columns and periods each request needs (see `get_for`).
+
+    """
+
+    def __init__(
+        self,
+        backend,
+        ttl: float=300,
+        index_col: str='idx',
+        freq: str='MS',
+        mode: str='snapshot'
+    ) -> None:
+
+        if mode not in ('snapshot', 'query'):
+            raise ValueError(f"`mode` must be 'snapshot' or 'query'. Got {mode!r}.")
+
+        self.backend       = backend
+        self.ttl           = ttl
+        self.index_col     = index_col
+        self.freq          = freq
+        self.mode          = mode
+        self.reads         = 0
+        self.rows_read     = 0
+        self.bytes_read    = 0
+        self.last_read     = None
+        self._snapshot     = None
+        self._lock         = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+
+    def get(self) -> ExogSnapshot:
+        """
+        Return the current snapshot, even if it is older than `ttl`.
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            raise RuntimeError(
+                "No exogenous snapshot loaded. Call `refresh()` before serving requests."
+            )
+
+        return snapshot
+
+
+    def get_for(
+        self,
+        columns: Optional[List[str]],
+        start: pd.Timestamp,
+        end: pd.Timestamp
+    ) -> ExogSnapshot:
+        """
+        Exogenous values of `columns` between `start` and `end`. In
+        `'snapshot'` mode this is the current snapshot; in `'query'` mode
+        only those columns and rows are read from the backend.
+
+        Parameters
+        ----------
+        columns : list of str, None
+            `exog_col_names` of the forecaster. `None` for forecasters
+            without exogenous variables.
+
+        start : pandas Timestamp
+            First period of the horizon.
+
+        end : pandas Timestamp
+            Last period of the horizon.
+
+        Returns
+        -------
+        snapshot : ExogSnapshot
+
+        """
+        if self.mode == 'snapshot':
+            return self.get()
+
+        if not columns:
+            return ExogSnapshot(
+                       data          = pd.DataFrame(index=pd.DatetimeIndex([], freq=self.freq)),
+                       version       = 'none',
+                       fetched_at    = datetime.now(timezone.utc),
+                       fetch_seconds = 0.0
+                   )
+
+        started = time.perf_counter()
+        raw = self.backend.fetch(
+                  columns   = list(columns),
+                  start     = start,
+                  end       = end,
+                  index_col = self.index_col
+              )
+        data = preprocess_exog(raw, index_col=self.index_col, freq=self.freq)
+        snapshot = ExogSnapshot(
+                       data          = data,
+                       version       = snapshot_version(data),
+                       fetched_at    = datetime.now(timezone.utc),
+                       fetch_seconds = time.perf_counter() - started
+                   )
+        self._record_read(raw)
+        metrics.observe('exog_query', snapshot.fetch_seconds)
+
+        return snapshot
+
+
+    def get_for_horizon(
+        self,
+        columns: Optional[List[str]],
+        end_dates: List[pd.Timestamp],
+        steps: List[int],
+        freq: str
+    ) -> ExogSnapshot:
+        """
+        `get_for` with one read covering the `steps` periods after each of
+        `end_dates`.
+        """
+        offset = to_offset(freq)
+        start = min(end_dates) + offset
+        end = max(end + n * offset for end, n in zip(end_dates, steps))
+
+        return self.get_for(columns, start, end)
+
+
+    def _record_read(self, raw: pd.DataFrame) -> None:
+
+        rows = len(raw)
+        n_bytes = int(raw.attrs.get('bytes_read') or 0)
+        with self._lock:
+            self.reads += 1
+            self.rows_read += rows
+            self.bytes_read += n_bytes
+            self.last_read = {"rows": rows, "bytes": n_bytes}
+        metrics.inc('exog_reads_total')
+        metrics.inc('exog_rows_read_total', value=rows)
+        metrics.inc('exog_bytes_read_total', value=n_bytes)
+
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "reads": self.reads,
+            "rows_read": self.rows_read,
+            "bytes_read": self.bytes_read,
+            "mean_rows_per_read": self.rows_read / self.reads if self.reads else 0.0,
+            "mean_bytes_per_read": self.bytes_read / self.reads if self.reads else 0.0,
+            "last_read": self.last_read,
+        }
+
+
+    def is_stale(self) -> bool:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return True
+        age = (datetime.now(timezone.utc) - snapshot.fetched_at).total_seconds()
+
+        return age >= self.ttl
+
+
+    def refresh(self) -> ExogSnapshot:
+        """
+        Fetch the table from the backend, preprocess it and swap the snapshot.
+        Concurrent calls are serialized so the backend is queried only once.
+        """
+        with self._refresh_lock:
+            start = time.perf_counter()
+            raw = self.backend.fetch()
+            data = preprocess_exog(
+                       data      = raw,
+                       index_col = self.index_col,
+                       freq      = self.freq
+                   )
+            snapshot = ExogSnapshot(
+                           data          = data,
+                           version       = snapshot_version(data),
+                           fetched_at    = datetime.now(timezone.utc),
+                           fetch_seconds = time.perf_counter() - start
+                       )
+            self._snapshot = snapshot
+        self._record_read(raw)
+        metrics.observe('exog_refresh', snapshot.fetch_seconds)
+
+        logger.info("Refreshed exog snapshot (version %s, %d rows) in %.3f s",
+                    snapshot.version, len(data), snapshot.fetch_seconds)
+
+        return snapshot
+
+
+    async def run(self) -> None:
+        """
+        Refresh the snapshot every `ttl` seconds. Errors are logged and the
+        previous snapshot keeps being served until the next attempt.
+        """
+        while True:
+            await asyncio.sleep(self.ttl)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception:
+                logger.exception("Could not refresh exog snapshot, serving version %s",
+                                 getattr(self._snapshot, 'version', None))
+
+
+def provider_from_env() -> ExogProvider:
+    """
+    Build the provider from environment variables. `EXOG_LOCAL_PATH` selects
+    the local stand-in, otherwise BigQuery is used (`EXOG_BIGQUERY_TABLE`,
+    and `EXOG_BIGQUERY_INDEX_TYPE` to skip reading the index column type from
+    the schema). `EXOG_TTL` sets the refresh period in seconds and
+    `EXOG_MODE` (`snapshot` or `query`) how the table is read.
+    """
+    local_path = os.environ.get('EXOG_LOCAL_PATH')
+    if local_path:
+        backend = LocalBackend(local_path)
+    else:
+        backend = BigQueryBackend(
+                      table      = os.environ.get('EXOG_BIGQUERY_TABLE', BIGQUERY_TABLE),
+                      index_type = os.environ.get('EXOG_BIGQUERY_INDEX_TYPE')
+                  )
+
+    return ExogProvider(
+               backend = backend,
+               ttl     = float(os.environ.get('EXOG_TTL', 300)),
+               mode    = os.environ.get('EXOG_MODE', 'snapshot')
+           )
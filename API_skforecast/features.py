@@ -0,0 +1,210 @@
+"""
+Training matrices of `ForecasterAutoreg` without per-lag copies.
+
+`ForecasterAutoreg.create_train_X_y` fills the lag columns one by one,
+stacks the exogenous variables next to them with `np.column_stack` and wraps
+the result in a DataFrame, so a long series with many lags goes through
+several full-size copies. Here the lags are a `sliding_window_view` of one
+contiguous buffer with the series:
+
+- With lags `1..max_lag` and no exog, the training matrix is that view and
+  nothing is copied.
+- Otherwise the matrix is allocated once, with the lag columns and then the
+  exog columns written into it, each value once.
+
+`fit_forecaster` fits a `ForecasterAutoreg` on these matrices and leaves it
+in the same state as `ForecasterAutoreg.fit`. With `dtype=np.float32` the
+matrix takes half the memory. Tree ensembles train on float32 anyway and
+give the same model; other regressors give slightly different coefficients.
+The target stays float64.
+"""
+from typing import Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def _is_consecutive(lags: np.ndarray) -> bool:
+    return np.array_equal(lags, np.arange(1, len(lags) + 1))
+
+
+def lag_matrix(values: np.ndarray, lags: np.ndarray) -> np.ndarray:
+    """
+    Lags of `values` as in `ForecasterAutoreg._create_lags`: row `i` holds
+    the lags of `values[max_lag + i]`, lag 1 first. A view of `values` when
+    `lags` is `1..max_lag`, a copy otherwise.
+    """
+    lags = np.asarray(lags, dtype=int)
+    max_lag = int(lags.max())
+    # windows[i] = values[i:i + max_lag], so lag k of values[i + max_lag] is
+    # column max_lag - k
+    windows = sliding_window_view(values, max_lag)[:-1]
+    if _is_consecutive(lags):
+        return windows[:, ::-1]
+
+    return windows[:, max_lag - lags]
+
+
+def train_matrices(
+    y: np.ndarray,
+    lags: np.ndarray,
+    exog: Optional[np.ndarray]=None,
+    dtype: Union[type, np.dtype]=np.float64
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Predictors and target of `ForecasterAutoreg.create_train_X_y` as arrays.
+
+    Parameters
+    ----------
+    y : numpy ndarray
+        Training series.
+
+    lags : numpy ndarray
+        Lags used as predictors.
+
+    exog : numpy ndarray, default `None`
+        Array of shape (len(y), n_exog) with the exogenous variables.
+
+    dtype : type, default `np.float64`
+        Type of `X_train`.
+
+    Returns
+    -------
+    X_train : numpy ndarray
+        Array of shape (len(y) - max_lag, len(lags) + n_exog). A read-only
+        view of `y` when there is no exog, `lags` is `1..max_lag` and `y`
+        is a contiguous array of type `dtype`.
+
+    y_train : numpy ndarray
+        Values of `y` (float64) related to each row of `X_train`.
+
+    """
+    lags = np.asarray(lags, dtype=int)
+    max_lag = int(lags.max())
+    # The target keeps float64 whatever `dtype` is
+    y_train = np.asarray(y, dtype=float)[max_lag:]
+    values = np.ascontiguousarray(y, dtype=dtype)
+    n_rows = len(values) - max_lag
+    if n_rows <= 0:
+        raise ValueError(
+            f'The maximum lag ({max_lag}) must be less than the length '
+            f'of the series ({len(values)}).'
+        )
+
+    if exog is None:
+        return lag_matrix(values, lags), y_train
+
+    exog = np.asarray(exog)
+    if exog.ndim == 1:
+        exog = exog.reshape(-1, 1)
+    if len(exog) != len(values):
+        raise ValueError(
+            f'`exog` must have same number of samples as `y`. '
+            f'length `exog`: ({len(exog)}), length `y`: ({len(values)})'
+        )
+
+    n_lags = len(lags)
+    X_train = np.empty(shape=(n_rows, n_lags + exog.shape[1]), dtype=dtype)
+    windows = sliding_window_view(values, max_lag)[:-1]
+    if _is_consecutive(lags):
+        X_train[:, :n_lags] = windows[:, ::-1]
+    else:
+        for i, lag in enumerate(lags):
+            X_train[:, i] = windows[:, max_lag - lag]
+    X_train[:, n_lags:] = exog[max_lag:]
+
+    return X_train, y_train
+
+
+def fit_forecaster(
+    forecaster,
+    y: pd.Series,
+    exog: Optional[Union[pd.Series, pd.DataFrame]]=None,
+    dtype: Union[type, np.dtype]=np.float64
+) -> None:
+    """
+    `forecaster.fit(y, exog)` with the training matrices of `train_matrices`.
+
+    Parameters
+    ----------
+    forecaster : ForecasterAutoreg
+        Forecaster without `transformer_y`, `transformer_exog` or
+        `weight_func`.
+
+    y : pandas Series
+        Training time series.
+
+    exog : pandas Series, pandas DataFrame, default `None`
+        Exogenous variables, aligned with `y`.
+
+    dtype : type, default `np.float64`
+        Type of the training matrix.
+
+    Returns
+    -------
+    None
+
+    """
+    from skforecast.utils import check_exog, check_y, preprocess_exog, preprocess_y
+
+    if type(forecaster).__name__ != 'ForecasterAutoreg':
+        raise TypeError("`forecaster` must be a `ForecasterAutoreg`.")
+    if (forecaster.transformer_y is not None or forecaster.transformer_exog is not None
+            or forecaster.weight_func is not None):
+        raise ValueError(
+            ("Forecasters with transformers or `weight_func` are not supported. "
+             "Use `forecaster.fit`.")
+        )
+
+    check_y(y=y)
+    y_values, y_index = preprocess_y(y=y)
+    exog_values = None
+    if exog is not None:
+        if len(exog) != len(y):
+            raise ValueError(
+                f'`exog` must have same number of samples as `y`. '
+                f'length `exog`: ({len(exog)}), length `y`: ({len(y)})'
+            )
+        check_exog(exog=exog)
+        exog_values, exog_index = preprocess_exog(exog=exog)
+        if not (exog_index[:len(y_index)] == y_index).all():
+            raise ValueError(
+                ('Different index for `y` and `exog`. They must be equal '
+                 'to ensure the correct alignment of values.')
+            )
+
+    X_train, y_train = train_matrices(y_values, forecaster.lags, exog_values, dtype)
+    forecaster.regressor.fit(X=X_train, y=y_train)
+
+    col_names = [f"lag_{i}" for i in forecaster.lags]
+    forecaster.included_exog = exog is not None
+    forecaster.exog_type = None
+    forecaster.exog_col_names = None
+    if exog is not None:
+        forecaster.exog_type = type(exog)
+        if isinstance(exog, pd.DataFrame):
+            forecaster.exog_col_names = exog.columns.to_list()
+            col_names.extend(exog.columns)
+        else:
+            forecaster.exog_col_names = exog.name
+            col_names.append(exog.name)
+
+    train_index = y_index[forecaster.max_lag:]
+    forecaster.X_train_col_names = col_names
+    forecaster.fitted = True
+    forecaster.fit_date = pd.Timestamp.today().strftime('%Y-%m-%d %H:%M:%S')
+    forecaster.training_range = y_index[[0, -1]]
+    forecaster.index_type = type(train_index)
+    if isinstance(train_index, pd.DatetimeIndex):
+        forecaster.index_freq = train_index.freqstr
+    else:
+        forecaster.index_freq = train_index.step
+
+    residuals = y_train - forecaster.regressor.predict(X_train)
+    if len(residuals) > 1000:
+        # Only up to 1000 residuals are stored, as in `fit`
+        rng = np.random.default_rng(seed=123)
+        residuals = rng.choice(a=residuals, size=1000, replace=False)
+    forecaster.in_sample_residuals = residuals
+    forecaster.last_window = y.iloc[-forecaster.max_lag:].copy()
@@ -0,0 +1,223 @@
+"""
+Array-backed inference for scikit-learn tree ensembles.
+
+`RandomForestRegressor.predict` validates the input and dispatches one job
+per tree. For the handful of rows predicted by the API that overhead is far
+larger than the traversal itself. `FlatForest` copies the nodes of every tree
+into contiguous arrays and walks all the trees for all the rows at once with
+NumPy, so it can replace the regressor of a fitted forecaster.
+
+scikit-learn is only imported to inspect a fitted regressor. Serving an
+artifact (see `artifact`) does not import it.
+"""
+import sys
+from typing import Optional, Union
+
+import numpy as np
+
+TREE_LEAF = -1
+
+
+def can_flatten(regressor) -> bool:
+    """
+    Whether `regressor` is a fitted single-output tree regressor, or an
+    averaging forest of them, that `FlatForest` can reproduce.
+    """
+    # Trees and forests import `sklearn.tree` when they are unpickled or
+    # fitted, so without it `regressor` cannot be one and sklearn is not
+    # imported just to tell
+    if 'sklearn.tree' not in sys.modules:
+        return False
+    from sklearn.ensemble._forest import ForestRegressor
+    from sklearn.tree import BaseDecisionTree
+
+    if isinstance(regressor, ForestRegressor):
+        estimators = getattr(regressor, 'estimators_', None)
+    elif isinstance(regressor, BaseDecisionTree):
+        estimators = [regressor] if hasattr(regressor, 'tree_') else None
+    else:
+        return False
+
+    return bool(estimators) and all(e.tree_.n_outputs == 1 for e in estimators)
+
+
+class FlatForest:
+    """
+    Tree ensemble stored as contiguous node arrays.
+
+    Every tree is a slice of the node arrays starting at `roots[t]`. Children
+    indexes are global. Leaves point to themselves with an infinite
+    threshold, so a row that reaches a leaf stays there and all the trees can
+    be traversed `max_depth` times without checking for leaves.
+
+    Parameters
+    ----------
+    feature : numpy ndarray
+        Feature used to split each node.
+
+    threshold : numpy ndarray
+        Split threshold of each node. A row goes left when
+        `X[feature] <= threshold`.
+
+    left : numpy ndarray
+        Left child of each node.
+
+    right : numpy ndarray
+        Right child of each node.
+
+    value : numpy ndarray
+        Prediction of each node (only used in leaves).
+
+    roots : numpy ndarray
+        Root node of each tree.
+
+    max_depth : int
+        Depth of the deepest tree.
+
+    children : numpy ndarray, default `None`
+        `left` and `right` interleaved. If `None`, it is built from them.
+
+    """
+
+    def __init__(
+        self,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+        value: np.ndarray,
+        roots: np.ndarray,
+        max_depth: int,
+        children: Optional[np.ndarray]=None
+    ) -> None:
+
+        self.feature   = feature
+        self.threshold = threshold
+        self.left      = left
+        self.right     = right
+        self.value     = value
+        self.roots     = roots
+        self.max_depth = max_depth
+        # Children interleaved so that the next node is
+        # `children[2 * node + go_right]`
+        if children is None:
+            children = np.column_stack((left, right)).ravel()
+        self.children  = children
+
+
+    @classmethod
+    def from_regressor(cls, regressor) -> 'FlatForest':
+        """
+        Flatten a fitted `RandomForestRegressor`, `ExtraTreesRegressor` or
+        `DecisionTreeRegressor`.
+        """
+        if not can_flatten(regressor):
+            raise TypeError(
+                (f"`regressor` must be a fitted single-output tree regressor "
+                 f"or forest. Got {type(regressor)}.")
+            )
+        from sklearn.tree import BaseDecisionTree
+
+        if isinstance(regressor, BaseDecisionTree):
+            trees = [regressor.tree_]
+        else:
+            trees = [e.tree_ for e in regressor.estimators_]
+
+        sizes = np.array([tree.node_count for tree in trees])
+        roots = np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(np.intp)
+
+        feature, threshold, left, right, value = [], [], [], [], []
+        for root, tree in zip(roots, trees):
+            is_leaf = tree.children_left == TREE_LEAF
+            nodes = root + np.arange(tree.node_count)
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+            left.append(np.where(is_leaf, nodes, root + tree.children_left))
+            right.append(np.where(is_leaf, nodes, root + tree.children_right))
+            value.append(tree.value[:, 0, 0])
+
+        return cls(
+                   feature   = np.concatenate(feature).astype(np.intp),
+                   threshold = np.concatenate(threshold).astype(np.float64),
+                   left      = np.concatenate(left).astype(np.intp),
+                   right     = np.concatenate(right).astype(np.intp),
+                   value     = np.concatenate(value).astype(np.float64),
+                   roots     = roots,
+                   max_depth = max(tree.max_depth for tree in trees)
+               )
+
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.feature)
+
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """
+        Leaf reached by every row in every tree, shape (n_rows, n_trees).
+        """
+        # scikit-learn casts the input to float32 before comparing it with
+        # the (float64) thresholds, do the same to take identical branches.
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_rows, n_features = X.shape
+        X = X.ravel()
+        row_offsets = (np.arange(n_rows) * n_features)[:, None]
+        nodes = np.repeat(self.roots[None, :], n_rows, axis=0)
+        for _ in range(self.max_depth):
+            x = X[row_offsets + self.feature[nodes]]
+            go_right = ~(x <= self.threshold[nodes])
+            nodes = self.children[2 * nodes + go_right]
+
+        return nodes
+
+
+    def predict(self, X: Union[np.ndarray, list]) -> np.ndarray:
+        """
+        Average of the trees' predictions for every row of `X`.
+        """
+        X = np.asarray(X)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        leaves = self.value[self.apply(X)]
+        # Trees are added one after the other, as scikit-learn does, so the
+        # result does not depend on NumPy's pairwise summation.
+        total = np.cumsum(leaves, axis=1)[:, -1]
+
+        return total / self.n_trees
+
+
+class CompiledRegressor:
+    """
+    Drop-in replacement of a fitted forest regressor. Batches of up to
+    `max_rows` rows are predicted with its `FlatForest`, larger ones with the
+    original regressor, whose compiled traversal is faster at that size. Both
+    give identical results.
+
+    Parameters
+    ----------
+    regressor : RandomForestRegressor, ExtraTreesRegressor, DecisionTreeRegressor
+        Fitted regressor.
+
+    max_rows : int, default `512`
+        Largest batch predicted with the flat arrays.
+
+    """
+
+    def __init__(self, regressor, max_rows: int=512) -> None:
+
+        self.regressor = regressor
+        self.flat      = FlatForest.from_regressor(regressor)
+        self.max_rows  = max_rows
+
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+
+        if len(X) <= self.max_rows:
+            return self.flat.predict(X)
+
+        return self.regressor.predict(X)
@@ -1,12 +1,41 @@
-from fastapi import FastAPI, Request
+import time
+# Start of the import of the app, reported at boot (see `startup`)
+IMPORT_STARTED = time.perf_counter()
+import asyncio
+import contextlib
+import logging
+import os
+from typing import List, Optional, Union
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 from pydantic import BaseModel, validator
+import numpy as np
 import pandas as pd
-from skforecast.utils import load_forecaster
-from google.cloud import bigquery as bq
-from google.oauth2 import service_account
+from cache import DEFAULT_TAG, ForecastCache, forecast_key
+from batching import batcher_from_env
+from concurrency import Overloaded, executor_from_env
+from encoding import JSON, NotAcceptable, available_media_types, encode, negotiate
+from pandas.tseries.frequencies import to_offset
+from engine import (
+    predict_batch,
+    predict_bootstrapping,
+    predict_windows,
+    predictions_to_series
+)
+from exog import provider_from_env
+from metrics import RequestMetricsMiddleware, metrics, process_rss_bytes, span
+from payload import ParsedWindow, PayloadError, parse_body
+from refit import worker_from_env
+from registry import ForecasterRegistry, ModelStore
+from series import SeriesStore
+from startup import StartupReport
 
 # uvicorn main:app --reload 
 # http://127.0.0.1:8000/make_preds
+
+logger = logging.getLogger(__name__)
+
+
 class Last_window(BaseModel):
     y: dict
 
@@ -28,43 +57,663 @@ class Last_window(BaseModel):
 
         return value
 
-app = FastAPI()
+
+class Window_item(Last_window):
+    key: str
+    steps: int = 3
+
+
+class Batch_windows(BaseModel):
+    windows: List[Window_item]
+
+
+class Observation(BaseModel):
+    ts: str
+    value: Optional[float]
+
+
+class Observations(BaseModel):
+    observations: List[Observation]
+
+
+def parse_last_window(y: dict) -> pd.Series:
+    """
+    Convert a `{index: float}` dict into a Series with `MS` frequency.
+    """
+    lw = pd.Series(y)
+    lw.index = pd.to_datetime(lw.index)
+    lw = lw.asfreq('MS')
+
+    return lw
+
+
+registry = ForecasterRegistry(
+               file_name      = os.environ.get('FORECASTER_PATH', 'forecaster.py'),
+               check_interval = float(os.environ.get('FORECASTER_CHECK_INTERVAL', 5))
+           )
+model_store = ModelStore(
+                  root           = os.environ.get('MODELS_DIR', 'models'),
+                  memory_budget  = int(float(os.environ.get('MODELS_MEMORY_BUDGET_MB', 512)) * 2**20),
+                  check_interval = float(os.environ.get('FORECASTER_CHECK_INTERVAL', 5))
+              )
+exog_provider = provider_from_env()
+executor = executor_from_env()
+batcher = batcher_from_env(executor, exog_provider)
+series_store = SeriesStore(
+                   path         = os.environ.get('SERIES_DB_PATH', 'series.db'),
+                   window_size  = int(os.environ.get('SERIES_WINDOW_SIZE', 16)),
+                   freq         = os.environ.get('SERIES_FREQ', 'MS'),
+                   max_resident = int(os.environ.get('SERIES_MAX_RESIDENT', 100_000))
+               )
+refit_worker = worker_from_env(registry, series_store, exog_provider)
+forecast_cache = ForecastCache(
+                     max_size = int(os.environ.get('FORECAST_CACHE_SIZE', 10000)),
+                     ttl      = float(os.environ.get('FORECAST_CACHE_TTL', 300))
+                 )
+# Models of the model store loaded at startup, latest version of each
+preload_models = [
+    name.strip() for name in os.environ.get('MODELS_PRELOAD', '').split(',') if name.strip()
+]
+startup = StartupReport(import_seconds=time.perf_counter() - IMPORT_STARTED)
+
+
+async def startup_phase(name: str, func, *args):
+    """
+    Run `func(*args)` off the event loop as the startup phase `name`.
+    """
+    with startup.phase(name):
+        return await asyncio.to_thread(func, *args)
+
+
+def load_models(names: List[str]) -> None:
+    """
+    Load the latest version of every model of `names` into the model store.
+    """
+    for name in names:
+        model_store.get(model_store.resolve(name))
+
+
+async def warm_up(entry) -> None:
+    """
+    Parse, predict and encode one step after the training data of the served
+    forecaster, so the first request does not pay for first calls (body
+    parsing, executor thread, lazy imports, the exog backend client in query
+    mode). A failure is logged and does not stop the service.
+    """
+    forecaster = entry.forecaster
+    freq = forecaster.index_freq
+    try:
+        with startup.phase('warm_up'):
+            last_window = getattr(forecaster, 'last_window', None)
+            if last_window is not None:
+                values = last_window.to_numpy(dtype=float)
+                end = pd.Timestamp(last_window.index[-1])
+            else:
+                # Artifacts keep the training range but not the last window
+                values = np.zeros(forecaster.window_size)
+                end = pd.Timestamp(forecaster.metadata['training_range'][-1])
+            # Same path as a `last_window.json` request
+            index = pd.date_range(end=end, periods=len(values), freq=freq)
+            window = parse_body(encode({"y": pd.Series(values, index=index)}, JSON), freq=freq)
+            snapshot = await exog_for_horizon(entry, [window.end], [1], freq)
+            pred = await executor.run(predict_window, entry, snapshot, window.values, window.end, 1)
+            encode({"pred": predictions_to_series(pred, window.end, freq)}, JSON)
+    except Exception as e:
+        logger.warning("Warm-up prediction failed: %s", e)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the forecaster and the exog snapshot once, then keep them fresh
+    # in the background. Both loads run at the same time: unpickling is
+    # CPU-bound and the exog fetch mostly waits on the backend.
+    startup.start()
+    phases = [startup_phase('load_model', registry.load)]
+    if exog_provider.mode == 'snapshot':
+        phases.append(startup_phase('load_exog', exog_provider.refresh))
+    if preload_models:
+        phases.append(startup_phase('load_models', load_models, preload_models))
+    await asyncio.gather(*phases)
+    await warm_up(registry.get())
+    startup.ready()
+
+    tasks = [
+        asyncio.create_task(registry.watch()),
+        asyncio.create_task(model_store.watch()),
+        asyncio.create_task(refit_worker.run())
+    ]
+    if exog_provider.mode == 'snapshot':
+        tasks.append(asyncio.create_task(exog_provider.run()))
+    yield
+    for task in tasks:
+        task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await asyncio.gather(*tasks)
+    executor.shutdown()
+    refit_worker.shutdown()
+    series_store.close()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(RequestMetricsMiddleware)
+
+metrics.gauge('process_resident_memory_bytes', process_rss_bytes, 'Resident set size.')
+metrics.gauge('forecast_executor_active', lambda: executor.active,
+              'Predictions running in the executor.')
+metrics.gauge('forecast_executor_queue_depth', lambda: executor.queue_depth,
+              'Predictions waiting for an executor thread.')
+metrics.counter('forecast_executor_rejected_total', lambda: executor.rejected,
+                'Requests rejected because the executor queue was full.')
+metrics.counter('forecast_cache_hits_total', lambda: forecast_cache.hits, 'Forecast cache hits.')
+metrics.counter('forecast_cache_misses_total', lambda: forecast_cache.misses,
+                'Forecast cache misses.')
+metrics.counter('forecast_cache_steps_cached_total', lambda: forecast_cache.steps_cached,
+                'Forecast horizon steps served from the cache.')
+metrics.counter('forecast_cache_steps_computed_total', lambda: forecast_cache.steps_computed,
+                'Forecast horizon steps predicted (not in the cache).')
+metrics.gauge('forecast_series_resident', lambda: series_store.resident,
+              'Series whose window is held in memory.')
+metrics.gauge('forecast_models_memory_bytes', lambda: model_store.memory_bytes,
+              'Memory used by the resident models of the model store.')
+
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return JSONResponse(
+               status_code = 503,
+               content     = {"detail": str(exc)},
+               headers     = {"Retry-After": str(exc.retry_after)}
+           )
+
+
+@app.exception_handler(NotAcceptable)
+async def not_acceptable_handler(request: Request, exc: NotAcceptable):
+    return JSONResponse(
+               status_code = 406,
+               content     = {"detail": str(exc), "available": available_media_types()}
+           )
+
+
+def encoded_response(content: dict, media_type: str) -> Response:
+    """
+    Response with `content` in the encoding negotiated for the request.
+    """
+    return Response(
+               content    = encode(content, media_type),
+               media_type = media_type,
+               headers    = {"Vary": "Accept"}
+           )
+
 
 @app.get("/")
 def root():
     return {"message": "hello world again"}
 
 
+@app.get("/startup")
+def startup_info():
+    """
+    Import time of the app and duration of every startup phase.
+    """
+    return startup.info()
+
+
+@app.get("/model")
+def model_info():
+    """
+    Version, file hash and load time of the forecaster being served.
+    """
+    return registry.get().info()
+
+
+@app.get("/exog")
+def exog_info():
+    """
+    Version and age of the exogenous snapshot being served, and rows and
+    bytes read from the backend.
+    """
+    if exog_provider.mode == 'query':
+        return exog_provider.stats()
+
+    return {
+        **exog_provider.get().info(),
+        "stale": exog_provider.is_stale(),
+        **exog_provider.stats()
+    }
+
+
+@app.get("/models")
+def models_info():
+    """
+    Available models and versions, and the ones resident in memory.
+    """
+    return {
+        "available": model_store.models(),
+        "resident": model_store.resident(),
+        "memory_bytes": model_store.memory_bytes,
+        "memory_budget": model_store.memory_budget,
+        "evictions": model_store.evictions,
+    }
+
+
+@app.get("/batching")
+def batching_info():
+    """
+    Batch sizes and flush triggers of the micro-batching dispatcher.
+    """
+    if batcher is None:
+        return {"enabled": False}
+
+    return {"enabled": True, **batcher.stats()}
+
+
+@app.get("/cache")
+def cache_info():
+    """
+    Size and hit/miss counters of the forecast cache.
+    """
+    return forecast_cache.stats()
+
+
+@app.get("/metrics")
+def metrics_info():
+    """
+    Per-stage latency histograms and quantiles, request counters and
+    process gauges in the Prometheus text format.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/make_preds/")
-def make_preds(last_window: Last_window):
+async def make_preds(request: Request, steps: int = Query(3, ge=1)):
+    """
+    Create predictions using a `last_window`. The body can be the original
+    `{"y": {index: float}}` dict or one of the columnar layouts
+    (`{"start", "freq", "values"}` or `{"index", "freq", "values"}`).
+    The response is JSON, msgpack or an Arrow stream depending on `Accept`
+    (see `encoding`).
+    """
+    return await forecast(registry.get(), request, steps, tag=DEFAULT_TAG)
+
+
+@app.post("/make_preds/{model_name}")
+async def make_preds_model(
+    model_name: str,
+    request: Request,
+    steps: int = Query(3, ge=1),
+    version: Optional[str] = None
+):
     """
-    Create predictions using a `last_window`.
+    Same as `/make_preds/` with the forecaster `{model_name}/{version}` of the
+    model store. If `version` is not given, the latest one is used.
     """
+    try:
+        key = model_store.resolve(model_name, version)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+
+    # Resident models are served right away, cold ones are loaded off the
+    # event loop
+    entry = model_store.peek(key)
+    if entry is None:
+        entry = await asyncio.to_thread(model_store.get, key)
+
+    return await forecast(entry, request, steps, tag=key)
+
+
+@app.post("/series/{series_id}/observe")
+async def observe_series(series_id: str, body: Union[Observation, Observations]):
+    """
+    Append one observation (`{"ts", "value"}`) or several
+    (`{"observations": [...]}`) to a series stored on the server.
+    """
+    if isinstance(body, Observation):
+        observations = [(body.ts, body.value)]
+    else:
+        observations = [(o.ts, o.value) for o in body.observations]
+
+    try:
+        return await asyncio.to_thread(series_store.observe, series_id, observations)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@app.get("/series/{series_id}")
+async def series_info(series_id: str):
+    """
+    Date of the newest observation of a stored series.
+    """
+    try:
+        return await asyncio.to_thread(series_store.state, series_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+
+
+@app.get("/series")
+def series_stats():
+    """
+    Resident series and memory of the series store.
+    """
+    return series_store.stats()
+
+
+@app.post("/series/{series_id}/forecast")
+async def forecast_series(request: Request, series_id: str, steps: int = Query(3, ge=1)):
+    """
+    Same as `/make_preds/` with the window of a stored series, so the body
+    is empty.
+    """
+    media_type = negotiate(request.headers.get('accept'))
+    entry = registry.get()
+    try:
+        # Resident series are read right away (no disk access), others are
+        # loaded from disk off the event loop
+        window = series_store.resident_window(series_id)
+        if window is None:
+            window = await asyncio.to_thread(series_store.window, series_id)
+        values, end = window
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+
+    freq = entry.forecaster.index_freq
+    if freq != series_store.freq:
+        raise HTTPException(
+            status_code = 422,
+            detail      = (f"Stored series have frequency '{series_store.freq}', "
+                           f"the forecaster '{freq}'.")
+        )
+
+    return await forecast_window(
+               entry, ParsedWindow(values, end, freq), steps, DEFAULT_TAG, media_type
+           )
+
+
+@app.post("/refit", status_code=202)
+async def start_refit(series_id: Optional[str] = None):
+    """
+    Refit the served forecaster on a stored series in a background process.
+    The new model replaces the served one only if it passes validation.
+    """
+    if refit_worker.running:
+        raise HTTPException(status_code=409, detail="A refit is already running.")
+    try:
+        series_id = await asyncio.to_thread(refit_worker.check, series_id)
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=422, detail=e.args[0])
+    if not refit_worker.start(series_id):
+        raise HTTPException(status_code=409, detail="A refit is already running.")
+
+    return refit_worker.status()
+
+
+@app.get("/refit")
+def refit_info():
+    """
+    State and result of the last refit.
+    """
+    return refit_worker.status()
+
+
+async def forecast(entry, request: Request, steps: int, tag: str) -> Response:
+    """
+    Parse the body, look up the forecast cache and predict the missing steps
+    with `entry`.
+    """
+    media_type = negotiate(request.headers.get('accept'))
     # read JSON
-    lw = pd.Series(last_window.y)
-    lw.index = pd.to_datetime(lw.index)
-    lw = lw.asfreq('MS')
+    body = await request.body()
+    try:
+        with span('parse'):
+            window = parse_body(body, freq=entry.forecaster.index_freq)
+    except PayloadError as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
-    # Read BQ
-    client = bq.Client()
+    return await forecast_window(entry, window, steps, tag, media_type)
 
-    query_exog_test = """
-    SELECT *
-    FROM `ingka-food-analytics-prod.forecast_models.test_javi`
+
+async def forecast_window(
+    entry,
+    window: ParsedWindow,
+    steps: int,
+    tag: str,
+    media_type: str
+) -> Response:
+    """
+    Look up the forecast cache and predict the missing steps of `window`
+    with `entry`, encoded as `media_type`.
     """
+    # In query mode exog is only read on a cache miss, for the steps left to
+    # predict. Cached forecasts then follow the backend table with a delay of
+    # at most the cache TTL, as they follow the snapshot TTL otherwise.
+    if exog_provider.mode == 'snapshot':
+        snapshot = exog_provider.get()
+        exog_version = snapshot.version
+    else:
+        snapshot = None
+        exog_version = 'query'
+
+    # Same window, model and exog give the same recursion, whatever the
+    # horizon. Reuse the steps already predicted and only compute the rest.
+    with span('cache'):
+        forecast_cache.sync_versions(entry.version, exog_version, tag=tag)
+        key = forecast_key(window.values, window.end, entry.version, exog_version)
+        cached = forecast_cache.get(key)
+    n_cached = 0 if cached is None else min(len(cached), steps)
+    if n_cached == steps:
+        pred = cached[:steps]
+    else:
+        # Resume the recursion after the cached steps
+        values, end = window.values, window.end
+        if n_cached:
+            values = np.concatenate((values, cached))
+            end = end + n_cached * to_offset(window.freq)
+
+        # With micro-batching, query mode reads exog once per batch when the
+        # batch is flushed
+        if snapshot is None and batcher is None:
+            snapshot = await exog_for_horizon(entry, [end], [steps - n_cached], window.freq)
+
+        try:
+            # Queueing, batching and prediction; `predict` is the regressor part
+            with span('dispatch'):
+                pred = await dispatch(entry, snapshot, values, end, steps - n_cached)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
 
-    df_exog_test = client.query(query_exog_test).result().to_dataframe()
-    df_exog_test = df_exog_test.set_index('idx')
-    df_exog_test = df_exog_test.asfreq('MS')
+        if n_cached:
+            pred = np.concatenate((cached, pred))
+        forecast_cache.set(key, pred, tag=tag)
+    forecast_cache.record_steps(cached=n_cached, computed=steps - n_cached)
 
-    # Load forecaster
-    forecaster_loaded = load_forecaster('forecaster.py', verbose=False)
-    
-    # Make Predictions
-    pred = forecaster_loaded.predict(
-               steps       = 3,
-               last_window = lw,
-               exog        = df_exog_test[['exog_1', 'exog_2']]
+    with span('serialize'):
+        pred = predictions_to_series(pred, window.end, window.freq)
+        response = encoded_response({"pred": pred}, media_type)
+
+    return response
+
+
+async def exog_for_horizon(entry, end_dates: list, steps: list, freq: str):
+    """
+    Exog snapshot covering the `steps` periods after each of `end_dates`.
+    In query mode only the forecaster's columns and those periods are read,
+    off the event loop.
+    """
+    if exog_provider.mode == 'snapshot':
+        return exog_provider.get()
+
+    return await asyncio.to_thread(
+               exog_provider.get_for_horizon,
+               entry.forecaster.exog_col_names, end_dates, steps, freq
            )
 
-    return {"pred": pred}
\ No newline at end of file
+
+async def dispatch(entry, snapshot, values: np.ndarray, end: pd.Timestamp, steps: int):
+    """
+    Predict one window in the prediction executor, through the micro-batcher
+    if it is enabled.
+    """
+    if batcher is not None:
+        # Coalesced with concurrent requests for the same model
+        return await batcher.submit(entry, snapshot, values, end, steps)
+
+    # CPU-bound work runs in the bounded prediction executor
+    return await executor.run(predict_window, entry, snapshot, values, end, steps)
+
+
+def predict_window(
+    entry,
+    snapshot,
+    values: np.ndarray,
+    end: pd.Timestamp,
+    steps: int
+) -> np.ndarray:
+    """
+    Predict `steps` steps after the window `values` ending at `end` with the
+    loaded forecaster and an exog snapshot.
+    """
+    # Make Predictions (same recursion as `forecaster.predict`)
+    with span('predict'):
+        pred = predict_windows(
+                   forecaster   = entry.forecaster,
+                   last_windows = [values],
+                   end_dates    = pd.DatetimeIndex([end]),
+                   steps        = [steps],
+                   exog         = snapshot.data,
+                   predictor    = entry.predictor
+               )[0]
+
+    return pred
+
+
+@app.post("/make_preds_batch/")
+async def make_preds_batch(request: Request, batch: Batch_windows):
+    """
+    Create predictions for many keyed `last_window`s in one call. The
+    regressor is called once per horizon step for all the windows. Batch
+    callers can ask for msgpack or an Arrow stream with `Accept`.
+    """
+    media_type = negotiate(request.headers.get('accept'))
+    keys = [item.key for item in batch.windows]
+    if len(set(keys)) != len(keys):
+        raise HTTPException(status_code=422, detail="`key` values must be unique.")
+
+    entry = registry.get()
+    if exog_provider.mode == 'query':
+        try:
+            end_dates = [pd.to_datetime(list(item.y)).max() for item in batch.windows]
+        except (ValueError, TypeError) as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        snapshot = await exog_for_horizon(
+                       entry,
+                       end_dates = end_dates,
+                       steps     = [item.steps for item in batch.windows],
+                       freq      = entry.forecaster.index_freq
+                   )
+    else:
+        snapshot = exog_provider.get()
+
+    preds = await executor.run(predict_items, entry, snapshot, batch.windows)
+
+    with span('serialize'):
+        response = encoded_response({"preds": dict(zip(keys, preds))}, media_type)
+
+    return response
+
+
+def predict_items(entry, snapshot, items: List[Window_item]) -> list:
+    """
+    Predict every item of a batch with the loaded forecaster and an exog
+    snapshot.
+    """
+    steps = [item.steps for item in items]
+
+    try:
+        # Bad date keys are client errors in both exog modes
+        last_windows = [parse_last_window(item.y) for item in items]
+        with span('predict'):
+            preds = predict_batch(
+                        forecaster   = entry.forecaster,
+                        last_windows = last_windows,
+                        steps        = steps,
+                        exog         = snapshot.data,
+                        predictor    = entry.predictor
+                    )
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    return preds
+
+
+@app.post("/make_preds_interval/")
+async def make_preds_interval(
+    request: Request,
+    steps: int = Query(3, ge=1),
+    n_boot: int = Query(500, ge=1, le=10000),
+    quantiles: List[float] = Query([0.05, 0.95]),
+    random_state: int = Query(123)
+):
+    """
+    Bootstrapped prediction intervals for a `last_window` (same bodies as
+    `/make_preds/`). The `n_boot` paths are simulated together with
+    in-sample residuals and summarized by `quantiles`.
+    """
+    if any(not 0 <= q <= 1 for q in quantiles):
+        raise HTTPException(status_code=422, detail="`quantiles` must be between 0 and 1.")
+    media_type = negotiate(request.headers.get('accept'))
+
+    entry = registry.get()
+    body = await request.body()
+    try:
+        with span('parse'):
+            window = parse_body(body, freq=entry.forecaster.index_freq)
+    except PayloadError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    snapshot = await exog_for_horizon(entry, [window.end], [steps], window.freq)
+    try:
+        paths = await executor.run(
+                    predict_paths, entry, snapshot, window.values, window.end,
+                    steps, n_boot, random_state
+                )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    with span('serialize'):
+        bounds = np.quantile(paths, quantiles, axis=0)
+        content = {
+            "n_boot": n_boot,
+            "quantiles": {
+                str(q): predictions_to_series(bound, window.end, window.freq)
+                for q, bound in zip(quantiles, bounds)
+            }
+        }
+        response = encoded_response(content, media_type)
+
+    return response
+
+
+def predict_paths(
+    entry,
+    snapshot,
+    values: np.ndarray,
+    end: pd.Timestamp,
+    steps: int,
+    n_boot: int,
+    random_state: int
+) -> np.ndarray:
+    """
+    `n_boot` bootstrapped paths of the window `values` ending at `end`.
+    """
+    with span('predict'):
+        paths = predict_bootstrapping(
+                    forecaster   = entry.forecaster,
+                    last_window  = values,
+                    end_date     = end,
+                    steps        = steps,
+                    n_boot       = n_boot,
+                    exog         = snapshot.data,
+                    predictor    = entry.predictor,
+                    random_state = random_state
+                )
+
+    return paths
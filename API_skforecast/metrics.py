@@ -0,0 +1,282 @@
+"""
+Lightweight latency instrumentation and Prometheus text exposition.
+
+`span(stage)` times a block of code and records it in the histogram of that
+stage. Every histogram keeps cumulative bucket counts, as Prometheus
+expects, plus the last `window` observations to report p50/p95/p99 without
+any external dependency. Recording a span is a couple of `perf_counter_ns`
+calls, a `bisect` and a lock, so it costs around a microsecond (see
+`benchmarks/bench_metrics.py`).
+
+    with span('predict'):
+        ...
+
+`render()` returns every metric in the Prometheus text format (version 0.0.4).
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """
+    Latency histogram of one stage.
+
+    Parameters
+    ----------
+    buckets : tuple of float, default `DEFAULT_BUCKETS`
+        Upper bounds, in seconds, of the buckets.
+
+    window : int, default `2048`
+        Number of recent observations kept to compute quantiles.
+
+    """
+
+    def __init__(
+        self,
+        buckets: Tuple[float, ...]=DEFAULT_BUCKETS,
+        window: int=2048
+    ) -> None:
+
+        self.buckets = buckets
+        self.counts  = [0] * (len(buckets) + 1)
+        self.sum     = 0.0
+        self.count   = 0
+        self._recent = np.zeros(window)
+        self._lock   = threading.Lock()
+
+
+    def observe(self, seconds: float) -> None:
+
+        i = bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += seconds
+            self._recent[self.count % len(self._recent)] = seconds
+            self.count += 1
+
+
+    def quantiles(self, qs: Tuple[float, ...]=QUANTILES) -> Dict[float, float]:
+
+        with self._lock:
+            recent = self._recent[:min(self.count, len(self._recent))].copy()
+        if len(recent) == 0:
+            return {q: float('nan') for q in qs}
+
+        return dict(zip(qs, np.quantile(recent, qs)))
+
+
+class _Span:
+
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram: Histogram) -> None:
+        self.histogram = histogram
+
+    def __enter__(self) -> '_Span':
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.histogram.observe((time.perf_counter_ns() - self.start) * 1e-9)
+
+
+class MetricsRegistry:
+    """
+    Stage histograms, counters and gauges of the process.
+    """
+
+    def __init__(self) -> None:
+
+        self.histograms = {}
+        self.counters   = {}
+        self.callbacks  = {}
+        self.gauges     = {}
+        self._lock      = threading.Lock()
+
+
+    def histogram(self, stage: str) -> Histogram:
+
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(stage, Histogram())
+
+        return histogram
+
+
+    def span(self, stage: str) -> _Span:
+        """
+        Context manager that records the duration of its block in `stage`.
+        """
+        return _Span(self.histogram(stage))
+
+
+    def observe(self, stage: str, seconds: float) -> None:
+        self.histogram(stage).observe(seconds)
+
+
+    def inc(self, name: str, labels: Tuple[Tuple[str, str], ...]=(), value: float=1) -> None:
+        """
+        Increase the counter `name` with the given label pairs.
+        """
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+
+    def counter(self, name: str, fn: Callable[[], float], help: str='') -> None:
+        """
+        Register a counter whose value is read from `fn()` at exposition
+        time. `fn` must never decrease, and `name` should end in `_total`.
+        """
+        self.callbacks[name] = (fn, help)
+
+
+    def gauge(self, name: str, fn: Callable[[], float], help: str='') -> None:
+        """
+        Register a gauge whose value is read from `fn()` at exposition time.
+        """
+        self.gauges[name] = (fn, help)
+
+
+    def render(self) -> str:
+        """
+        All metrics in the Prometheus text exposition format.
+        """
+        lines = []
+
+        lines.append("# HELP forecast_stage_seconds Duration of each request stage.")
+        lines.append("# TYPE forecast_stage_seconds histogram")
+        for stage, h in sorted(self.histograms.items()):
+            cumulative = 0
+            for bound, count in zip(list(h.buckets) + ['+Inf'], h.counts):
+                cumulative += count
+                lines.append(
+                    f'forecast_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}'
+                )
+            lines.append(f'forecast_stage_seconds_sum{{stage="{stage}"}} {h.sum}')
+            lines.append(f'forecast_stage_seconds_count{{stage="{stage}"}} {h.count}')
+
+        lines.append("# HELP forecast_stage_seconds_recent Quantiles of the most recent stage durations.")
+        lines.append("# TYPE forecast_stage_seconds_recent summary")
+        for stage, h in sorted(self.histograms.items()):
+            for q, value in h.quantiles().items():
+                lines.append(
+                    f'forecast_stage_seconds_recent{{stage="{stage}",quantile="{q}"}} {value}'
+                )
+            lines.append(f'forecast_stage_seconds_recent_sum{{stage="{stage}"}} {h.sum}')
+            lines.append(f'forecast_stage_seconds_recent_count{{stage="{stage}"}} {h.count}')
+
+        with self._lock:
+            counters = sorted(self.counters.items())
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                lines.append(f"# TYPE {name} counter")
+                seen.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for name, (fn, help) in sorted(self.callbacks.items()):
+            if help:
+                lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {fn()}")
+
+        for name, (fn, help) in sorted(self.gauges.items()):
+            if help:
+                lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {fn()}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ''
+    pairs = ','.join(f'{k}="{v}"' for k, v in labels)
+
+    return '{' + pairs + '}'
+
+
+def process_rss_bytes() -> int:
+    """
+    Resident set size of the process, read from `/proc` on Linux and from
+    `resource` (peak RSS) elsewhere.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        import sys
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        return rss if sys.platform == 'darwin' else rss * 1024
+
+
+metrics = MetricsRegistry()
+span = metrics.span
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware that counts requests by route and status, tracks the
+    number of active requests and times the whole request.
+
+    Parameters
+    ----------
+    app : ASGI application
+
+    registry : MetricsRegistry, default `metrics`
+
+    """
+
+    def __init__(self, app, registry: Optional[MetricsRegistry]=None) -> None:
+
+        self.app      = app
+        self.registry = registry or metrics
+        self.active   = 0
+        self.registry.gauge(
+            'forecast_active_requests', lambda: self.active, 'Requests being served.'
+        )
+
+
+    async def __call__(self, scope, receive, send) -> None:
+
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = {'code': 500}
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+
+        self.active += 1
+        start = time.perf_counter_ns()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.active -= 1
+            self.registry.observe('request', (time.perf_counter_ns() - start) * 1e-9)
+            # Route template (`/make_preds/{model_name}`), set by the router,
+            # so that labels do not grow with every requested path
+            route = getattr(scope.get('route'), 'path', 'unmatched')
+            self.registry.inc(
+                'forecast_requests_total',
+                (('route', route), ('status', str(status['code'])))
+            )
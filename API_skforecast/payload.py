@@ -0,0 +1,186 @@
+"""
+Parsing of `last_window` request bodies.
+
+Three layouts are accepted, all decoded straight from the raw body:
+
+- Columnar: `{"start": "2005-02-01", "freq": "MS", "values": [0.59, ...]}`.
+- Epoch: `{"index": [1107216000000, ...], "freq": "MS", "values": [0.59, ...]}`,
+  with the index in milliseconds since epoch.
+- Legacy: `{"y": {"2005-02-01T00:00:00.000": 0.59, ...}}`, the format of
+  `last_window.json`, kept for compatibility.
+
+Values are checked and copied into a float64 array in a single pass. The
+result only stores the values and the last date, the index is implied by the
+frequency.
+"""
+from typing import Any, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # pragma: no cover
+    import json
+    _loads = json.loads
+
+
+class PayloadError(ValueError):
+    """
+    Raised when a request body is not a valid `last_window`.
+    """
+
+
+class ParsedWindow(NamedTuple):
+    """
+    Values of a last window, oldest first, and the date of the last one.
+    """
+    values: np.ndarray
+    end: pd.Timestamp
+    freq: str
+
+    @property
+    def index(self) -> pd.DatetimeIndex:
+        return pd.date_range(end=self.end, periods=len(self.values), freq=self.freq)
+
+    def to_series(self) -> pd.Series:
+        return pd.Series(self.values, index=self.index)
+
+
+def _is_number(x: Any) -> bool:
+    # bool is a subclass of int but is not a valid value
+    return (type(x) is float or type(x) is int)
+
+
+def _float_array(values: Any, name: str='values') -> np.ndarray:
+    """
+    Copy a list of JSON numbers into a float64 array, rejecting anything else
+    in the same pass.
+    """
+    if not isinstance(values, list) or len(values) == 0:
+        raise PayloadError(f"`{name}` must be a non-empty list of numbers.")
+    try:
+        return np.fromiter(
+                   (x if _is_number(x) else float('x') for x in values),
+                   dtype = np.float64,
+                   count = len(values)
+               )
+    except ValueError:
+        raise PayloadError(f"`{name}` must contain only numbers.") from None
+
+
+def _check_freq(payload: dict, freq: str) -> None:
+    requested = payload.get('freq', freq)
+    if requested != freq:
+        raise PayloadError(f"`freq` must be '{freq}'. Got {requested!r}.")
+
+
+def parse_columnar(payload: dict, freq: str) -> ParsedWindow:
+    """
+    Parse `{"start": ..., "freq": ..., "values": [...]}`.
+    """
+    _check_freq(payload, freq)
+    values = _float_array(payload.get('values'))
+    try:
+        start = pd.Timestamp(payload['start'])
+    except (KeyError, TypeError, ValueError):
+        raise PayloadError("`start` must be a date string.") from None
+    offset = to_offset(freq)
+    if start is pd.NaT or not offset.is_on_offset(start):
+        raise PayloadError(
+            f"`start` must be a date on frequency '{freq}'. Got {payload['start']!r}."
+        )
+    end = start + (len(values) - 1) * offset
+
+    return ParsedWindow(values=values, end=end, freq=freq)
+
+
+def parse_epoch(payload: dict, freq: str) -> ParsedWindow:
+    """
+    Parse `{"index": [epoch_ms, ...], "freq": ..., "values": [...]}`. The index
+    must be regular with frequency `freq`.
+    """
+    _check_freq(payload, freq)
+    values = _float_array(payload.get('values'))
+    index = _float_array(payload.get('index'), name='index').astype(np.int64)
+    if len(index) != len(values):
+        raise PayloadError("`index` and `values` must have the same length.")
+
+    index = index.astype('datetime64[ms]')
+    expected = pd.date_range(start=index[0], periods=len(index), freq=freq)
+    if not np.array_equal(expected.values.astype('datetime64[ms]'), index):
+        raise PayloadError(f"`index` must be sorted and have frequency '{freq}'.")
+
+    return ParsedWindow(values=values, end=expected[-1], freq=freq)
+
+
+def parse_legacy(payload: dict, freq: str) -> ParsedWindow:
+    """
+    Parse the original `{"y": {index: float}}` layout with the same rules as
+    the `Last_window` model: string keys and float values.
+    """
+    y = payload.get('y')
+    if not isinstance(y, dict):
+        raise PayloadError(
+            ("`last_window` argument must be a dict in the form `{index: float}`. "
+             f"Got {type(y)}.")
+        )
+    if len(y) == 0:
+        raise PayloadError("`last_window` must not be empty.")
+    try:
+        values = np.fromiter(
+                     (v if type(v) is float else float('x') for v in y.values()),
+                     dtype = np.float64,
+                     count = len(y)
+                 )
+    except ValueError:
+        raise PayloadError("`last_window` values must be float.") from None
+    if not all(isinstance(k, str) for k in y):
+        raise PayloadError("`last_window` keys must be string.")
+
+    try:
+        index = pd.to_datetime(list(y.keys()))
+    except (TypeError, ValueError, OverflowError):
+        raise PayloadError("`last_window` keys must be dates.") from None
+    if index.has_duplicates:
+        raise PayloadError("`last_window` keys must be unique dates.")
+    # Same alignment as the original handler: missing periods become NaN.
+    try:
+        lw = pd.Series(values, index=index).asfreq(freq)
+    except (TypeError, ValueError) as e:
+        raise PayloadError(f"`last_window` cannot be aligned to frequency '{freq}': {e}") from None
+
+    return ParsedWindow(values=lw.to_numpy(), end=lw.index[-1], freq=freq)
+
+
+def parse_window(payload: Any, freq: str) -> ParsedWindow:
+    """
+    Parse a decoded `last_window` in any of the accepted layouts.
+    """
+    if not isinstance(payload, dict):
+        raise PayloadError("Request body must be a JSON object.")
+    if 'y' in payload:
+        return parse_legacy(payload, freq)
+    if 'index' in payload:
+        return parse_epoch(payload, freq)
+    if 'start' in payload:
+        return parse_columnar(payload, freq)
+
+    raise PayloadError(
+        "Request body must have `y`, `start` and `values`, or `index` and `values`."
+    )
+
+
+def parse_body(body: bytes, freq: str, loads: Optional[Any]=None) -> ParsedWindow:
+    """
+    Decode a raw request body and parse it with `parse_window`.
+    """
+    loads = loads or _loads
+    try:
+        payload = loads(body)
+    except ValueError:
+        raise PayloadError("Request body is not valid JSON.") from None
+
+    return parse_window(payload, freq)
@@ -0,0 +1,451 @@
+"""
+Background refit of the served forecaster.
+
+`RefitWorker` reads the training series from the series store and its
+exogenous variables from the exog provider, then trains a new
+`ForecasterAutoreg` in a separate process, so the event loop and the
+prediction threads of the service are not slowed down by the fit:
+
+1. The candidate is fitted on the series without its last `holdout`
+   periods and scored (MAE) on them, next to the model being served. Both
+   are only scored on the holdout periods after the end of the training
+   range of the served model, which has already seen the others. If there
+   are none, both are scored on the whole holdout (which favours the
+   served model). If the served model cannot predict the series, the
+   candidate is only accepted under the absolute limit `max_mae`, and
+   rejected when it is not set. The result says which check was made.
+2. If it is not worse than the served model by more than `tolerance`, it
+   is refitted on the whole series and written over the served pickle with
+   `os.replace`.
+3. The registry loads the new file, which swaps the served entry atomically.
+
+Only pickles can be refitted: artifacts keep the fitted trees but not the
+regressor configuration to clone. Every refit trains in a fresh process, so
+its peak memory is its own. Duration, peak memory of the training process
+and validation errors are logged and kept in `status()`.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _lower_priority() -> None:
+    # The refit competes with serving for the same cores
+    try:
+        os.nice(10)
+    except OSError:
+        pass
+
+
+def _peak_memory_bytes() -> int:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def fit_and_validate(
+    y: pd.Series,
+    exog: Optional[pd.DataFrame],
+    regressor,
+    lags: np.ndarray,
+    current_path: str,
+    holdout: int,
+    tolerance: float,
+    max_mae: Optional[float]=None
+) -> dict:
+    """
+    Train and validate a candidate and, if accepted, write it over
+    `current_path`. Runs in the training process.
+
+    Parameters
+    ----------
+    y : pandas Series
+        Training series with a frequency.
+
+    exog : pandas DataFrame, None
+        Exogenous variables with the same index as `y`.
+
+    regressor : object
+        Unfitted scikit-learn regressor, cloned for every fit.
+
+    lags : numpy ndarray
+        Lags of the forecaster.
+
+    current_path : str
+        Pickle of the served forecaster.
+
+    holdout : int
+        Last periods of `y` used for validation.
+
+    tolerance : float
+        Relative increase of the holdout MAE over the served model that is
+        still accepted.
+
+    max_mae : float, default `None`
+        Holdout MAE under which the candidate is accepted when the served
+        model cannot predict the series. If `None` it is rejected.
+
+    Returns
+    -------
+    result : dict
+
+    """
+    from sklearn.base import clone
+    from skforecast.ForecasterAutoreg import ForecasterAutoreg
+    from skforecast.utils import load_forecaster, save_forecaster
+
+    from engine import predict_windows
+
+    start = time.perf_counter()
+    train_y, test_y = y.iloc[:-holdout], y.iloc[-holdout:]
+    train_exog = None if exog is None else exog.iloc[:-holdout]
+
+    candidate = ForecasterAutoreg(regressor=clone(regressor), lags=lags)
+    candidate.fit(y=train_y, exog=train_exog)
+    pred = predict_windows(
+               forecaster   = candidate,
+               last_windows = [train_y.to_numpy()],
+               end_dates    = train_y.index[[-1]],
+               steps        = [holdout],
+               exog         = exog
+           )[0]
+    errors_candidate = np.abs(pred - test_y.to_numpy())
+
+    current = load_forecaster(current_path, verbose=False)
+    # Periods the served model was trained on would favour it
+    unseen = test_y.index > pd.Timestamp(current.training_range[-1])
+    try:
+        pred = predict_windows(
+                   forecaster   = current,
+                   last_windows = [train_y.to_numpy()],
+                   end_dates    = train_y.index[[-1]],
+                   steps        = [holdout],
+                   exog         = exog
+               )[0]
+        errors_current = np.abs(pred - test_y.to_numpy())
+    except (ValueError, KeyError):
+        # The served model cannot predict this series (e.g. other columns)
+        errors_current = None
+
+    if errors_current is None:
+        mae_candidate = float(np.mean(errors_candidate))
+        mae_current = None
+        n_scored = holdout
+        if max_mae is None:
+            accepted = False
+            validation = "served model cannot predict the series and no max_mae is set"
+        else:
+            accepted = mae_candidate <= max_mae
+            validation = "served model cannot predict the series, candidate checked against max_mae"
+    else:
+        if unseen.any():
+            validation = "both models scored on the holdout periods unseen by the served model"
+        else:
+            # Conservative: the served model has seen every period
+            unseen[:] = True
+            validation = "served model trained on the whole holdout, both scored on all of it"
+        mae_candidate = float(np.mean(errors_candidate[unseen]))
+        mae_current = float(np.mean(errors_current[unseen]))
+        n_scored = int(unseen.sum())
+        accepted = mae_candidate <= mae_current * (1 + tolerance)
+
+    if accepted:
+        forecaster = ForecasterAutoreg(regressor=clone(regressor), lags=lags)
+        forecaster.fit(y=y, exog=exog)
+        tmp = f"{current_path}.refit-{os.getpid()}"
+        save_forecaster(forecaster, file_name=tmp, verbose=False)
+        os.replace(tmp, current_path)
+
+    return {
+        "accepted": accepted,
+        "mae_candidate": mae_candidate,
+        "mae_current": mae_current,
+        "n_train": len(y),
+        "holdout": holdout,
+        "n_scored": n_scored,
+        "validation": validation,
+        "training_range": [y.index[0].isoformat(), y.index[-1].isoformat()],
+        "fit_seconds": time.perf_counter() - start,
+        "peak_memory_bytes": _peak_memory_bytes(),
+    }
+
+
+class RefitWorker:
+    """
+    Refit the forecaster of `registry` in a separate process and swap it in.
+
+    Parameters
+    ----------
+    registry : ForecasterRegistry
+        Registry of the served forecaster. Its file is replaced by the refit
+        model and reloaded.
+
+    series_store : SeriesStore
+        Store with the training series.
+
+    exog_provider : ExogProvider
+        Provider of the exogenous variables of the training period.
+
+    series_id : str, default `None`
+        Training series. Can also be given to `refit()`.
+
+    holdout : int, default `12`
+        Last periods of the series used for validation.
+
+    tolerance : float, default `0.0`
+        Relative increase of the holdout MAE over the served model that is
+        still accepted.
+
+    max_mae : float, default `None`
+        Holdout MAE under which a candidate is accepted when the served model
+        cannot predict the series. If `None` such candidates are rejected.
+
+    interval : float, default `0`
+        Seconds between two refits made by `run()`. `0` disables them.
+
+    """
+
+    def __init__(
+        self,
+        registry,
+        series_store,
+        exog_provider,
+        series_id: Optional[str]=None,
+        holdout: int=12,
+        tolerance: float=0.0,
+        max_mae: Optional[float]=None,
+        interval: float=0
+    ) -> None:
+
+        self.registry      = registry
+        self.series_store  = series_store
+        self.exog_provider = exog_provider
+        self.series_id     = series_id
+        self.holdout       = holdout
+        self.tolerance     = tolerance
+        self.max_mae       = max_mae
+        self.interval      = interval
+        self.runs          = 0
+        self.accepted      = 0
+        self.failures      = 0
+        self.last_result   = None
+        self.run_series_id = None
+        self._task         = None
+        self._executor     = None
+
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+
+    def _forecaster(self):
+        """
+        Served forecaster. Raises `ValueError` if it cannot be refitted.
+        """
+        forecaster = self.registry.get().forecaster
+        if not hasattr(forecaster.regressor, 'get_params'):
+            raise ValueError(
+                ("The served forecaster has no scikit-learn regressor to clone "
+                 "(artifacts keep only the fitted trees). Serve a pickle to refit.")
+            )
+
+        return forecaster
+
+
+    def _series(self, forecaster, series_id: str) -> pd.Series:
+        """
+        Stored series `series_id`. Raises `KeyError` if it is not in the store
+        and `ValueError` if it has missing values or is too short to train
+        and validate `forecaster`.
+        """
+        y = self.series_store.history(series_id)
+        if y.isna().any():
+            raise ValueError(f"Series '{series_id}' has missing values.")
+        if len(y) <= self.holdout + forecaster.window_size:
+            raise ValueError(
+                (f"Series '{series_id}' has {len(y)} observations, more than "
+                 f"holdout + window_size ({self.holdout + forecaster.window_size}) "
+                 f"are needed.")
+            )
+
+        return y
+
+
+    def check(self, series_id: Optional[str]=None) -> str:
+        """
+        Training series of a refit, `series_id` or the default one. Raises
+        `ValueError` if there is none, the served forecaster cannot be
+        refitted or the series cannot train it, and `KeyError` if the series
+        is not in the store.
+        """
+        series_id = series_id or self.series_id
+        if series_id is None:
+            raise ValueError("No training series given (`series_id` or `REFIT_SERIES_ID`).")
+        self._series(self._forecaster(), series_id)
+
+        return series_id
+
+
+    def _training_data(self, series_id: str):
+        """
+        Training series, exogenous variables aligned to it and the regressor
+        to clone.
+        """
+        from sklearn.base import clone
+
+        forecaster = self._forecaster()
+        y = self._series(forecaster, series_id)
+
+        exog = None
+        if forecaster.included_exog:
+            snapshot = self.exog_provider.get_for(
+                           forecaster.exog_col_names, y.index[0], y.index[-1]
+                       )
+            exog = snapshot.data[forecaster.exog_col_names].reindex(y.index)
+            if exog.isna().any().any():
+                raise ValueError("Exogenous variables do not cover the training period.")
+
+        return y, exog, clone(forecaster.regressor), np.asarray(forecaster.lags)
+
+
+    def start(self, series_id: Optional[str]=None) -> bool:
+        """
+        Start a refit in the background. Returns `False` if one is running.
+        """
+        if self.running:
+            return False
+        self.run_series_id = series_id or self.series_id
+        self._task = asyncio.ensure_future(self.refit(series_id))
+
+        return True
+
+
+    async def refit(self, series_id: Optional[str]=None) -> dict:
+        """
+        Refit, validate and, if accepted, swap the served forecaster.
+        """
+        series_id = series_id or self.series_id
+        self.run_series_id = series_id
+        started_at = datetime.now(timezone.utc)
+        start = time.perf_counter()
+        self.runs += 1
+        try:
+            if series_id is None:
+                raise ValueError("No training series given (`REFIT_SERIES_ID`).")
+            y, exog, regressor, lags = await asyncio.to_thread(self._training_data, series_id)
+
+            # A new process per refit: `ru_maxrss` is the peak of the
+            # process, so a reused one would report earlier refits
+            self._executor = ProcessPoolExecutor(
+                                 max_workers = 1,
+                                 mp_context  = multiprocessing.get_context('spawn'),
+                                 initializer = _lower_priority
+                             )
+            try:
+                result = await asyncio.wrap_future(
+                             self._executor.submit(
+                                 fit_and_validate, y, exog, regressor, lags,
+                                 self.registry.file_name, self.holdout, self.tolerance,
+                                 self.max_mae
+                             )
+                         )
+            finally:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+            if result["accepted"]:
+                entry = await asyncio.to_thread(self.registry.load)
+                result["version"] = entry.version
+                self.accepted += 1
+        except Exception as e:
+            self.failures += 1
+            result = {"accepted": False, "error": f"{type(e).__name__}: {e}"}
+            logger.exception("Refit of series %s failed", series_id)
+
+        result["series_id"] = series_id
+        result["started_at"] = started_at.isoformat()
+        result["seconds"] = time.perf_counter() - start
+        self.last_result = result
+        metrics.observe('refit', result["seconds"])
+
+        if "error" not in result:
+            logger.info(
+                ("Refit of series %s %s in %.1f s (fit %.1f s, peak memory %.0f MB): "
+                 "holdout MAE %.4f, served model %s (%s)"),
+                series_id, "accepted" if result["accepted"] else "rejected",
+                result["seconds"], result["fit_seconds"],
+                result["peak_memory_bytes"] / 2**20, result["mae_candidate"],
+                "n/a" if result["mae_current"] is None else f"{result['mae_current']:.4f}",
+                result["validation"]
+            )
+
+        return result
+
+
+    async def run(self) -> None:
+        """
+        Refit every `interval` seconds, if it is greater than 0.
+        """
+        if not self.interval:
+            return
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self.running:
+                self._task = asyncio.ensure_future(self.refit())
+                await asyncio.shield(self._task)
+
+
+    def status(self) -> dict:
+        return {
+            "running": self.running,
+            "series_id": self.run_series_id,
+            "default_series_id": self.series_id,
+            "holdout": self.holdout,
+            "tolerance": self.tolerance,
+            "max_mae": self.max_mae,
+            "interval": self.interval,
+            "runs": self.runs,
+            "accepted": self.accepted,
+            "failures": self.failures,
+            "last_result": self.last_result,
+        }
+
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def worker_from_env(registry, series_store, exog_provider) -> RefitWorker:
+    """
+    Build the worker from `REFIT_SERIES_ID`, `REFIT_HOLDOUT`,
+    `REFIT_TOLERANCE`, `REFIT_MAX_MAE` (unset to reject candidates that
+    cannot be compared) and `REFIT_INTERVAL` (seconds, `0` disables periodic
+    refits).
+    """
+    max_mae = os.environ.get('REFIT_MAX_MAE')
+
+    return RefitWorker(
+               registry      = registry,
+               series_store  = series_store,
+               exog_provider = exog_provider,
+               series_id     = os.environ.get('REFIT_SERIES_ID'),
+               holdout       = int(os.environ.get('REFIT_HOLDOUT', 12)),
+               tolerance     = float(os.environ.get('REFIT_TOLERANCE', 0.0)),
+               max_mae       = None if max_mae is None else float(max_mae),
+               interval      = float(os.environ.get('REFIT_INTERVAL', 0))
+           )
@@ -0,0 +1,439 @@
+"""
+In-memory registry for the forecaster served by the API.
+
+The forecaster is loaded once and every request reads the same instance.
+Both `save_forecaster` pickles and artifact directories written by
+`artifact.export_forecaster` are supported.
+A background watcher compares the file modification time with the one that
+was loaded and, when it changes, loads the new version and swaps the
+reference. Requests that already hold the previous entry finish with it.
+
+`ModelStore` serves many forecasters from a directory tree
+`{root}/{model_name}/{version}`. Models are loaded on first use and kept
+resident while they fit in a memory budget; the least recently used ones are
+evicted when a new model does not fit.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from artifact import METADATA_FILE, is_artifact, load_artifact
+from engine import RecursivePredictor
+from forest import CompiledRegressor
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LoadedForecaster(NamedTuple):
+    """
+    Immutable snapshot of a loaded forecaster, its prediction engine and the
+    metadata of the file it was read from.
+    """
+    forecaster: Any
+    predictor: RecursivePredictor
+    file_name: str
+    version: str
+    mtime: float
+    size: int
+    loaded_at: datetime
+    load_seconds: float
+    memory_bytes: int
+
+    def info(self) -> dict:
+        return {
+            "file_name": self.file_name,
+            "version": self.version,
+            "mtime": datetime.fromtimestamp(self.mtime, tz=timezone.utc).isoformat(),
+            "size": self.size,
+            "loaded_at": self.loaded_at.isoformat(),
+            "load_seconds": self.load_seconds,
+            "memory_bytes": self.memory_bytes,
+            "regressor": type(self.predictor.regressor).__name__,
+        }
+
+
+def _file_sha256(file_name: str) -> str:
+    """
+    Hash of a file or, for an artifact directory, of all its files.
+    """
+    if os.path.isdir(file_name):
+        paths = [os.path.join(file_name, name) for name in sorted(os.listdir(file_name))]
+    else:
+        paths = [file_name]
+
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def _memory_bytes(file_name: str, predictor: RecursivePredictor) -> int:
+    """
+    Rough memory footprint of a loaded forecaster: its size on disk plus the
+    flat node arrays built from a pickled forest.
+    """
+    if os.path.isdir(file_name):
+        size = sum(
+            os.path.getsize(os.path.join(file_name, name)) for name in os.listdir(file_name)
+        )
+    else:
+        size = os.path.getsize(file_name)
+    if isinstance(predictor.regressor, CompiledRegressor):
+        flat = predictor.regressor.flat
+        size += sum(
+            getattr(flat, name).nbytes
+            for name in ('feature', 'threshold', 'left', 'right', 'value', 'children')
+        )
+
+    return size
+
+
+def _stat(file_name: str) -> os.stat_result:
+    """
+    Stat of the pickle or, for an artifact directory, of its metadata file,
+    which is written last.
+    """
+    if os.path.isdir(file_name):
+        return os.stat(os.path.join(file_name, METADATA_FILE))
+
+    return os.stat(file_name)
+
+
+class ForecasterRegistry:
+    """
+    Keep a forecaster loaded in memory and reload it when its file changes.
+
+    Parameters
+    ----------
+    file_name : str, default `'forecaster.py'`
+        Path to the file created with `skforecast.utils.save_forecaster` or to
+        an artifact directory created with `artifact.export_forecaster`.
+
+    check_interval : float, default `5.0`
+        Seconds between two checks of the file modification time made by
+        `watch()`.
+
+    """
+
+    def __init__(
+        self,
+        file_name: str='forecaster.py',
+        check_interval: float=5.0
+    ) -> None:
+
+        self.file_name      = file_name
+        self.check_interval = check_interval
+        self._entry         = None
+        self._lock          = threading.Lock()
+
+
+    @property
+    def loaded(self) -> bool:
+        return self._entry is not None
+
+
+    def get(self) -> LoadedForecaster:
+        """
+        Return the entry currently being served. The returned object is never
+        mutated, a reload replaces it with a new one.
+        """
+        entry = self._entry
+        if entry is None:
+            raise RuntimeError(
+                "No forecaster loaded. Call `load()` before serving requests."
+            )
+
+        return entry
+
+
+    def load(self) -> LoadedForecaster:
+        """
+        Load the artifact from disk and make it the served entry.
+        """
+        with self._lock:
+            stat = _stat(self.file_name)
+            start = time.perf_counter()
+            if is_artifact(self.file_name):
+                forecaster = load_artifact(self.file_name)
+            else:
+                # Only pickles need skforecast, artifacts are served without it
+                from skforecast.utils import load_forecaster
+                forecaster = load_forecaster(self.file_name, verbose=False)
+            predictor = RecursivePredictor.from_forecaster(forecaster)
+            load_seconds = time.perf_counter() - start
+
+            entry = LoadedForecaster(
+                        forecaster   = forecaster,
+                        predictor    = predictor,
+                        file_name    = self.file_name,
+                        version      = _file_sha256(self.file_name)[:12],
+                        mtime        = stat.st_mtime,
+                        size         = stat.st_size,
+                        loaded_at    = datetime.now(timezone.utc),
+                        load_seconds = load_seconds,
+                        memory_bytes = _memory_bytes(self.file_name, predictor)
+                    )
+            # Swapping a single reference is atomic, in-flight requests keep
+            # the entry they already read.
+            self._entry = entry
+        metrics.observe('model_load', load_seconds)
+
+        logger.info("Loaded forecaster %s (version %s) in %.3f s",
+                    self.file_name, entry.version, load_seconds)
+
+        return entry
+
+
+    def changed_on_disk(self) -> bool:
+        """
+        Whether the file modification time or size differs from the loaded one.
+        """
+        entry = self._entry
+        if entry is None:
+            return True
+        try:
+            stat = _stat(self.file_name)
+        except FileNotFoundError:
+            return False
+
+        return (stat.st_mtime, stat.st_size) != (entry.mtime, entry.size)
+
+
+    def reload_if_changed(self) -> Optional[LoadedForecaster]:
+        """
+        Reload the artifact if it changed on disk. If the new file cannot be
+        loaded (for example, it is still being written) the current entry
+        keeps being served and the reload is retried on the next check.
+        """
+        if not self.changed_on_disk():
+            return None
+        try:
+            return self.load()
+        except Exception:
+            logger.exception("Could not reload forecaster %s, keeping version %s",
+                             self.file_name, getattr(self._entry, 'version', None))
+            return None
+
+
+    async def watch(self) -> None:
+        """
+        Poll the artifact every `check_interval` seconds and reload it when it
+        changes. Loading runs in a worker thread so the event loop keeps
+        serving requests.
+        """
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await asyncio.to_thread(self.reload_if_changed)
+
+
+_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_][A-Za-z0-9_.-]*$')
+
+
+def _natural_key(version: str) -> Tuple:
+    """
+    Sort key so that `v10` comes after `v9`.
+    """
+    return tuple(
+        (0, int(part), '') if part.isdigit() else (1, 0, part)
+        for part in re.split(r'(\d+)', version)
+    )
+
+
+class ModelStore:
+    """
+    Serve many forecasters keyed by `{model_name}/{version}`.
+
+    Every model version is a `save_forecaster` pickle or an artifact
+    directory at `{root}/{model_name}/{version}`. Models are loaded lazily on
+    first request. When the loaded models exceed `memory_budget`, the least
+    recently used ones are evicted; resident models are served with no extra
+    cost. The listing of models and versions is kept in memory, so resolving
+    a model does not touch the disk; `watch()` refreshes it, and new models
+    or versions are served after at most `check_interval` seconds.
+
+    Parameters
+    ----------
+    root : str, default `'models'`
+        Directory with one subdirectory per model name.
+
+    memory_budget : int, default `512 * 2**20`
+        Bytes of resident models (see `LoadedForecaster.memory_bytes`). The
+        model being requested is always kept, even if it alone exceeds it.
+
+    check_interval : float, default `5.0`
+        Seconds between two checks for changes in the listing and the
+        resident models made by `watch()`.
+
+    """
+
+    def __init__(
+        self,
+        root: str='models',
+        memory_budget: int=512 * 2**20,
+        check_interval: float=5.0
+    ) -> None:
+
+        self.root           = root
+        self.memory_budget  = memory_budget
+        self.check_interval = check_interval
+        self.evictions      = 0
+        self._resident      = OrderedDict()
+        self._loading       = {}
+        self._lock          = threading.Lock()
+        self._versions      = self._list_versions()
+
+
+    def _list_versions(self) -> Dict[str, List[str]]:
+        """
+        Read the available versions of every model from disk, oldest first.
+        """
+        if not os.path.isdir(self.root):
+            return {}
+
+        listing = {}
+        for name in sorted(os.listdir(self.root)):
+            path = os.path.join(self.root, name)
+            if _NAME_PATTERN.match(name) and os.path.isdir(path):
+                listing[name] = sorted(
+                    (v for v in os.listdir(path) if _NAME_PATTERN.match(v)),
+                    key=_natural_key
+                )
+
+        return listing
+
+
+    def refresh_versions(self) -> None:
+        """
+        Replace the in-memory listing with the one on disk.
+        """
+        # Swapping the reference is atomic, readers see the old or new dict
+        self._versions = self._list_versions()
+
+
+    def models(self) -> Dict[str, List[str]]:
+        """
+        Available versions of every model, oldest first.
+        """
+        return {name: list(versions) for name, versions in self._versions.items()}
+
+
+    def versions(self, model_name: str) -> List[str]:
+
+        versions = self._versions.get(model_name)
+        if versions is None:
+            raise KeyError(f"Model '{model_name}' not found.")
+
+        return versions
+
+
+    def resolve(self, model_name: str, version: Optional[str]=None) -> str:
+        """
+        Key `{model_name}/{version}`. If `version` is `None`, the latest one.
+        """
+        versions = self.versions(model_name)
+        if version is None:
+            if not versions:
+                raise KeyError(f"Model '{model_name}' has no versions.")
+            version = versions[-1]
+        elif version not in versions:
+            raise KeyError(f"Version '{version}' of model '{model_name}' not found.")
+
+        return f"{model_name}/{version}"
+
+
+    def peek(self, key: str) -> Optional[LoadedForecaster]:
+        """
+        Entry of a resident model, or `None` if it is not loaded. Never loads.
+        """
+        with self._lock:
+            registry = self._resident.get(key)
+            if registry is None:
+                return None
+            self._resident.move_to_end(key)
+
+        return registry.get()
+
+
+    def get(self, key: str) -> LoadedForecaster:
+        """
+        Entry of a model, loading it if needed. Concurrent requests for the
+        same model wait for a single load.
+        """
+        entry = self.peek(key)
+        if entry is not None:
+            return entry
+
+        with self._lock:
+            lock = self._loading.setdefault(key, threading.Lock())
+        with lock:
+            entry = self.peek(key)
+            if entry is None:
+                registry = ForecasterRegistry(
+                               file_name      = os.path.join(self.root, key),
+                               check_interval = self.check_interval
+                           )
+                entry = registry.load()
+                with self._lock:
+                    self._resident[key] = registry
+                    self._evict(keep=key)
+        with self._lock:
+            self._loading.pop(key, None)
+
+        return entry
+
+
+    def _evict(self, keep: str) -> None:
+        """
+        Drop least recently used models until the budget is met. Must be
+        called with `_lock` held.
+        """
+        while self._memory_bytes() > self.memory_budget and len(self._resident) > 1:
+            key = next(iter(self._resident))
+            if key == keep:
+                self._resident.move_to_end(key)
+                continue
+            registry = self._resident.pop(key)
+            self.evictions += 1
+            logger.info("Evicted forecaster %s (version %s) from memory",
+                        key, registry.get().version)
+
+
+    def _memory_bytes(self) -> int:
+        # Must be called with `_lock` held
+        return sum(r.get().memory_bytes for r in self._resident.values())
+
+
+    @property
+    def memory_bytes(self) -> int:
+        with self._lock:
+            return self._memory_bytes()
+
+
+    def resident(self) -> Dict[str, dict]:
+        with self._lock:
+            return {key: r.get().info() for key, r in self._resident.items()}
+
+
+    async def watch(self) -> None:
+        """
+        Refresh the listing of models and reload resident models whose files
+        changed, every `check_interval` seconds.
+        """
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await asyncio.to_thread(self.refresh_versions)
+            with self._lock:
+                registries = list(self._resident.values())
+            for registry in registries:
+                await asyncio.to_thread(registry.reload_if_changed)
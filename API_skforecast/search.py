@@ -0,0 +1,736 @@
+"""
+Grid search of `ForecasterAutoreg` with cached lag matrices.
+
+`skforecast.model_selection.grid_search_forecaster` runs a
+`backtesting_forecaster` for every combination of `lags_grid` and
+`param_grid`, one after another, and every fold of every backtest builds its
+lagged training matrix again, even when only the regressor parameters
+change. `grid_search_parallel` evaluates the same candidates and returns the
+same table, but:
+
+- The training matrix of each distinct `lags` is built once, with
+  `features.train_matrices`, and every fold fits on a slice of its rows.
+  Predictions use `engine.RecursivePredictor`.
+- Candidates are evaluated in a process pool. Workers get the series and
+  exog once, when they start; a task is only `(lags, params)`. The parent
+  builds the matrices of every distinct `lags` before starting the pool and
+  packs them in one shared memory block (`_SharedMatrices`), which every
+  worker maps instead of building and holding its own copies. Matrices that
+  are a view of the series (lags `1..max_lag` and no exog) cost nothing to
+  build and are not shared.
+- Every evaluated candidate is written to a `SearchStore` (SQLite) as soon
+  as it finishes. Running the same search with the same store skips the
+  candidates already there, so an interrupted search resumes where it
+  stopped.
+
+`successive_halving_search` evaluates the same candidates on a short,
+recent test period first and backtests only the best of them on longer
+ones, up to the whole period of the exhaustive search.
+
+Forecasters with `transformer_y`, `transformer_exog` or `weight_func` are
+not supported; use `grid_search_forecaster` for them.
+"""
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from copy import deepcopy
+from datetime import datetime, timezone
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from backtesting import make_folds, metric_function
+from engine import RecursivePredictor
+from features import train_matrices
+
+logger = logging.getLogger(__name__)
+
+
+class _Evaluator:
+    """
+    Backtest of one candidate over NumPy arrays. Built once per worker.
+    """
+
+    def __init__(
+        self,
+        y: np.ndarray,
+        exog: Optional[np.ndarray],
+        regressor,
+        steps: int,
+        initial_train_size: int,
+        fixed_train_size: bool,
+        refit: bool,
+        metrics: list
+    ) -> None:
+
+        self.y                  = y
+        self.exog               = exog
+        self.regressor          = regressor
+        self.steps              = steps
+        self.initial_train_size = initial_train_size
+        self.fixed_train_size   = fixed_train_size
+        self.refit              = refit
+        self.metrics            = metrics
+        self._matrices          = {}
+        self._folds             = {}
+
+
+    def __getstate__(self) -> dict:
+        # Workers get the matrices from shared memory, not pickled copies
+        state = self.__dict__.copy()
+        state['_matrices'] = {}
+
+        return state
+
+
+    @property
+    def test_size(self) -> int:
+        return len(self.y) - self.initial_train_size
+
+
+    def matrix(self, lags: np.ndarray) -> np.ndarray:
+        """
+        Training matrix of `lags` for the whole series, built on first use.
+        """
+        key = tuple(lags.tolist())
+        X = self._matrices.get(key)
+        if X is None:
+            X, _ = train_matrices(self.y, lags, self.exog)
+            self._matrices[key] = X
+
+        return X
+
+
+    def folds(self, test_size: Optional[int]=None) -> list:
+        """
+        Folds of a backtest of the last `test_size` observations. Training
+        windows have the same size as in the full backtest if
+        `fixed_train_size`, otherwise they start at the first observation.
+        """
+        test_size = min(test_size or self.test_size, self.test_size)
+        folds = self._folds.get(test_size)
+        if folds is None:
+            n = len(self.y)
+            offset = n - test_size - self.initial_train_size if self.fixed_train_size else 0
+            folds = [
+                fold._replace(train_start=fold.train_start + offset, train_end=fold.train_end + offset)
+                for fold in make_folds(
+                    n - offset, n - test_size - offset, self.steps, self.fixed_train_size
+                )
+            ]
+            self._folds[test_size] = folds
+
+        return folds
+
+
+    def _predict(self, regressor, lags: np.ndarray, folds: list) -> np.ndarray:
+        """
+        Predictions of `folds` from the values before each of them.
+        """
+        max_lag = int(lags.max())
+        windows = np.vstack([self.y[f.train_end - max_lag:f.train_end] for f in folds])
+        steps = np.array([f.steps for f in folds])
+        exog_values = None
+        if self.exog is not None:
+            exog_values = np.full((len(folds), steps.max(), self.exog.shape[1]), np.nan)
+            for i, f in enumerate(folds):
+                exog_values[i, :f.steps] = self.exog[f.train_end:f.train_end + f.steps]
+
+        predictor = RecursivePredictor(regressor=regressor, lags=lags, window_size=max_lag)
+        predictions = predictor.predict(windows, steps, exog_values)
+
+        return np.concatenate([predictions[i, :f.steps] for i, f in enumerate(folds)])
+
+
+    def evaluate(
+        self,
+        lags: np.ndarray,
+        params: dict,
+        test_size: Optional[int]=None
+    ) -> Tuple[List[float], float, int]:
+        """
+        Metrics of the backtest of `(lags, params)` on the last `test_size`
+        observations (all after `initial_train_size` by default), its
+        duration and the number of fits.
+        """
+        from sklearn.base import clone
+
+        start = time.perf_counter()
+        X = self.matrix(lags)
+        max_lag = int(lags.max())
+        folds = self.folds(test_size)
+
+        if self.refit:
+            predictions = []
+            for fold in folds:
+                regressor = clone(self.regressor).set_params(**params)
+                regressor.fit(
+                    X[fold.train_start:fold.train_end - max_lag],
+                    self.y[fold.train_start + max_lag:fold.train_end]
+                )
+                predictions.append(self._predict(regressor, lags, [fold]))
+            predictions = np.concatenate(predictions)
+        else:
+            first = folds[0]
+            regressor = clone(self.regressor).set_params(**params)
+            regressor.fit(
+                X[first.train_start:first.train_end - max_lag],
+                self.y[first.train_start + max_lag:first.train_end]
+            )
+            predictions = self._predict(regressor, lags, folds)
+
+        y_true = self.y[folds[0].train_end:]
+        values = [float(m(y_true=y_true, y_pred=predictions)) for m in self.metrics]
+
+        return values, time.perf_counter() - start, len(folds) if self.refit else 1
+
+
+class _SharedMatrices:
+    """
+    Training matrices of several `lags` packed in one shared memory block.
+    Each keeps its memory order, so fits give the same floating point
+    results as with the matrix built in the worker.
+    """
+
+    def __init__(self, matrices: Dict[tuple, np.ndarray]) -> None:
+
+        self.specs = {}
+        size = 0
+        for key, X in matrices.items():
+            order = 'F' if X.flags.f_contiguous and not X.flags.c_contiguous else 'C'
+            self.specs[key] = (size, X.shape, order)
+            size += X.size
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size * 8, 1))
+        data = np.ndarray(size, dtype=np.float64, buffer=self.shm.buf)
+        for key, X in matrices.items():
+            offset, _, order = self.specs[key]
+            data[offset:offset + X.size] = X.ravel(order=order)
+
+
+    def layout(self) -> dict:
+        return {"name": self.shm.name, "specs": self.specs}
+
+
+    def close(self) -> None:
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _attach_matrices(shm: shared_memory.SharedMemory, layout: dict) -> Dict[tuple, np.ndarray]:
+    """
+    Read-only views of the matrices of a `_SharedMatrices` block.
+    """
+    matrices = {}
+    for key, (offset, shape, order) in layout["specs"].items():
+        X = np.ndarray(shape, dtype=np.float64, buffer=shm.buf, offset=offset * 8, order=order)
+        X.flags.writeable = False
+        matrices[key] = X
+
+    return matrices
+
+
+# Evaluator of a worker process and its shared matrices, set once by
+# `_init_worker`
+_evaluator = None
+_shm = None
+
+
+def _init_worker(evaluator: _Evaluator, layout: dict) -> None:
+    global _evaluator, _shm
+
+    # Workers share the resource tracker of the parent, which unlinks the block
+    _shm = shared_memory.SharedMemory(name=layout["name"])
+    evaluator._matrices.update(_attach_matrices(_shm, layout))
+    _evaluator = evaluator
+
+
+def _evaluate(
+    lags: np.ndarray,
+    params: dict,
+    test_size: Optional[int]
+) -> Tuple[List[float], float, int]:
+    return _evaluator.evaluate(lags, params, test_size)
+
+
+class SearchStore:
+    """
+    Evaluated candidates of grid searches, in a SQLite file.
+
+    Results are keyed by a fingerprint of the search (data, folds, metrics
+    and base regressor) and of the candidate (lags and params), so one file
+    can hold several searches.
+
+    Parameters
+    ----------
+    path : str
+        SQLite file. Created if it does not exist.
+
+    """
+
+    def __init__(self, path: str) -> None:
+
+        self.path  = path
+        self._lock = threading.Lock()
+        self._con  = sqlite3.connect(path, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                search TEXT NOT NULL,
+                candidate TEXT NOT NULL,
+                metrics TEXT NOT NULL,
+                seconds REAL,
+                created_at TEXT,
+                PRIMARY KEY (search, candidate)
+            ) WITHOUT ROWID
+            """
+        )
+        self._con.commit()
+
+
+    def get(self, search: str) -> Dict[str, List[float]]:
+        """
+        Metrics of the candidates of `search` already evaluated.
+        """
+        with self._lock:
+            rows = self._con.execute(
+                       "SELECT candidate, metrics FROM results WHERE search = ?",
+                       (search,)
+                   ).fetchall()
+
+        return {candidate: json.loads(values) for candidate, values in rows}
+
+
+    def put(
+        self,
+        search: str,
+        candidate: str,
+        values: List[float],
+        seconds: float
+    ) -> None:
+
+        with self._lock:
+            self._con.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (search, candidate, json.dumps(values), seconds,
+                 datetime.now(timezone.utc).isoformat())
+            )
+            self._con.commit()
+
+
+    def close(self) -> None:
+        with self._lock:
+            self._con.close()
+
+
+def _candidate_key(lags: np.ndarray, params: dict, test_size: Optional[int]=None) -> str:
+    candidate = {"lags": lags.tolist(), "params": params}
+    if test_size is not None:
+        candidate["test_size"] = test_size
+
+    return json.dumps(candidate, sort_keys=True, default=repr)
+
+
+def _search_key(
+    y: pd.Series,
+    exog: Optional[pd.DataFrame],
+    regressor,
+    steps: int,
+    initial_train_size: int,
+    fixed_train_size: bool,
+    refit: bool,
+    metric_names: List[str],
+    searched: List[str]
+) -> str:
+    """
+    Fingerprint of everything but the candidates that changes the results.
+    Parameters in `searched` are set by the candidates and left out.
+    """
+    base_params = {
+        k: v for k, v in regressor.get_params(deep=False).items() if k not in searched
+    }
+    h = hashlib.sha1()
+    h.update(np.ascontiguousarray(y.to_numpy(dtype=float)).tobytes())
+    h.update(str((y.index[0], y.index[-1], len(y))).encode())
+    if exog is not None:
+        h.update(np.ascontiguousarray(exog.to_numpy(dtype=float)).tobytes())
+        h.update(json.dumps(list(map(str, exog.columns))).encode())
+    h.update(json.dumps(
+        [type(regressor).__name__, base_params, steps,
+         initial_train_size, fixed_train_size, refit, metric_names],
+        sort_keys=True, default=repr
+    ).encode())
+
+    return h.hexdigest()
+
+
+class _Search:
+    """
+    Candidates of a search, their evaluation in this process or in a pool of
+    workers, and their results (in memory and in the store).
+    """
+
+    def __init__(
+        self,
+        forecaster,
+        y: pd.Series,
+        param_grid: dict,
+        steps: int,
+        metric: Union[str, Callable, list],
+        initial_train_size: int,
+        fixed_train_size: bool,
+        exog: Optional[Union[pd.Series, pd.DataFrame]],
+        lags_grid: Optional[list],
+        refit: bool,
+        n_jobs: Optional[int],
+        store: Optional[Union[str, SearchStore]],
+        mp_context: str
+    ) -> None:
+
+        from sklearn.model_selection import ParameterGrid
+
+        if type(forecaster).__name__ != 'ForecasterAutoreg':
+            raise TypeError("`forecaster` must be a `ForecasterAutoreg`.")
+        if (forecaster.transformer_y is not None or forecaster.transformer_exog is not None
+                or forecaster.weight_func is not None):
+            raise ValueError(
+                ("Forecasters with transformers or `weight_func` are not supported. "
+                 "Use `grid_search_forecaster`.")
+            )
+        self.y = y
+        self.exog = exog
+        if isinstance(exog, pd.Series):
+            exog = exog.to_frame()
+        if exog is not None and not exog.index.equals(y.index):
+            raise ValueError("`exog` must have the same index as `y`.")
+
+        metrics = metric if isinstance(metric, list) else [metric]
+        self.metric_names = [m if isinstance(m, str) else m.__name__ for m in metrics]
+        if len(set(self.metric_names)) != len(self.metric_names):
+            raise ValueError("When `metric` is a `list`, each metric name must be unique.")
+
+        # Same normalization of `lags` as the forecaster
+        template = deepcopy(forecaster)
+        self.candidates = []
+        for lags in ([forecaster.lags] if lags_grid is None else lags_grid):
+            template.set_lags(lags)
+            for params in ParameterGrid(param_grid):
+                self.candidates.append((template.lags.copy(), params))
+
+        self.own_store = isinstance(store, str)
+        self.store = SearchStore(store) if self.own_store else store
+        self.search = _search_key(
+                          y, exog, forecaster.regressor, steps, initial_train_size,
+                          fixed_train_size, refit, self.metric_names,
+                          searched = sorted({k for params in ParameterGrid(param_grid) for k in params})
+                      )
+        self.done = self.store.get(self.search) if self.store is not None else {}
+        self.evaluator = _Evaluator(
+                             y                  = y.to_numpy(dtype=float),
+                             exog               = None if exog is None else exog.to_numpy(dtype=float),
+                             regressor          = forecaster.regressor,
+                             steps              = steps,
+                             initial_train_size = initial_train_size,
+                             fixed_train_size   = fixed_train_size,
+                             refit              = refit,
+                             metrics            = [metric_function(m) for m in metrics]
+                         )
+        self.n_jobs     = n_jobs or os.cpu_count() or 1
+        self.mp_context = mp_context
+        self.fits       = 0
+        self.evaluated  = 0
+        self._executor  = None
+        self._shared    = None
+
+
+    def key(self, i: int, test_size: Optional[int]=None) -> str:
+        lags, params = self.candidates[i]
+        # A backtest of the whole test period has the key of the grid search
+        if test_size is not None and test_size >= self.evaluator.test_size:
+            test_size = None
+
+        return _candidate_key(lags, params, test_size)
+
+
+    def _share_matrices(self) -> dict:
+        """
+        Build the matrix of every distinct `lags` of the candidates once and
+        put them in shared memory. Returns the layout for the workers.
+        """
+        matrices = {}
+        for lags, _ in self.candidates:
+            key = tuple(lags.tolist())
+            if key not in matrices:
+                X = self.evaluator.matrix(lags)
+                # Views of the series are free to build in every worker
+                if not np.shares_memory(X, self.evaluator.y):
+                    matrices[key] = X
+        self.evaluator._matrices.clear()
+        self._shared = _SharedMatrices(matrices)
+        layout = self._shared.layout()
+        self.evaluator._matrices.update(_attach_matrices(self._shared.shm, layout))
+
+        return layout
+
+
+    def evaluate(self, indices: List[int], test_size: Optional[int]=None) -> List[List[float]]:
+        """
+        Metrics of the candidates `indices`, evaluating those not in store.
+        """
+        keys = [self.key(i, test_size) for i in indices]
+        pending = [(i, key) for i, key in zip(indices, keys) if key not in self.done]
+        logger.info(
+            "Evaluating %d candidates%s: %d in store, %d to evaluate",
+            len(indices), "" if test_size is None else f" on the last {test_size} observations",
+            len(indices) - len(pending), len(pending)
+        )
+
+        def record(key, values, seconds, fits):
+            self.done[key] = values
+            self.fits += fits
+            self.evaluated += 1
+            if self.store is not None:
+                self.store.put(self.search, key, values, seconds)
+
+        if min(self.n_jobs, len(pending)) == 1:
+            for i, key in pending:
+                record(key, *self.evaluator.evaluate(*self.candidates[i], test_size))
+        elif pending:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                                     max_workers = min(self.n_jobs, len(pending)),
+                                     mp_context  = multiprocessing.get_context(self.mp_context),
+                                     initializer = _init_worker,
+                                     initargs    = (self.evaluator, self._share_matrices())
+                                 )
+            futures = {
+                self._executor.submit(_evaluate, *self.candidates[i], test_size): key
+                for i, key in pending
+            }
+            for future in as_completed(futures):
+                record(futures[future], *future.result())
+
+        return [self.done[key] for key in keys]
+
+
+    def table(self, indices: List[int], values: List[List[float]]) -> pd.DataFrame:
+        """
+        Results in the format of `grid_search_forecaster`, best first.
+        """
+        results = pd.DataFrame({
+                      'lags'  : [self.candidates[i][0] for i in indices],
+                      'params': [self.candidates[i][1] for i in indices],
+                      **{name: [v[j] for v in values] for j, name in enumerate(self.metric_names)}
+                  })
+        results = results.sort_values(by=self.metric_names[0], ascending=True)
+        results = pd.concat([results, results['params'].apply(pd.Series)], axis=1)
+
+        return results
+
+
+    def refit_best(self, forecaster, results: pd.DataFrame) -> None:
+
+        best_lags = results['lags'].iloc[0]
+        best_params = results['params'].iloc[0]
+        forecaster.set_lags(best_lags)
+        forecaster.set_params(best_params)
+        forecaster.fit(y=self.y, exog=self.exog)
+        logger.info(
+            "Forecaster refitted with lags %s and parameters %s (%s: %s)",
+            best_lags, best_params, self.metric_names[0],
+            results[self.metric_names[0]].iloc[0]
+        )
+
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+        if self._shared is not None:
+            # Views of the block must be released before it is closed
+            self.evaluator._matrices.clear()
+            self._shared.close()
+        if self.own_store:
+            self.store.close()
+
+
+def grid_search_parallel(
+    forecaster,
+    y: pd.Series,
+    param_grid: dict,
+    steps: int,
+    metric: Union[str, Callable, list],
+    initial_train_size: int,
+    fixed_train_size: bool=True,
+    exog: Optional[Union[pd.Series, pd.DataFrame]]=None,
+    lags_grid: Optional[list]=None,
+    refit: bool=False,
+    return_best: bool=True,
+    n_jobs: Optional[int]=None,
+    store: Optional[Union[str, SearchStore]]=None,
+    mp_context: str='spawn'
+) -> pd.DataFrame:
+    """
+    `grid_search_forecaster` with lag matrices built once per `lags`,
+    candidates evaluated in parallel and results kept in `store`.
+
+    Parameters
+    ----------
+    forecaster : ForecasterAutoreg
+        Forecaster whose regressor is searched. Only modified if
+        `return_best`.
+
+    y, param_grid, steps, metric, initial_train_size, fixed_train_size,
+    exog, lags_grid, refit, return_best
+        As in `grid_search_forecaster`.
+
+    n_jobs : int, default `None`
+        Worker processes. `None` uses `os.cpu_count()`; `1` evaluates in
+        this process.
+
+    store : str, SearchStore, default `None`
+        SQLite file, or store, of evaluated candidates. Candidates already
+        in it are not evaluated again.
+
+    mp_context : str, default `'spawn'`
+        Start method of the workers.
+
+    Returns
+    -------
+    results : pandas DataFrame
+        Lags, params and metrics of every candidate, best first, in the
+        format of `grid_search_forecaster`.
+
+    """
+    search = _Search(
+                 forecaster, y, param_grid, steps, metric, initial_train_size,
+                 fixed_train_size, exog, lags_grid, refit, n_jobs, store, mp_context
+             )
+    try:
+        indices = list(range(len(search.candidates)))
+        results = search.table(indices, search.evaluate(indices))
+    finally:
+        search.close()
+
+    if return_best:
+        search.refit_best(forecaster, results)
+
+    return results
+
+
+def successive_halving_search(
+    forecaster,
+    y: pd.Series,
+    param_grid: dict,
+    steps: int,
+    metric: Union[str, Callable, list],
+    initial_train_size: int,
+    fixed_train_size: bool=True,
+    exog: Optional[Union[pd.Series, pd.DataFrame]]=None,
+    lags_grid: Optional[list]=None,
+    refit: bool=False,
+    factor: int=3,
+    min_test_size: Optional[int]=None,
+    return_best: bool=True,
+    n_jobs: Optional[int]=None,
+    store: Optional[Union[str, SearchStore]]=None,
+    mp_context: str='spawn'
+) -> pd.DataFrame:
+    """
+    Successive halving over the candidates of `grid_search_parallel`.
+
+    Every candidate is first backtested on the most recent `min_test_size`
+    observations. The best `1 / factor` of them are backtested again on a
+    test period `factor` times longer, and so on until the survivors are
+    backtested on every observation after `initial_train_size`, as in the
+    exhaustive search.
+
+    Parameters
+    ----------
+    forecaster, y, param_grid, steps, metric, initial_train_size,
+    fixed_train_size, exog, lags_grid, refit, return_best, n_jobs, store,
+    mp_context
+        As in `grid_search_parallel`. Evaluations of the whole test period
+        share the store with the exhaustive search.
+
+    factor : int, default `3`
+        Fraction of candidates kept (`1 / factor`) and growth of the test
+        period between rounds.
+
+    min_test_size : int, default `None`
+        Test observations of the first round. By default the whole test
+        period divided by `factor` once per round after the first, and at
+        least `steps`.
+
+    Returns
+    -------
+    results : pandas DataFrame
+        Lags, params and metrics of the candidates of the last round,
+        backtested on the whole test period, best first, in the format of
+        `grid_search_forecaster`. `results.attrs` has `rounds` (every
+        evaluation with its `test_size`), `fits` and `seconds`.
+
+    """
+    if factor < 2:
+        raise ValueError("`factor` must be an integer greater than 1.")
+
+    start = time.perf_counter()
+    search = _Search(
+                 forecaster, y, param_grid, steps, metric, initial_train_size,
+                 fixed_train_size, exog, lags_grid, refit, n_jobs, store, mp_context
+             )
+    full = search.evaluator.test_size
+    n_candidates = len(search.candidates)
+    n_rounds = 1
+    while factor ** n_rounds < n_candidates:
+        n_rounds += 1
+
+    rounds = []
+    survivors = list(range(n_candidates))
+    try:
+        for r in range(n_rounds):
+            if r == n_rounds - 1:
+                test_size = full
+            elif min_test_size is not None:
+                test_size = min(min_test_size * factor ** r, full)
+            else:
+                test_size = min(max(full // factor ** (n_rounds - 1 - r), steps), full)
+            # Whole folds, the most recent ones
+            test_size = min(int(np.ceil(test_size / steps)) * steps, full)
+
+            values = search.evaluate(survivors, None if test_size == full else test_size)
+            rounds.append(pd.DataFrame({
+                'round'    : r,
+                'test_size': test_size,
+                'lags'     : [search.candidates[i][0] for i in survivors],
+                'params'   : [search.candidates[i][1] for i in survivors],
+                **{name: [v[j] for v in values] for j, name in enumerate(search.metric_names)}
+            }))
+            if test_size == full:
+                break
+            order = np.argsort([v[0] for v in values], kind='stable')
+            n_keep = max(int(np.ceil(len(survivors) / factor)), 1)
+            survivors = [survivors[k] for k in order[:n_keep]]
+    finally:
+        search.close()
+
+    results = search.table(survivors, values)
+    results.attrs['rounds'] = pd.concat(rounds, ignore_index=True)
+    results.attrs['fits'] = search.fits
+    results.attrs['seconds'] = time.perf_counter() - start
+    logger.info(
+        "Successive halving of %d candidates in %d rounds: %d fits, %.2f s",
+        n_candidates, len(rounds), search.fits, results.attrs['seconds']
+    )
+
+    if return_best:
+        search.refit_best(forecaster, results)
+
+    return results
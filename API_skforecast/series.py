@@ -0,0 +1,390 @@
+"""
+Server-side state of the series being forecast.
+
+Instead of sending the whole `last_window` on every call, clients append
+observations to a series (`/series/{series_id}/observe`) and ask for
+forecasts by id. `SeriesStore` keeps, for each resident series, the last
+`window_size` values in a row of a preallocated (max_resident, window_size)
+ring buffer, plus the date of the newest value. Memory is fixed by
+`max_resident`: when it is full, the least recently used series leaves
+memory and is reloaded from disk the next time it is used.
+
+Every observation is written to a SQLite file (WAL journal) keyed by
+`(series_id, ts)`, so the store survives restarts and evicted series can be
+rebuilt from their last `window_size` rows with an index lookup.
+
+Two locks are used: `_db_lock` serializes the SQLite connection (writes,
+and reads of evicted series) and `_lock` only guards the buffers, so reading
+a resident window never waits for a disk write.
+
+Observations must be aligned to the frequency of the series. A newer date
+advances the window, leaving `nan` for skipped periods (forecasts fail until
+they are filled); an older date inside the window corrects its value.
+"""
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+
+_EMPTY = np.iinfo(np.int64).min
+
+
+class SeriesStore:
+    """
+    Bounded in-memory ring buffers of many series, persisted to SQLite.
+
+    Parameters
+    ----------
+    path : str, default `'series.db'`
+        SQLite file. Created if it does not exist.
+
+    window_size : int, default `16`
+        Values kept in memory per series. Must be at least the
+        `window_size` of the forecaster.
+
+    freq : str, default `'MS'`
+        Frequency of the series.
+
+    max_resident : int, default `100000`
+        Series kept in memory. Memory used by the buffers is about
+        `max_resident * (window_size + 3) * 8` bytes.
+
+    """
+
+    def __init__(
+        self,
+        path: str='series.db',
+        window_size: int=16,
+        freq: str='MS',
+        max_resident: int=100_000
+    ) -> None:
+
+        self.path         = path
+        self.window_size  = window_size
+        self.freq         = freq
+        self.max_resident = max_resident
+        self.loads        = 0
+        self.evictions    = 0
+        self.writes       = 0
+        self._offset      = to_offset(freq)
+        self._values      = np.full((max_resident, window_size), np.nan)
+        self._heads       = np.zeros(max_resident, dtype=np.int64)
+        self._counts      = np.zeros(max_resident, dtype=np.int64)
+        self._ends        = np.full(max_resident, _EMPTY, dtype=np.int64)
+        self._slots       = OrderedDict()
+        self._free        = list(range(max_resident - 1, -1, -1))
+        self._lock        = threading.Lock()
+        self._db_lock     = threading.Lock()
+
+        self._con = sqlite3.connect(path, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("PRAGMA synchronous=NORMAL")
+        # The primary key is the (series_id, ts) index used to rebuild a window
+        self._con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS observations (
+                series_id TEXT NOT NULL,
+                ts INTEGER NOT NULL,
+                value REAL,
+                PRIMARY KEY (series_id, ts)
+            ) WITHOUT ROWID
+            """
+        )
+        self._con.commit()
+
+
+    @property
+    def resident(self) -> int:
+        """
+        Number of series whose window is held in memory.
+        """
+        return len(self._slots)
+
+
+    @property
+    def memory_bytes(self) -> int:
+        return (self._values.nbytes + self._heads.nbytes
+                + self._counts.nbytes + self._ends.nbytes)
+
+
+    def _timestamp(self, ts) -> pd.Timestamp:
+
+        try:
+            ts = pd.Timestamp(ts)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid observation date {ts!r}.") from None
+        if ts is pd.NaT or ts.tz is not None:
+            raise ValueError(f"Invalid observation date {ts!r}.")
+        if not self._offset.is_on_offset(ts):
+            raise ValueError(
+                f"Observation date {ts} is not aligned to frequency '{self.freq}'."
+            )
+
+        return ts
+
+
+    def _periods(self, start: pd.Timestamp, end: pd.Timestamp) -> int:
+        """
+        Number of periods from `start` to `end`, with `start <= end`.
+        """
+        return len(pd.date_range(start, end, freq=self._offset)) - 1
+
+
+    def _apply(self, slot: int, ts: pd.Timestamp, value: float) -> None:
+        """
+        Write one observation in the ring buffer of `slot`.
+        """
+        w = self.window_size
+        head = self._heads[slot]
+        if self._counts[slot] == 0:
+            self._values[slot, head] = value
+            self._heads[slot] = (head + 1) % w
+            self._counts[slot] = 1
+            self._ends[slot] = ts.value
+            return
+
+        end = pd.Timestamp(self._ends[slot])
+        if ts <= end:
+            # Correction of a value still in the window
+            k = self._periods(ts, end)
+            if k < min(self._counts[slot], w):
+                self._values[slot, (head - 1 - k) % w] = value
+            return
+
+        k = self._periods(end, ts)
+        # Skipped periods are missing values
+        for _ in range(min(k - 1, w)):
+            self._values[slot, head] = np.nan
+            head = (head + 1) % w
+        self._values[slot, head] = value
+        self._heads[slot] = (head + 1) % w
+        self._counts[slot] += k
+        self._ends[slot] = ts.value
+
+
+    def _resident_slot(self, series_id: str) -> Optional[int]:
+        """
+        Slot of a resident series, `None` if it is not in memory. Must be
+        called with `_lock` held.
+        """
+        slot = self._slots.get(series_id)
+        if slot is not None:
+            self._slots.move_to_end(series_id)
+
+        return slot
+
+
+    def _read_rows(self, series_id: str) -> List[Tuple[int, Optional[float]]]:
+        """
+        Last `window_size` stored observations of a series, newest first. Must
+        be called with `_db_lock` held.
+        """
+        return self._con.execute(
+                   """
+                   SELECT ts, value FROM observations
+                   WHERE series_id = ? ORDER BY ts DESC LIMIT ?
+                   """,
+                   (series_id, self.window_size)
+               ).fetchall()
+
+
+    def _slot(
+        self,
+        series_id: str,
+        rows: List[Tuple[int, Optional[float]]],
+        create: bool
+    ) -> Optional[int]:
+        """
+        Slot of a series, filled from `rows` (see `_read_rows`) if it is not
+        resident. Must be called with both locks held.
+        """
+        slot = self._resident_slot(series_id)
+        if slot is not None:
+            return slot
+        if not rows and not create:
+            return None
+
+        if not self._free:
+            _, free = self._slots.popitem(last=False)
+            self._free.append(free)
+            self.evictions += 1
+        slot = self._free.pop()
+        self._values[slot] = np.nan
+        self._heads[slot] = 0
+        self._counts[slot] = 0
+        self._ends[slot] = _EMPTY
+        for ts, value in reversed(rows):
+            self._apply(slot, pd.Timestamp(ts), np.nan if value is None else value)
+        self._slots[series_id] = slot
+        if rows:
+            self.loads += 1
+
+        return slot
+
+
+    def observe(
+        self,
+        series_id: str,
+        observations: Iterable[Tuple[object, Optional[float]]]
+    ) -> dict:
+        """
+        Append `(ts, value)` observations to a series, creating it if needed.
+
+        Returns
+        -------
+        state : dict
+            Same as `state(series_id)` after the update.
+
+        """
+        # Stable sort: with repeated dates the last observation wins
+        parsed = sorted(
+                     ((self._timestamp(ts), np.nan if value is None else float(value))
+                      for ts, value in observations),
+                     key = lambda item: item[0]
+                 )
+        if not parsed:
+            raise ValueError("No observations given.")
+
+        # Writers are serialized by `_db_lock`, so the buffer is updated in
+        # the same order as the file. Slots are only filled or evicted with
+        # `_db_lock` held, so the rows read here are still current.
+        with self._db_lock:
+            with self._lock:
+                resident = self._resident_slot(series_id) is not None
+            rows = [] if resident else self._read_rows(series_id)
+            self._con.executemany(
+                "INSERT OR REPLACE INTO observations (series_id, ts, value) VALUES (?, ?, ?)",
+                [(series_id, ts.value, None if np.isnan(value) else value)
+                 for ts, value in parsed]
+            )
+            self._con.commit()
+            with self._lock:
+                slot = self._slot(series_id, rows, create=True)
+                for ts, value in parsed:
+                    self._apply(slot, ts, value)
+                self.writes += len(parsed)
+
+                return self._state(series_id, slot)
+
+
+    def _read(self, series_id: str, func):
+        """
+        `func(slot)` of a series, loading it from disk if it is not resident.
+        Raises `KeyError` if the series has no observations.
+        """
+        with self._lock:
+            slot = self._resident_slot(series_id)
+            if slot is not None:
+                return func(slot)
+
+        with self._db_lock:
+            rows = self._read_rows(series_id)
+            with self._lock:
+                slot = self._slot(series_id, rows, create=False)
+                if slot is None:
+                    raise KeyError(f"Unknown series '{series_id}'.")
+
+                return func(slot)
+
+
+    def _window(self, slot: int) -> Tuple[np.ndarray, pd.Timestamp]:
+
+        w = self.window_size
+        n = int(min(self._counts[slot], w))
+        positions = (self._heads[slot] - n + np.arange(n)) % w
+
+        return self._values[slot, positions].copy(), pd.Timestamp(self._ends[slot])
+
+
+    def window(self, series_id: str) -> Tuple[np.ndarray, pd.Timestamp]:
+        """
+        Last values of a series, oldest first, and the date of the newest.
+        Raises `KeyError` if the series has no observations.
+        """
+        return self._read(series_id, self._window)
+
+
+    def resident_window(self, series_id: str) -> Optional[Tuple[np.ndarray, pd.Timestamp]]:
+        """
+        Same as `window` for a resident series, `None` if it is not in memory.
+        Never touches the SQLite file, so it can be called from the event
+        loop.
+        """
+        with self._lock:
+            slot = self._resident_slot(series_id)
+            if slot is None:
+                return None
+
+            return self._window(slot)
+
+
+    def history(self, series_id: str) -> pd.Series:
+        """
+        Every stored observation of a series, with frequency `freq` (`nan`
+        for missing periods). Raises `KeyError` if there are none.
+        """
+        with self._db_lock:
+            rows = self._con.execute(
+                       "SELECT ts, value FROM observations WHERE series_id = ? ORDER BY ts",
+                       (series_id,)
+                   ).fetchall()
+        if not rows:
+            raise KeyError(f"Unknown series '{series_id}'.")
+
+        ts, values = zip(*rows)
+        y = pd.Series(
+                np.array(values, dtype=float),
+                index = pd.DatetimeIndex(np.array(ts, dtype='datetime64[ns]')),
+                name  = 'y'
+            )
+
+        return y.asfreq(self.freq)
+
+
+    def is_resident(self, series_id: str) -> bool:
+        return series_id in self._slots
+
+
+    def _state(self, series_id: str, slot: int) -> dict:
+        return {
+            "series_id": series_id,
+            "end": pd.Timestamp(self._ends[slot]).isoformat(),
+            "n_buffered": int(min(self._counts[slot], self.window_size)),
+        }
+
+
+    def state(self, series_id: str) -> dict:
+        return self._read(series_id, lambda slot: self._state(series_id, slot))
+
+
+    def series_ids(self, limit: int=1000) -> List[str]:
+        with self._db_lock:
+            rows = self._con.execute(
+                       "SELECT DISTINCT series_id FROM observations ORDER BY series_id LIMIT ?",
+                       (limit,)
+                   ).fetchall()
+
+        return [row[0] for row in rows]
+
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "freq": self.freq,
+            "window_size": self.window_size,
+            "resident": self.resident,
+            "max_resident": self.max_resident,
+            "memory_bytes": self.memory_bytes,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "writes": self.writes,
+        }
+
+
+    def close(self) -> None:
+        with self._db_lock:
+            self._con.close()
@@ -0,0 +1,117 @@
+"""
+Boot timings of the service.
+
+On scale-to-zero deployments the first request waits for the whole boot:
+interpreter, imports, the startup hook (model and exog loading, warm-up
+prediction) and only then the request itself. `StartupReport` records the
+import time of `main` and the duration of every startup phase, logs them
+once the service is ready and keeps them for `/startup`.
+
+    report = StartupReport(import_seconds=...)
+    report.start()
+    with report.phase('load_model'):
+        ...
+    report.ready()
+
+Phases may run concurrently (the model and the exog snapshot are loaded in
+parallel), so their sum can exceed `startup_seconds`.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def process_age() -> Optional[float]:
+    """
+    Seconds since the process started, read from `/proc` on Linux. `None`
+    elsewhere.
+    """
+    try:
+        with open('/proc/self/stat') as f:
+            # The command name can contain spaces, fields start after it
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        start_ticks = int(fields[19])
+    except (OSError, ValueError, IndexError):
+        return None
+
+    return uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+
+
+class StartupReport:
+    """
+    Import time and startup phase durations of the service.
+
+    Parameters
+    ----------
+    import_seconds : float, default `None`
+        Seconds spent importing `main` and its dependencies.
+
+    """
+
+    def __init__(self, import_seconds: Optional[float]=None) -> None:
+
+        self.import_seconds  = import_seconds
+        self.phases          = {}
+        self.errors          = {}
+        self.startup_seconds = None
+        self.process_seconds = None
+        self._started        = None
+
+
+    def start(self) -> None:
+        """
+        Mark the beginning of the startup hook.
+        """
+        self._started = time.perf_counter()
+
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Time a startup phase. Its duration is recorded even if it fails, and
+        so is the error.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.errors[name] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            self.phases[name] = seconds
+            metrics.observe(f'startup_{name}', seconds)
+
+
+    def ready(self) -> None:
+        """
+        Mark the service as ready to serve and log the timings.
+        """
+        self.startup_seconds = time.perf_counter() - self._started
+        self.process_seconds = process_age()
+        phases = ', '.join(f"{name} {seconds:.3f} s" for name, seconds in self.phases.items())
+        logger.info(
+            "Ready in %s (import %s, startup %.3f s: %s)",
+            'n/a' if self.process_seconds is None else f"{self.process_seconds:.3f} s",
+            'n/a' if self.import_seconds is None else f"{self.import_seconds:.3f} s",
+            self.startup_seconds,
+            phases or 'no phases'
+        )
+
+
+    def info(self) -> Dict[str, object]:
+        return {
+            "process_seconds": self.process_seconds,
+            "import_seconds": self.import_seconds,
+            "startup_seconds": self.startup_seconds,
+            "phases": dict(self.phases),
+            "errors": dict(self.errors),
+        }